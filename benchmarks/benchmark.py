@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmarks the whole pipeline (config -> Scanner -> Manager.WriteEntries) on
+# synthetic /boot trees. Every size gets its own directory with:
+#
+#     root/boot/kernels/<version>/{vmlinuz, initrd}
+#     root/etc/bliss-boot/config.py    (a 'kernels' entry for every version)
+#     root/etc/fstab                   (/boot by UUID=)
+#     mountinfo                        (a fake /proc/self/mountinfo without /boot)
+#     bin/blkid                        (a stub that prints canned output and counts its calls)
+#     sys/class/block, udev/data       (a fake sysfs and udev database with a GPT disk)
+#
+# Every run happens in a fresh interpreter so that the peak RSS belongs to that
+# run alone. For each size and bootloader this reports the wall time, the
+# processes spawned, the time and read/write syscalls (from /proc/self/io) of each
+# phase and the peak RSS. It also checks the startup budget of --help (no forks,
+# under 50ms).
+#
+#     python3 benchmarks/benchmark.py --sizes 10,1000,10000 --output results.json
+#
+# The results are written as JSON so that they can be compared between commits.
+
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# subprocess is only imported where it is used, so that the --help check can see
+# whether bliss-boot imports it.
+
+# Lets the benchmark run from anywhere
+sourceDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, sourceDirectory)
+
+class Benchmark(object):
+    _sizes = (10, 1000, 10000)
+    _bootloaders = ("grub2", "extlinux")
+
+    _bootUuid = "2bd4ad2d-bd34-4c40-9a4a-1e6e1d7cbc4b"
+
+    # --help has to return this fast (in seconds, including the interpreter startup)
+    _startupBudget = 0.05
+
+    # The phases that are timed
+    _phases = (
+        ("libs.Scanner", "Scanner", "ScanFstab"),
+        ("libs.Scanner", "Scanner", "MapIdentifierToDrive"),
+        ("libs.Scanner", "Scanner", "DetectDriveLayout"),
+        ("libs.Scanner", "Scanner", "FindBootKernels"),
+        ("libs.Scanner", "Scanner", "FindKernelsInConfig"),
+        ("libs.Scanner", "Scanner", "FindCommonKernels"),
+        ("libs.Manager", "Manager", "WriteEntries"),
+    )
+
+    _blkidStub = """#!/bin/sh
+echo blkid >> "$(dirname "$0")/../blkid.calls"
+
+printf 'DEVNAME=/dev/vda1\\nPARTUUID=0b5c4e4e-01\\nTYPE=vfat\\n\\n'
+printf 'DEVNAME=/dev/vda2\\nUUID=%s\\nPARTUUID=0b5c4e4e-02\\nTYPE=ext4\\n\\n'
+printf 'DEVNAME=/dev/vda3\\nUUID=5d2e3c1a-0000-4000-8000-000000000003\\nTYPE=ext4\\n'
+"""
+
+    # Creates the synthetic tree for this many kernels
+    @classmethod
+    def CreateTree(cls, vDirectory, vSize):
+        root = os.path.join(vDirectory, "root")
+        kernels = os.path.join(root, "boot", "kernels")
+        versions = ["%d.%d.%d-bench" % (4 + i // 1000, (i // 10) % 100, i % 10) for i in range(vSize)]
+
+        os.makedirs(kernels)
+        os.makedirs(os.path.join(root, "etc", "bliss-boot"))
+        os.makedirs(os.path.join(vDirectory, "bin"))
+
+        for version in versions:
+            os.mkdir(os.path.join(kernels, version))
+
+            for name in ("vmlinuz", "initrd"):
+                with open(os.path.join(kernels, version, name), "wb") as dossier:
+                    dossier.write(b"\0" * 64)
+
+        with open(os.path.join(root, "etc", "bliss-boot", "config.py"), "w") as dossier:
+            dossier.write("kernels = (\n")
+
+            for i in range(len(versions)):
+                default = 1 if i == len(versions) - 1 else 0
+                dossier.write("    ('Bench', '" + versions[i] + "', " + str(default) + ", 'vmlinuz', 'initrd', 'root=/dev/vda3 quiet'),\n")
+
+            dossier.write(")\n")
+            dossier.write("kernelDirectory = '/boot/kernels'\nbootloader = 'grub2'\n")
+
+        with open(os.path.join(root, "etc", "fstab"), "w") as dossier:
+            dossier.write("UUID=5d2e3c1a-0000-4000-8000-000000000003 / ext4 defaults 0 1\n")
+            dossier.write("UUID=" + cls._bootUuid + " /boot ext4 noauto 0 2\n")
+            dossier.write("tmpfs /tmp tmpfs defaults 0 0\n")
+
+        # The running system, /boot isn't mounted so the fstab is used
+        with open(os.path.join(vDirectory, "mountinfo"), "w") as dossier:
+            dossier.write("22 1 252:3 / / rw,relatime shared:1 - ext4 /dev/vda3 rw\n")
+
+            for i in range(50):
+                dossier.write(str(30 + i) + " 22 0:" + str(40 + i) + " / /run/bench/" + str(i) + " rw shared:" + str(2 + i) + " - tmpfs tmpfs rw\n")
+
+        blkid = os.path.join(vDirectory, "bin", "blkid")
+
+        with open(blkid, "w") as dossier:
+            dossier.write(cls._blkidStub.replace("%s", cls._bootUuid))
+
+        os.chmod(blkid, 0o755)
+
+        # The disk and its partitions, like the kernel lays them out
+        disk = os.path.join(vDirectory, "sys", "devices", "virtio0", "block", "vda")
+        classBlock = os.path.join(vDirectory, "sys", "class", "block")
+
+        os.makedirs(classBlock)
+        os.makedirs(os.path.join(vDirectory, "udev", "data"))
+
+        for name, attribute, value in (("vda", "dev", "252:0"), ("vda1", "partition", "1"), ("vda2", "partition", "2"), ("vda3", "partition", "3")):
+            directory = disk if name == "vda" else os.path.join(disk, name)
+            os.makedirs(directory, exist_ok=True)
+
+            with open(os.path.join(directory, attribute), "w") as dossier:
+                dossier.write(value + "\n")
+
+            os.symlink(directory, os.path.join(classBlock, name))
+
+        with open(os.path.join(vDirectory, "udev", "data", "b252:0"), "w") as dossier:
+            dossier.write("E:ID_PART_TABLE_TYPE=gpt\n")
+
+    # Returns the read/write syscall counters of this process
+    @classmethod
+    def GetIoCounters(cls):
+        counters = {"syscr": 0, "syscw": 0}
+
+        try:
+            with open("/proc/self/io", "r") as io:
+                for line in io:
+                    key, value = line.split(":", 1)
+
+                    if key in counters:
+                        counters[key] = int(value)
+        except OSError:
+            pass
+
+        return counters
+
+    # Runs the pipeline once in this process and prints the measurements as JSON
+    @classmethod
+    def RunCase(cls, vDirectory, vBootloader):
+        import importlib
+        import resource
+        import subprocess
+
+        os.environ["PATH"] = os.path.join(vDirectory, "bin") + os.pathsep + os.environ.get("PATH", "")
+        os.environ["BLISS_BOOT_CACHE"] = os.path.join(vDirectory, "cache")
+
+        # Count every process that is started
+        spawned = [0]
+        popenInit = subprocess.Popen.__init__
+
+        def CountingInit(self, *args, **kwargs):
+            spawned[0] = spawned[0] + 1
+            popenInit(self, *args, **kwargs)
+
+        subprocess.Popen.__init__ = CountingInit
+
+        from libs.Output import Output
+        from libs.Devices import Devices
+        from libs.Fstab import Fstab
+        from libs.Generator import Generator
+        from libs.Topology import Topology
+
+        import libs.ConfigLoader as ConfigLoader
+
+        Output.SetLevel(Output.QUIET)
+
+        phases = {}
+
+        def Timed(vName, vFunction):
+            def Run(*args, **kwargs):
+                before = cls.GetIoCounters()
+                processes = spawned[0]
+                start = time.perf_counter()
+
+                try:
+                    return vFunction(*args, **kwargs)
+                finally:
+                    after = cls.GetIoCounters()
+                    phase = phases.setdefault(vName, {"seconds": 0.0, "calls": 0, "syscr": 0, "syscw": 0, "processes": 0})
+                    phase["seconds"] = phase["seconds"] + time.perf_counter() - start
+                    phase["calls"] = phase["calls"] + 1
+                    phase["syscr"] = phase["syscr"] + after["syscr"] - before["syscr"]
+                    phase["syscw"] = phase["syscw"] + after["syscw"] - before["syscw"]
+                    phase["processes"] = phase["processes"] + spawned[0] - processes
+
+            return Run
+
+        for module, owner, name in cls._phases:
+            owner = getattr(importlib.import_module(module), owner)
+
+            # Class methods are replaced with a plain function that calls the bound original
+            setattr(owner, name, Timed(name, getattr(owner, name)))
+
+        root = os.path.join(vDirectory, "root")
+        output = os.path.join(vDirectory, "out", vBootloader + ".cfg")
+
+        start = time.perf_counter()
+
+        config = Timed("LoadConfig", ConfigLoader.LoadConfig)(os.path.join(root, "etc", "bliss-boot", "config.py"))
+        config.bootloader = vBootloader
+
+        # Nothing from the real system: the devices come from the blkid stub
+        devices = Devices(os.path.join(vDirectory, "dev", "disk"), os.path.join(vDirectory, "sys", "class", "block"))
+        fstab = Fstab(os.path.join(root, "etc", "fstab"), os.path.join(vDirectory, "mountinfo"))
+        topology = Topology(os.path.join(vDirectory, "sys", "class", "block"), os.path.join(vDirectory, "udev", "data"), os.path.join(vDirectory, "dev"))
+
+        result = Generator(config, root, devices, fstab, vTopology=topology).Write(output, 1)
+
+        seconds = time.perf_counter() - start
+
+        for phase in phases.values():
+            phase["seconds"] = round(phase["seconds"], 6)
+
+        try:
+            with open(os.path.join(vDirectory, "blkid.calls"), "r") as calls:
+                blkidCalls = len(calls.readlines())
+
+            os.unlink(os.path.join(vDirectory, "blkid.calls"))
+        except OSError:
+            blkidCalls = 0
+
+        print(json.dumps({
+            "seconds": round(seconds, 6),
+            "entries": len(result.kernels),
+            "processes": spawned[0],
+            "blkidCalls": blkidCalls,
+            "bytesWritten": os.path.getsize(output),
+            "peakRssKiB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "phases": phases,
+        }))
+
+    # Runs --help in this process and prints how many processes it started and
+    # whether the modules that start processes were even imported
+    @classmethod
+    def RunHelp(cls):
+        import runpy
+
+        forks = [0]
+
+        def Counting(vFunction):
+            def Run(*args, **kwargs):
+                forks[0] = forks[0] + 1
+                return vFunction(*args, **kwargs)
+
+            return Run
+
+        for name in ("fork", "forkpty", "posix_spawn", "posix_spawnp", "system", "popen"):
+            if hasattr(os, name):
+                setattr(os, name, Counting(getattr(os, name)))
+
+        sys.argv = [os.path.join(sourceDirectory, "bliss-boot"), "--help"]
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+        except SystemExit:
+            pass
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        print(json.dumps({
+            "forks": forks[0],
+            "imported": sorted(name for name in ("subprocess", "ctypes", "libs.Scanner", "libs.Generator") if name in sys.modules),
+        }))
+
+    # Runs this script again in a fresh interpreter and returns its JSON output
+    @classmethod
+    def RunChild(cls, vArguments):
+        import subprocess
+
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__)] + vArguments, universal_newlines=True)
+        return json.loads(output.strip().splitlines()[-1])
+
+    # Checks the --help startup budget
+    @classmethod
+    def CheckStartup(cls, vRepeat):
+        import subprocess
+
+        times = []
+
+        for i in range(max(vRepeat, 5)):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, os.path.join(sourceDirectory, "bliss-boot"), "--help"], stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+
+        result = cls.RunChild(["--run-help"])
+        result["medianSeconds"] = round(statistics.median(times), 6)
+        result["budgetSeconds"] = cls._startupBudget
+        result["ok"] = result["forks"] == 0 and not result["imported"] and result["medianSeconds"] <= cls._startupBudget
+
+        return result
+
+    # Runs all the cases and returns the results
+    @classmethod
+    def Run(cls, vSizes, vBootloaders, vRepeat, vKeep):
+        results = {"python": sys.version.split()[0], "cases": [], "startup": cls.CheckStartup(vRepeat)}
+
+        print("--help: %.1fms (budget %.0fms), %d forks" % (results["startup"]["medianSeconds"] * 1000,
+            cls._startupBudget * 1000, results["startup"]["forks"]), file=sys.stderr)
+
+        for size in vSizes:
+            directory = tempfile.mkdtemp(prefix="bliss-boot-benchmark-" + str(size) + "-")
+
+            try:
+                start = time.perf_counter()
+                cls.CreateTree(directory, size)
+                print("Created %d kernels in %.2fs (%s)" % (size, time.perf_counter() - start, directory), file=sys.stderr)
+
+                for bootloader in vBootloaders:
+                    runs = [cls.RunChild(["--run-case", directory, bootloader]) for i in range(vRepeat)]
+
+                    # The fastest run is the one with the least noise
+                    best = min(runs, key=lambda run: run["seconds"])
+                    best["size"] = size
+                    best["bootloader"] = bootloader
+                    best["runs"] = [run["seconds"] for run in runs]
+
+                    results["cases"].append(best)
+
+                    print("%-8s %6d kernels: %8.4fs, %d processes, %d KiB peak RSS" % (bootloader, size, best["seconds"],
+                        best["processes"], best["peakRssKiB"]), file=sys.stderr)
+            finally:
+                if vKeep:
+                    print("Kept " + directory, file=sys.stderr)
+                else:
+                    shutil.rmtree(directory)
+
+        return results
+
+    # Prints the usage information
+    @classmethod
+    def PrintUsage(cls):
+        print("Usage: benchmark.py [--sizes 10,1000,10000] [--bootloaders grub2,extlinux] [--repeat 3] [--output results.json] [--keep] [--check]\n")
+        print("--check\t\tExits with 1 if the --help startup budget isn't met.")
+        print("--keep\t\tKeeps the generated trees.")
+
+    @classmethod
+    def Main(cls, vArguments):
+        if vArguments[:1] == ["--run-case"]:
+            cls.RunCase(vArguments[1], vArguments[2])
+            return 0
+
+        if vArguments[:1] == ["--run-help"]:
+            cls.RunHelp()
+            return 0
+
+        sizes = cls._sizes
+        bootloaders = cls._bootloaders
+        repeat = 3
+        outputFile = ""
+        keep = 0
+        check = 0
+
+        i = 0
+
+        while i < len(vArguments):
+            argument = vArguments[i]
+
+            if argument in ("--sizes", "--bootloaders", "--repeat", "--output") and i + 1 < len(vArguments):
+                value = vArguments[i + 1]
+                i = i + 1
+
+                if argument == "--sizes":
+                    sizes = [int(size) for size in value.split(",")]
+                elif argument == "--bootloaders":
+                    bootloaders = value.split(",")
+                elif argument == "--repeat":
+                    repeat = max(1, int(value))
+                else:
+                    outputFile = value
+            elif argument == "--keep":
+                keep = 1
+            elif argument == "--check":
+                check = 1
+            else:
+                cls.PrintUsage()
+                return 2
+
+            i = i + 1
+
+        results = cls.Run(sizes, bootloaders, repeat, keep)
+        text = json.dumps(results, indent=4, sort_keys=True) + "\n"
+
+        if outputFile:
+            with open(outputFile, "w") as dossier:
+                dossier.write(text)
+        else:
+            sys.stdout.write(text)
+
+        if check and not results["startup"]["ok"]:
+            print("The --help startup budget wasn't met!", file=sys.stderr)
+            return 1
+
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Benchmark.Main(sys.argv[1:]))
@@ -23,12 +23,43 @@ kernels = (
 )
 
 
+# ---------- Kernel Discovery Rules ----------
+# Instead of adding every kernel to 'kernels', the kernel directories can be
+# picked up by rules. A rule matches the directory names with a glob ('match')
+# or a regular expression ('regex'), and builds the entry from templates for
+# the 'label', 'kernel', 'initrd' and 'options'. The templates can use
+# {version} (the directory name) and the named groups of the regex.
+#
+# 'keep' only adds the newest N kernels of the rule (0 = all of them) and
+# 'default': "newest" makes the newest one the default kernel if no other
+# kernel is. Kernels in the 'kernels' list always win over the rules.
+# Example:
+#          {"regex": r"^(?P<major>\d+)\.(?P<minor>\d+)\.\d+-gentoo$", "label": "Gentoo {major}.{minor}",
+#           "kernel": "vmlinuz", "initrd": "initrd", "options": "root=/dev/sda1 quiet", "keep": 3, "default": "newest"},
+
+rules = (
+)
+
+# Order of the entries: "name" (sorted by directory name, like 'ls') or
+# "newest" (natural version order, newest first: 5.10.1 before 5.4.10)
+kernelOrder = "name"
+
+# Checks that the devices on the command lines exist (root=, resume=, cryptdevice=,
+# rd.luks.uuid= and the pool of root=ZFS=<dataset>) before anything is written:
+# "warn" (only report them), "refuse" (write nothing) or "off". Checking needs the
+# device index (and blkid if udev has no symlinks for an identifier), which extlinux
+# and bls runs otherwise don't read at all, so it is off unless you turn it on.
+validateDevices = "off"
+
+
 #---------- General Configuration ----------
 
 # Kernel Path
 kernelDirectory = "/boot/kernels"
 
-# Bootloader Type: Supported: [grub2, extlinux]
+# Bootloader Type: Supported: [grub2, extlinux, bls]
+# "bls" writes one loader/entries/<label>-<version>.conf file per kernel (systemd-boot).
+# The output (-o) is then the directory that holds "loader" (usually the ESP).
 bootloader = "grub2"
 
 # Is an initrd being used?
@@ -40,6 +71,15 @@ timeout = 3
 # If using 'whole disk zfs', dataset where your /boot directory is in
 wholeDiskZfsBootPool = "tank/gentoo/root"
 
+# Mirrored boot disks: the configuration is rendered once and written to every
+# output here (in parallel) when -o isn't passed. 'drive' is the partition that
+# copy boots from (fstab style, UUID= works too); the /boot drive is used if
+# it is left out. Example:
+#          {"output": "/boot/efi-a/EFI/gentoo/grub.cfg", "drive": "/dev/sda1"},
+#          {"output": "/boot/efi-b/EFI/gentoo/grub.cfg", "drive": "/dev/sdb1"},
+mirrors = (
+)
+
 
 #---------- GRUB 2 settings ----------
 
@@ -61,6 +101,22 @@ goodyBag = [
     #"mdraid1x",
 ]
 
+# Finds /boot by the UUID of its filesystem (search --fs-uuid) instead of only
+# setting root to (hdN,...), which breaks when the firmware orders the disks
+# differently. The drive that was detected is passed as a hint, so GRUB finds it
+# on the first try instead of probing every disk.
+grub2Search = 0
+
+# Compact mode: the kernel path and the options that entries share are defined
+# once, every entry calls the same function and the modules above are only loaded
+# when an entry is booted. This makes grub.cfg a lot smaller with many kernels.
+grub2Compact = 0
+
+# Compact mode: only the first N entries are in the main menu, the rest go into
+# an "Older kernels" submenu that GRUB only reads when it is opened (0 = no submenu).
+# Use it with kernelOrder = "newest".
+grub2MainEntries = 0
+
 
 #---------- extlinux settings ----------
 extlinuxUi = "menu.c32"
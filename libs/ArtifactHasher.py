@@ -0,0 +1,162 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import marshal
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import libs.Variables as var
+
+from libs.Errors import BlissBootError
+from libs.FileWriter import FileWriter
+
+# Computes the SHA-256 of the kernels and initrds. The digests are kept in a
+# persistent cache keyed by (device, inode, size, mtime_ns), so a file is only
+# read again once it changed. The files are streamed in large chunks on a thread
+# pool (hashlib releases the GIL while hashing, so the threads really overlap).
+class ArtifactHasher(object):
+    # How much of a file is read at once
+    _chunkSize = 1 << 20
+
+    # Cache entries that weren't used for this long (in seconds) are dropped
+    _maxAge = 90 * 24 * 60 * 60
+
+    def __init__(self, vCachePath=""):
+        self.cachePath = vCachePath or os.path.join(var.cacheDirectory, "artifacts.sha256")
+
+        # (dev, inode, size, mtime_ns) -> [digest, last time it was used]
+        self._cache = None
+        self._isDirty = 0
+
+        # Statistics of the last Hash call
+        self.hashed = 0
+        self.cached = 0
+        self.bytesHashed = 0
+
+    # Returns the cache key for this stat result
+    @classmethod
+    def GetKey(cls, vStat):
+        return (vStat.st_dev, vStat.st_ino, vStat.st_size, vStat.st_mtime_ns)
+
+    # Loads the cache from the disk (once)
+    def LoadCache(self):
+        if self._cache is not None:
+            return
+
+        try:
+            with open(self.cachePath, "rb") as dossier:
+                self._cache = marshal.load(dossier)
+        except (OSError, EOFError, ValueError, TypeError):
+            self._cache = {}
+
+        if not isinstance(self._cache, dict):
+            self._cache = {}
+
+    # Writes the cache back if anything was added. Not being able to (for example
+    # when we aren't root) only means the files are hashed again next time.
+    def SaveCache(self):
+        if not self._isDirty:
+            return
+
+        oldest = int(time.time()) - self._maxAge
+
+        for key in [key for key, entry in self._cache.items() if entry[1] < oldest]:
+            del self._cache[key]
+
+        try:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            FileWriter.Write(self.cachePath, marshal.dumps(self._cache))
+        except (OSError, ValueError):
+            pass
+
+        self._isDirty = 0
+
+    # Hashes a file. vStat is what the file looked like when it was scanned, the
+    # file must still be the same (and stay the same while it is read).
+    def HashFile(self, vPath, vStat):
+        digest = hashlib.sha256()
+        buffer = bytearray(self._chunkSize)
+        view = memoryview(buffer)
+
+        with open(vPath, "rb", buffering=0) as dossier:
+            before = os.fstat(dossier.fileno())
+
+            if self.GetKey(before) != self.GetKey(vStat):
+                raise BlissBootError(vPath + " changed after it was scanned. Please run the program again.")
+
+            while True:
+                size = dossier.readinto(buffer)
+
+                if not size:
+                    break
+
+                digest.update(view[:size])
+
+            if self.GetKey(os.fstat(dossier.fileno())) != self.GetKey(before):
+                raise BlissBootError(vPath + " changed while it was being verified. Please run the program again.")
+
+        return digest.hexdigest()
+
+    # Returns the SHA-256 of every file: [(path, os.stat_result)] -> { path: digest }
+    def Hash(self, vArtifacts):
+        self.LoadCache()
+
+        now = int(time.time())
+        digests = {}
+
+        # Key -> paths that still need to be hashed (a file can be used by more than one entry)
+        pending = {}
+
+        self.hashed = 0
+        self.cached = 0
+        self.bytesHashed = 0
+
+        for path, info in vArtifacts:
+            key = self.GetKey(info)
+            entry = self._cache.get(key)
+
+            if entry:
+                entry[1] = now
+                digests[path] = entry[0]
+                self.cached = self.cached + 1
+            else:
+                pending.setdefault(key, []).append((path, info))
+
+        if pending:
+            files = [paths[0] for paths in pending.values()]
+            workers = min(len(files), (os.cpu_count() or 1) + 4)
+
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(lambda artifact: self.HashFile(*artifact), files))
+            except OSError as error:
+                raise BlissBootError("Unable to verify " + str(error.filename) + ": " + error.strerror)
+
+            for key, digest in zip(pending, results):
+                self._cache[key] = [digest, now]
+
+                for path, info in pending[key]:
+                    digests[path] = digest
+
+                self.hashed = self.hashed + 1
+                self.bytesHashed = self.bytesHashed + key[2]
+
+            self._isDirty = 1
+
+        self.SaveCache()
+
+        return digests
@@ -0,0 +1,249 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from libs.Output import Output
+from libs.Errors import BlissBootError
+from libs.Generator import Generator
+from libs.FileWriter import FileWriter
+
+import libs.ConfigLoader as ConfigLoader
+
+# Generates the configurations for many roots/configurations at once. The jobs
+# come from a JSON manifest:
+#
+#     {
+#         "report": "report.json",
+#         "jobs": [
+#             {"root": "/mnt/a", "bootloader": "grub2", "output": "/mnt/a/boot/grub/grub.cfg"},
+#             {"root": "/mnt/a", "config": "extlinux.py", "output": "/mnt/a/boot/extlinux.conf"}
+#         ]
+#     }
+#
+# Every job needs its own 'output' (the jobs run at the same time). 'config'
+# defaults to <root>/etc/bliss-boot/config.py and 'bootloader' to the one in the
+# configuration. Relative paths are relative to the manifest's directory. The jobs run on a process pool with one worker per core.
+# Jobs with the same root are given to the same worker so that the device index,
+# the block device map, the fstab and the listing of the 'kernelDirectory' are only read once.
+class Batch(object):
+    _fields = ("root", "config", "bootloader", "output", "image", "force")
+
+    # Reads and checks the manifest. Returns (jobs, report path).
+    @classmethod
+    def LoadManifest(cls, vPath):
+        try:
+            with open(vPath, "r") as manifest:
+                data = json.load(manifest)
+        except OSError as error:
+            raise BlissBootError("Unable to read the manifest " + vPath + ": " + str(error))
+        except ValueError as error:
+            raise BlissBootError("The manifest " + vPath + " isn't valid JSON: " + str(error))
+
+        # A plain list of jobs is fine too
+        if isinstance(data, list):
+            data = {"jobs": data}
+
+        if not isinstance(data, dict) or not isinstance(data.get("jobs"), list):
+            raise BlissBootError("The manifest " + vPath + " needs a 'jobs' list.")
+
+        jobs = []
+        outputs = {}
+        directory = os.path.dirname(os.path.abspath(vPath))
+
+        # Relative paths in the manifest are relative to the manifest itself, not to
+        # wherever bliss-boot happens to be run from
+        def Resolve(vValue):
+            return os.path.normpath(os.path.join(directory, vValue)) if vValue else ""
+
+        for i in range(len(data["jobs"])):
+            job = data["jobs"][i]
+
+            if not isinstance(job, dict):
+                raise BlissBootError("Job " + str(i + 1) + " in " + vPath + " isn't an object.")
+
+            unknown = [field for field in job if field not in cls._fields]
+
+            if unknown:
+                raise BlissBootError("Job " + str(i + 1) + " in " + vPath + " has unknown fields: " + ", ".join(sorted(unknown)))
+
+            # The jobs run at the same time, their configurations would end up mixed together
+            if job.get("output") == "-":
+                raise BlissBootError("Job " + str(i + 1) + " in " + vPath + " can't write to stdout ('-').")
+
+            # Without one every job would write the bootloader's default output in the
+            # current directory at the same time
+            if not job.get("output"):
+                raise BlissBootError("Job " + str(i + 1) + " in " + vPath + " needs an 'output'.")
+
+            output = Resolve(job["output"])
+
+            if output in outputs:
+                raise BlissBootError("Jobs " + str(outputs[output]) + " and " + str(i + 1) + " in " + vPath + " write to the same output: " + output)
+
+            outputs[output] = i + 1
+            root = Resolve(job.get("root") or "/")
+
+            jobs.append({
+                "index": i + 1,
+                "root": root,
+                "config": Resolve(job.get("config")) or os.path.join(root, ConfigLoader.GetConfigFilePath().lstrip("/")),
+                "bootloader": job.get("bootloader", ""),
+                "output": output,
+                "image": Resolve(job.get("image")),
+                "force": 1 if job.get("force") else 0,
+            })
+
+        return jobs, Resolve(data.get("report"))
+
+    # Splits the jobs into chunks for the workers. Jobs with the same root stay
+    # together unless there are fewer roots than workers.
+    @classmethod
+    def GetChunks(cls, vJobs, vWorkers):
+        groups = {}
+
+        for job in vJobs:
+            groups.setdefault(job["root"], []).append(job)
+
+        size = max(1, -(-len(vJobs) // vWorkers))
+        chunks = []
+
+        for root in groups:
+            group = groups[root]
+
+            for i in range(0, len(group), size):
+                chunks.append(group[i:i + size])
+
+        return chunks
+
+    # Sets up a worker process. The workers don't print anything, the report has it all.
+    @classmethod
+    def InitializeWorker(cls):
+        Output.SetLevel(Output.QUIET)
+
+    # Runs a single job. vShared holds what the previous jobs of this worker found
+    # for the same root: { root: scanner }
+    @classmethod
+    def RunJob(cls, vJob, vShared):
+        status = {
+            "index": vJob["index"],
+            "root": vJob["root"],
+            "config": vJob["config"],
+            "bootloader": vJob["bootloader"],
+            "output": vJob["output"],
+            "status": "failed",
+            "error": "",
+            "kernels": [],
+            "skipped": [],
+            "seconds": 0.0,
+        }
+
+        start = time.perf_counter()
+
+        try:
+            # A fresh configuration for every job, so that overriding the bootloader doesn't leak
+            config = ConfigLoader.LoadConfig(vJob["config"])
+
+            if vJob["bootloader"]:
+                config.bootloader = vJob["bootloader"]
+
+            status["bootloader"] = config.bootloader
+
+            image = None
+
+            if vJob["image"]:
+                from libs.DiskImage import DiskImage
+
+                image = DiskImage(vJob["image"])
+
+            shared = vShared.get(vJob["root"])
+
+            if shared:
+                generator = Generator(config, vJob["root"], shared.devices, shared.fstab, image, shared.topology)
+            else:
+                generator = Generator(config, vJob["root"], vImage=image)
+
+            generator.Scan(shared)
+            result = generator.Write(vJob["output"], vJob["force"])
+
+            vShared[vJob["root"]] = generator.scanner
+
+            status["output"] = result.output
+            status["status"] = "written" if result.written else "unchanged"
+            status["kernels"] = [kernel.label + " - " + kernel.version for kernel in result.kernels]
+            status["skipped"] = [{"label": label, "version": version, "reason": reason} for label, version, reason in result.skipped]
+        except Exception as error:
+            # One broken job (or configuration) shouldn't stop the others
+            status["error"] = str(error)
+
+        status["seconds"] = round(time.perf_counter() - start, 6)
+
+        return status
+
+    # Runs a chunk of jobs in a worker and returns their statuses
+    @classmethod
+    def RunChunk(cls, vJobs):
+        shared = {}
+
+        return [cls.RunJob(job, shared) for job in vJobs]
+
+    # Runs all the jobs in the manifest and returns the combined report
+    @classmethod
+    def Run(cls, vManifest):
+        jobs, reportPath = cls.LoadManifest(vManifest)
+
+        if not jobs:
+            raise BlissBootError("There are no jobs in " + vManifest + ".")
+
+        workers = min(os.cpu_count() or 1, len(jobs))
+        chunks = cls.GetChunks(jobs, workers)
+
+        Output.Print("Running " + str(len(jobs)) + " jobs on " + str(workers) + " workers ...")
+        Output.Flush()
+
+        start = time.perf_counter()
+        statuses = []
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=cls.InitializeWorker) as pool:
+            for chunk in pool.map(cls.RunChunk, chunks):
+                statuses.extend(chunk)
+
+        statuses.sort(key=lambda status: status["index"])
+
+        report = {
+            "manifest": vManifest,
+            "workers": workers,
+            "seconds": round(time.perf_counter() - start, 6),
+            "failed": len([status for status in statuses if status["status"] == "failed"]),
+            "jobs": statuses,
+        }
+
+        for status in statuses:
+            message = "[" + str(status["index"]) + "] " + status["root"] + " -> " + (status["output"] or status["bootloader"] or "?") + \
+                ": " + status["status"] + " (" + "%.3f" % status["seconds"] + "s)"
+
+            if status["status"] == "failed":
+                Output.Warn(message + ": " + status["error"])
+            else:
+                Output.Success(message)
+
+        if reportPath:
+            FileWriter.Write(reportPath, json.dumps(report, indent=4) + "\n")
+            Output.Print("The report has been written to " + reportPath)
+
+        return report
@@ -0,0 +1,192 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+from libs.Output import Output
+from libs.Errors import BlissBootError
+from libs.Renderer import Renderer
+from libs.FileWriter import FileWriter
+
+# Generates Boot Loader Specification entries (systemd-boot and friends).
+# Every kernel gets its own loader/entries/<label>-<version>.conf file. On each run
+# the existing entries are compared with the new ones and only the files that
+# changed are created, rewritten or deleted.
+class BlsRenderer(Renderer):
+    name = "bls"
+    title = "Boot Loader Specification"
+
+    # The output is the root of the ESP (or XBOOTLDR) partition
+    defaultOutput = "."
+
+    # First line of every file we generate. Only files with it are ever rewritten or removed.
+    marker = "# Generated by bliss-boot\n"
+
+    # Characters that shouldn't end up in an entry file name
+    _unsafe = re.compile(r"[^A-Za-z0-9._+-]")
+
+    # Returns the file name of the entry for this kernel
+    def GetEntryName(self, vKernel):
+        return self._unsafe.sub("_", vKernel.label + "-" + vKernel.version) + ".conf"
+
+    # Returns the contents of loader.conf
+    def RenderHeader(self, vKernels, vPosition):
+        dossier = [self.marker]
+
+        dossier.append("timeout " + str(self.config.timeout) + "\n")
+        # The same name as the file, which can have a suffix when an entry is duplicated
+        names = [name for name, kernel in self.GetEntryNames(vKernels)]
+        dossier.append("default " + names[vPosition] + "\n")
+
+        return "".join(dossier)
+
+    def RenderEntry(self, vKernel):
+        kernelPath = self.GetKernelPath(vKernel)
+        dossier = [self.marker]
+
+        dossier.append("title " + vKernel.label + "\n")
+        dossier.append("version " + vKernel.version + "\n")
+        dossier.append("linux " + kernelPath + "/" + vKernel.kernelName + "\n")
+
+        if self.config.useInitrd:
+            dossier.append("initrd " + kernelPath + "/" + vKernel.initrdName + "\n")
+
+        dossier.append("options " + vKernel.options + "\n")
+
+        return "".join(dossier)
+
+    # There is nowhere to append anything in the BLS layout
+    def RenderFooter(self):
+        if self.config.append and self.config.appendStuff:
+            Output.Warn("The 'appendStuff' option isn't supported by the " + self.title + " backend. Skipping ...")
+
+        return ""
+
+    # Yields the file name of the entry for every kernel: (name, kernel)
+    def GetEntryNames(self, vKernels):
+        names = set()
+
+        for kernel in vKernels:
+            name = self.GetEntryName(kernel)
+
+            # The same label and version can be used more than once in the config
+            if name in names:
+                name = name[:-len(".conf")] + "-" + str(kernel.position) + ".conf"
+
+            names.add(name)
+
+            yield name, kernel
+
+    # Returns the rendered files: { file name: contents }
+    def RenderEntries(self, vKernels):
+        entries = {}
+
+        for name, kernel in self.GetEntryNames(vKernels):
+            Output.Warn("Adding: " + kernel.label + " - " + kernel.version)
+            entries[name] = self.RenderEntry(kernel).encode("utf-8")
+
+        return entries
+
+    # There is more than one file, so a stream gets all of them with a line
+    # naming each one in front of it (like 'head' does).
+    def RenderChunks(self, vKernels, vPosition):
+        yield "==> loader/loader.conf <==\n" + self.RenderHeader(vKernels, vPosition)
+
+        for name, kernel in self.GetEntryNames(vKernels):
+            Output.Warn("Adding: " + kernel.label + " - " + kernel.version)
+            yield "\n==> loader/entries/" + name + " <==\n" + self.RenderEntry(kernel)
+
+        yield self.RenderFooter()
+
+    # Checks to see if we generated this file (and thus are allowed to change it)
+    def IsManaged(self, vPath):
+        try:
+            with open(vPath, "rb") as entry:
+                return entry.read(len(self.marker)) == self.marker.encode("utf-8")
+        except OSError:
+            return 0
+
+    # Writes a file we own, or fails if it belongs to someone else and we weren't forced
+    def WriteManaged(self, vPath, vData, vForce):
+        if os.path.exists(vPath) and not self.IsManaged(vPath) and not vForce:
+            raise BlissBootError("Target file: " + vPath + " already exists and wasn't generated by bliss-boot. Pass -f to overwrite.")
+
+        return FileWriter.Write(vPath, vData)
+
+    # The entries are the body, they are the same for every mirror
+    def RenderBody(self, vKernels):
+        return self.RenderEntries(vKernels)
+
+    # Syncs the entries directory with the kernels that we want.
+    # Returns 1 if anything was changed or 0 if everything was already up to date.
+    def Write(self, vOutput, vKernels, vPosition, vForce, vBody=None):
+        loaderDirectory = os.path.join(vOutput, "loader")
+        entriesDirectory = os.path.join(loaderDirectory, "entries")
+
+        if not os.path.isdir(entriesDirectory):
+            os.makedirs(entriesDirectory)
+
+        entries = vBody
+
+        if entries is None:
+            entries = self.RenderEntries(vKernels)
+
+        created = 0
+        updated = 0
+        removed = 0
+        unchanged = 0
+
+        for name in sorted(entries):
+            path = os.path.join(entriesDirectory, name)
+            exists = os.path.exists(path)
+
+            if self.WriteManaged(path, entries[name], vForce):
+                if exists:
+                    updated = updated + 1
+                else:
+                    created = created + 1
+            else:
+                unchanged = unchanged + 1
+
+        # loader.conf also has settings of its own (bootctl install writes one). It is
+        # only ours when it is missing or we generated it, even with -f.
+        loaderConf = os.path.join(loaderDirectory, "loader.conf")
+
+        if os.path.exists(loaderConf) and not self.IsManaged(loaderConf):
+            Output.Warn("'" + loaderConf + "' wasn't generated by bliss-boot, leaving it alone. Its 'default' and 'timeout' are used.")
+        elif FileWriter.Write(loaderConf, self.RenderHeader(vKernels, vPosition)):
+            updated = updated + 1
+
+        # Only now that the new entries are in place, remove the ones we generated
+        # before that are no longer wanted. A crash in the middle leaves extra
+        # entries behind, never a directory without a bootable one.
+        with os.scandir(entriesDirectory) as existing:
+            stale = [entry.path for entry in existing if entry.name.endswith(".conf") and entry.name not in entries and self.IsManaged(entry.path)]
+
+        for path in stale:
+            Output.Debug("Removing: " + path)
+            os.unlink(path)
+            removed = removed + 1
+
+        if stale:
+            FileWriter.SyncDirectory(entriesDirectory)
+
+        Output.Success("'" + entriesDirectory + "' has been synced! (" + str(created) + " created, " + str(updated) +
+            " updated, " + str(removed) + " removed, " + str(unchanged) + " unchanged)")
+
+        if created + updated + removed:
+            return 1
+
+        return 0
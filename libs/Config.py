@@ -0,0 +1,403 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import difflib
+import re
+import string
+import types
+
+from libs.Output import Output
+from libs.Errors import ConfigError
+
+# A validated configuration. It has the same attributes as the old config.py
+# module, whatever format it was written in, and every field has the right type
+# (missing optional fields get their default).
+class Config(object):
+    # Field, type, default (None = required)
+    _fields = (
+        ("kernels", "kernels", ()),
+        ("kernelDirectory", "str", None),
+        ("bootloader", "str", None),
+        ("useInitrd", "flag", 1),
+        ("timeout", "number", 3),
+        ("wholeDiskZfsBootPool", "str", ""),
+        ("efi", "flag", 0),
+        ("wholeDiskZfs", "flag", 0),
+        ("goodyBag", "list", ()),
+        ("grub2Compact", "flag", 0),
+        ("grub2Search", "flag", 0),
+        ("grub2MainEntries", "int", 0),
+        ("extlinuxUi", "str", "menu.c32"),
+        ("extlinuxMenuTitle", "str", "Boot Menu"),
+        ("extlinuxTitleColor", "str", "1;37;40"),
+        ("extlinuxBorderColor", "str", "30;40"),
+        ("extlinuxUnselectedColor", "str", "37;40"),
+        ("extlinuxAutoBoot", "flag", 0),
+        ("append", "flag", 0),
+        ("appendStuff", "str", ""),
+        ("rules", "rules", ()),
+        ("kernelOrder", "str", "name"),
+        ("mirrors", "mirrors", ()),
+        ("validateDevices", "str", "off"),
+    )
+
+    # Fields that only take one of these values
+    _choices = {
+        "kernelOrder": ("name", "newest"),
+        "validateDevices": ("warn", "refuse", "off"),
+    }
+
+    # The keys of a discovery rule and their defaults
+    _ruleKeys = (
+        ("match", ""),
+        ("regex", ""),
+        ("label", "Linux"),
+        ("kernel", "vmlinuz"),
+        ("initrd", "initrd"),
+        ("options", ""),
+        ("keep", 0),
+        ("default", ""),
+    )
+
+    # The keys of a mirror written as a table ('drive' is optional)
+    _mirrorKeys = ("output", "drive")
+
+    # The keys of a kernel written as a table instead of a 6 item list
+    _kernelKeys = ("label", "version", "default", "kernel", "initrd", "options")
+
+    __slots__ = tuple(name for name, kind, default in _fields) + ("path", "format")
+
+    def __init__(self, vPath="", vFormat=""):
+        self.path = vPath
+        self.format = vFormat
+
+        for name, kind, default in self._fields:
+            setattr(self, name, default)
+
+    # Scanner and friends name the configuration by its __file__, like a module
+    @property
+    def __file__(self):
+        return self.path
+
+    # Returns the fields as plain values (for the cache)
+    def ToValues(self):
+        return dict((name, getattr(self, name)) for name, kind, default in self._fields)
+
+    # Creates a configuration from values that were already validated (the cache)
+    @classmethod
+    def FromValues(cls, vValues, vPath, vFormat):
+        config = cls(vPath, vFormat)
+
+        for name, kind, default in cls._fields:
+            setattr(config, name, vValues[name])
+
+        return config
+
+    # Validates the raw values of a configuration file and returns a Config.
+    # vLocate(field, index=-1, key="") returns the line of a field (0 if unknown).
+    @classmethod
+    def Validate(cls, vValues, vPath, vFormat, vLocate):
+        config = cls(vPath, vFormat)
+        errors = []
+
+        def Error(vField, vMessage, vIndex=-1, vKey=""):
+            line = vLocate(vField, vIndex, vKey)
+            location = vPath + (":" + str(line) if line else "")
+
+            if vIndex >= 0:
+                vField = vField + "[" + str(vIndex) + "]" + ("." + vKey if vKey else "")
+
+            errors.append(location + ": '" + vField + "' " + vMessage)
+
+        for name, kind, default in cls._fields:
+            if name not in vValues:
+                if default is None:
+                    Error(name, "is required")
+
+                continue
+
+            value = vValues[name]
+
+            if kind == "str":
+                if not isinstance(value, str):
+                    Error(name, "must be a string")
+                    continue
+            elif kind == "int" or kind == "flag":
+                # true/false are fine for flags, they are stored as 1/0 like everywhere else
+                if isinstance(value, bool) and kind == "flag":
+                    value = int(value)
+                elif isinstance(value, bool) or not isinstance(value, int):
+                    Error(name, "must be a number")
+                    continue
+                elif value < 0 or (kind == "flag" and value > 1):
+                    Error(name, "must be 0 or 1" if kind == "flag" else "can't be negative")
+                    continue
+            elif kind == "number":
+                # Like "int", but fractions are fine too (timeout = 2.5)
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    Error(name, "must be a number")
+                    continue
+                elif value < 0:
+                    Error(name, "can't be negative")
+                    continue
+            elif kind == "list":
+                if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+                    Error(name, "must be a list of strings")
+                    continue
+
+                value = tuple(value)
+            elif kind == "kernels":
+                value = cls.ValidateKernels(name, value, Error)
+
+                if value is None:
+                    continue
+            elif kind == "rules":
+                value = cls.ValidateRules(name, value, Error)
+
+                if value is None:
+                    continue
+            elif kind == "mirrors":
+                value = cls.ValidateMirrors(name, value, Error)
+
+                if value is None:
+                    continue
+
+            if name in cls._choices and value not in cls._choices[name]:
+                Error(name, "must be one of: " + ", ".join(cls._choices[name]))
+                continue
+
+            setattr(config, name, value)
+
+        if errors:
+            raise ConfigError("Your configuration file has errors:\n" + "\n".join(errors))
+
+        cls.WarnUnknown(vValues, vPath, vLocate)
+
+        return config
+
+    # Warns about the settings that don't exist, a typo (bootloder) would otherwise
+    # just not apply. Modules, functions and classes that a config.py imports or
+    # defines for itself aren't settings.
+    @classmethod
+    def WarnUnknown(cls, vValues, vPath, vLocate):
+        names = [name for name, kind, default in cls._fields]
+        lowered = dict((name.lower(), name) for name in names)
+
+        for name in sorted(vValues):
+            if name in names or isinstance(vValues[name], (types.ModuleType, types.FunctionType, type)):
+                continue
+
+            line = vLocate(name)
+            message = (vPath + (":" + str(line) if line else "") + ": '" + name + "' isn't a setting, it is ignored.")
+            matches = difflib.get_close_matches(name.lower(), list(lowered), 1)
+
+            if matches:
+                message = message + " Did you mean '" + lowered[matches[0]] + "'?"
+
+            Output.Warn(message)
+
+    # Validates the 'kernels' list. Every kernel is either a list of 6 items (like the
+    # tuples in config.py) or a table with the keys in '_kernelKeys'.
+    @classmethod
+    def ValidateKernels(cls, vName, vKernels, vError):
+        if not isinstance(vKernels, (list, tuple)):
+            vError(vName, "must be a list of kernels")
+            return None
+
+        kernels = []
+        isValid = 1
+
+        for i in range(len(vKernels)):
+            kernel = vKernels[i]
+
+            if isinstance(kernel, dict):
+                unknown = [key for key in kernel if key not in cls._kernelKeys]
+
+                if unknown:
+                    vError(vName, "has unknown keys: " + ", ".join(sorted(unknown)), i)
+                    isValid = 0
+                    continue
+
+                missing = [key for key in cls._kernelKeys if key not in kernel and key != "default"]
+
+                if missing:
+                    vError(vName, "is missing: " + ", ".join(missing), i)
+                    isValid = 0
+                    continue
+
+                kernel = [kernel.get(key, 0) for key in cls._kernelKeys]
+            elif not isinstance(kernel, (list, tuple)) or len(kernel) != len(cls._kernelKeys):
+                vError(vName, "must have 6 items: label, version, default, kernel, initrd, options", i)
+                isValid = 0
+                continue
+            else:
+                kernel = list(kernel)
+
+            for j in range(len(cls._kernelKeys)):
+                key = cls._kernelKeys[j]
+
+                if key == "default":
+                    if isinstance(kernel[j], bool):
+                        kernel[j] = int(kernel[j])
+
+                    if kernel[j] not in (0, 1) or isinstance(kernel[j], float):
+                        vError(vName, "must be 0 or 1", i, key)
+                        isValid = 0
+                elif not isinstance(kernel[j], str):
+                    vError(vName, "must be a string", i, key)
+                    isValid = 0
+
+            kernels.append(tuple(kernel))
+
+        if not isValid:
+            return None
+
+        return tuple(kernels)
+
+    # Validates the 'rules' list. Every rule is a table with a glob ('match') or a
+    # regular expression ('regex') for the kernel directories, and templates for the
+    # label, kernel, initrd and options. The templates can use {version} and the
+    # named groups of the regular expression.
+    @classmethod
+    def ValidateRules(cls, vName, vRules, vError):
+        if not isinstance(vRules, (list, tuple)):
+            vError(vName, "must be a list of rules")
+            return None
+
+        keys = [key for key, default in cls._ruleKeys]
+        rules = []
+        isValid = 1
+
+        for i in range(len(vRules)):
+            rule = vRules[i]
+
+            if not isinstance(rule, dict):
+                vError(vName, "must be a table", i)
+                isValid = 0
+                continue
+
+            unknown = [key for key in rule if key not in keys]
+
+            if unknown:
+                vError(vName, "has unknown keys: " + ", ".join(sorted(unknown)), i)
+                isValid = 0
+                continue
+
+            values = dict((key, rule.get(key, default)) for key, default in cls._ruleKeys)
+            fields = ["version"]
+            errors = 0
+
+            for key in keys:
+                if key == "keep":
+                    if isinstance(values[key], bool) or not isinstance(values[key], int) or values[key] < 0:
+                        vError(vName, "must be a number (0 keeps all of them)", i, key)
+                        errors = errors + 1
+                elif not isinstance(values[key], str):
+                    vError(vName, "must be a string", i, key)
+                    errors = errors + 1
+
+            if errors:
+                isValid = 0
+                continue
+
+            if bool(values["match"]) == bool(values["regex"]):
+                vError(vName, "needs either 'match' (a glob) or 'regex'", i)
+                isValid = 0
+                continue
+
+            if values["regex"]:
+                try:
+                    fields.extend(re.compile(values["regex"]).groupindex)
+                except re.error as error:
+                    vError(vName, "isn't a valid regular expression: " + str(error), i, "regex")
+                    isValid = 0
+                    continue
+
+            if values["default"] not in ("", "newest"):
+                vError(vName, "must be \"newest\" or empty", i, "default")
+                isValid = 0
+
+            for key in ("label", "kernel", "initrd", "options"):
+                try:
+                    names = [field for text, field, spec, conversion in string.Formatter().parse(values[key]) if field is not None]
+                except ValueError as error:
+                    vError(vName, "isn't a valid template: " + str(error), i, key)
+                    isValid = 0
+                    continue
+
+                unknown = [field for field in names if field not in fields]
+
+                if unknown:
+                    vError(vName, "uses unknown fields: " + ", ".join(unknown) + " (known: " + ", ".join(fields) + ")", i, key)
+                    isValid = 0
+
+            rules.append(values)
+
+        if not isValid:
+            return None
+
+        return tuple(rules)
+
+    # Validates the 'mirrors' list. Every mirror is the path of an output, or a
+    # table with the 'output' and the 'drive' that the copy boots from (an fstab
+    # style device or identifier). Returns ((output, drive), ...).
+    @classmethod
+    def ValidateMirrors(cls, vName, vMirrors, vError):
+        if not isinstance(vMirrors, (list, tuple)):
+            vError(vName, "must be a list of outputs")
+            return None
+
+        mirrors = []
+        isValid = 1
+
+        for i in range(len(vMirrors)):
+            mirror = vMirrors[i]
+
+            if isinstance(mirror, str):
+                mirror = {"output": mirror}
+            elif not isinstance(mirror, dict):
+                vError(vName, "must be a path or a table", i)
+                isValid = 0
+                continue
+
+            unknown = [key for key in mirror if key not in cls._mirrorKeys]
+
+            if unknown:
+                vError(vName, "has unknown keys: " + ", ".join(sorted(unknown)), i)
+                isValid = 0
+                continue
+
+            values = [mirror.get(key, "") for key in cls._mirrorKeys]
+            errors = 0
+
+            for j in range(len(cls._mirrorKeys)):
+                if not isinstance(values[j], str):
+                    vError(vName, "must be a string", i, cls._mirrorKeys[j])
+                    errors = errors + 1
+
+            if errors:
+                isValid = 0
+                continue
+
+            if not values[0] or values[0] == "-":
+                vError(vName, "needs the path of a file (or directory) to write to", i, "output")
+                isValid = 0
+                continue
+
+            mirrors.append(tuple(values))
+
+        if not isValid:
+            return None
+
+        return tuple(mirrors)
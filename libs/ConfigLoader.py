@@ -12,26 +12,288 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ast
+import hashlib
+import json
+import marshal
+import os
+import re
+
 from importlib import machinery
+from importlib import util
+
+import libs.Variables as var
 
-# This module provides static methods to load the configuration file
+from libs.Config import Config
+from libs.Errors import ConfigError
+from libs.FileWriter import FileWriter
+from libs.Timings import Timings
+
+# This module provides static methods to load the configuration file.
+# Nothing is loaded until the configuration is asked for.
+#
+# The configuration can be written in python (config.py), TOML (config.toml) or
+# JSON (config.json). Whatever the format, it is validated into a Config object.
+# The TOML and JSON files are only parsed and validated again when they change:
+# the validated values are cached (marshaled) and keyed by path, inode, mtime and size.
 
 # Path to config file
 configFilePath = "/etc/bliss-boot/config.py"
 
-# Load the configuration file
-loader = machinery.SourceFileLoader("config", configFilePath)
+# The configuration of this run (once it has been loaded)
+configObject = None
+
+# Extension -> format
+configFormats = {
+    ".py": "python",
+    ".toml": "toml",
+    ".json": "json",
+}
+
+# Where the validated TOML/JSON configurations are cached
+cacheDirectory = var.cacheDirectory
+
+# Bumped whenever the layout of the cache changes
+cacheFormat = 7
+
+# Returns the path of the configuration file. If it doesn't exist, a file with
+# the same name in one of the other formats is used (config.py -> config.toml).
+def ResolveConfigFilePath(vPath):
+    if os.path.exists(vPath):
+        return vPath
+
+    base, extension = os.path.splitext(vPath)
+
+    if extension in configFormats:
+        for other in configFormats:
+            if os.path.exists(base + other):
+                return base + other
+
+    return vPath
+
+# Loads a python configuration file and returns it as a new module
+def LoadConfigModule(vPath):
+    loader = machinery.SourceFileLoader("config", vPath)
+    spec = util.spec_from_loader("config", loader)
+    module = util.module_from_spec(spec)
+
+    try:
+        loader.exec_module(module)
+    except FileNotFoundError:
+        raise ConfigError("Your configuration file \"" + vPath + "\" was not found!")
+
+    return module
+
+# Loads and validates a configuration file and returns it as a new Config
+@Timings.Timed("LoadConfig")
+def LoadConfig(vPath):
+    path = ResolveConfigFilePath(vPath)
+    configFormat = configFormats.get(os.path.splitext(path)[1], "python")
+
+    try:
+        info = os.stat(path)
+    except OSError:
+        raise ConfigError("Your configuration file \"" + path + "\" was not found!")
+
+    if configFormat == "python":
+        module = LoadConfigModule(path)
+        values = dict((name, getattr(module, name)) for name in dir(module) if not name.startswith("_"))
+
+        return Config.Validate(values, path, configFormat, GetPythonLocator(path))
+
+    values = ReadCache(path, info, configFormat)
+
+    if values is not None:
+        return Config.FromValues(values, path, configFormat)
+
+    try:
+        with open(path, "r") as dossier:
+            text = dossier.read()
+    except OSError as error:
+        raise ConfigError("Unable to read your configuration file \"" + path + "\": " + str(error))
+
+    if configFormat == "toml":
+        values = ParseToml(path, text)
+    else:
+        values = ParseJson(path, text)
+
+    if not isinstance(values, dict):
+        raise ConfigError(path + ": The configuration must be a table/object of settings.")
+
+    config = Config.Validate(values, path, configFormat, GetTextLocator(text))
+
+    WriteCache(path, info, configFormat, config)
+
+    return config
+
+# Parses a TOML configuration file
+def ParseToml(vPath, vText):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ConfigError("Reading " + vPath + " needs python 3.11 or the 'tomli' package.")
+
+    try:
+        return tomllib.loads(vText)
+    except tomllib.TOMLDecodeError as error:
+        # The message already says where: "Invalid value (at line 2, column 5)"
+        raise ConfigError(vPath + ": " + str(error))
+
+# Parses a JSON configuration file
+def ParseJson(vPath, vText):
+    try:
+        return json.loads(vText)
+    except ValueError as error:
+        raise ConfigError(vPath + ":" + str(getattr(error, "lineno", 0)) + ": " + str(error))
+
+# Returns a function that finds the line of a field in a python configuration.
+# The file is only parsed if there is an error to report.
+def GetPythonLocator(vPath):
+    lines = {}
+    items = {}
+    parsed = []
+
+    def Parse():
+        parsed.append(1)
+
+        try:
+            with open(vPath, "r") as dossier:
+                tree = ast.parse(dossier.read())
+        except (OSError, SyntaxError, ValueError):
+            return
+
+        for node in tree.body:
+            if not isinstance(node, ast.Assign):
+                continue
+
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    lines[target.id] = node.lineno
+
+                    if isinstance(node.value, (ast.Tuple, ast.List)):
+                        items[target.id] = [element.lineno for element in node.value.elts]
+
+    def Locate(vField, vIndex=-1, vKey=""):
+        if not parsed:
+            Parse()
+
+        if 0 <= vIndex < len(items.get(vField, ())):
+            return items[vField][vIndex]
+
+        return lines.get(vField, 0)
+
+    return Locate
+
+# Returns a function that finds the line of a field in a TOML/JSON configuration.
+# This is a best effort search of the text: the line of the key, the line of the
+# n-th [[kernels]] table (or the n-th item of the list) and the key inside of it.
+def GetTextLocator(vText):
+    lines = vText.splitlines()
+
+    def FindKey(vKey, vStart, vEnd):
+        pattern = re.compile(r"^\s*[\"']?" + re.escape(vKey) + r"[\"']?\s*[=:]")
+
+        for i in range(vStart, vEnd):
+            if pattern.match(lines[i]):
+                return i
+
+        return -1
+
+    def Locate(vField, vIndex=-1, vKey=""):
+        start = FindKey(vField, 0, len(lines))
+
+        if vIndex < 0:
+            return start + 1
+
+        # TOML: [[kernels]] tables
+        header = re.compile(r"^\s*\[\[\s*" + re.escape(vField) + r"\s*\]\]")
+        tables = [i for i in range(len(lines)) if header.match(lines[i])]
+
+        if vIndex < len(tables):
+            end = len(lines)
+
+            for i in range(tables[vIndex] + 1, len(lines)):
+                if lines[i].lstrip().startswith("["):
+                    end = i
+                    break
+
+            key = FindKey(vKey, tables[vIndex] + 1, end) if vKey else -1
+
+            return (key if key >= 0 else tables[vIndex]) + 1
+
+        # TOML/JSON: an inline list, one item per line (or per '{' for JSON objects)
+        if start >= 0:
+            entries = [i for i in range(start + 1, len(lines)) if lines[i].lstrip()[:1] in ("{", "[")]
+
+            if vIndex < len(entries):
+                end = entries[vIndex + 1] if vIndex + 1 < len(entries) else len(lines)
+                key = FindKey(vKey, entries[vIndex], end) if vKey else -1
+
+                return (key if key >= 0 else entries[vIndex]) + 1
+
+        return start + 1
+
+    return Locate
+
+# Returns the path of the cache file for this configuration file
+def GetCachePath(vPath):
+    name = hashlib.sha1(os.fsencode(os.path.abspath(vPath))).hexdigest()
+    return os.path.join(cacheDirectory, name + ".config")
+
+# Returns the key that a cached configuration must match
+def GetCacheKey(vPath, vInfo, vFormat):
+    return (cacheFormat, var.version, os.path.abspath(vPath), vFormat, vInfo.st_ino, vInfo.st_mtime_ns, vInfo.st_size)
+
+# Returns the cached values for this configuration file, or None if there are
+# none or the file changed since they were cached
+def ReadCache(vPath, vInfo, vFormat):
+    try:
+        with open(GetCachePath(vPath), "rb") as dossier:
+            key, values = marshal.load(dossier)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if key != GetCacheKey(vPath, vInfo, vFormat):
+        return None
+
+    return values
+
+# Caches the validated values of a configuration file. Not being able to
+# (for example when we aren't root) only means the next run parses it again.
+def WriteCache(vPath, vInfo, vFormat, vConfig):
+    try:
+        os.makedirs(cacheDirectory, exist_ok=True)
+        FileWriter.Write(GetCachePath(vPath), marshal.dumps((GetCacheKey(vPath, vInfo, vFormat), vConfig.ToValues())))
+    except (OSError, ValueError):
+        pass
+
+# Returns the configuration (it is loaded the first time)
+def GetConfig():
+    global configObject
+
+    if configObject is None:
+        configObject = LoadConfig(configFilePath)
+
+    return configObject
+
+# Loads the configuration file again and returns it
+def ReloadConfig():
+    global configObject
+
+    configObject = LoadConfig(configFilePath)
+
+    return configObject
 
-try:
-    configModule = loader.load_module("config")
-except FileNotFoundError:
-    print("Your configuration file \"" + configFilePath + "\" was not found!")
-    quit(1)
+# Changes the path to the configuration file
+def SetConfigFilePath(vPath):
+    global configFilePath, configObject
 
-# Returns the configuration file as a module
-def GetConfigModule():
-    return configModule
+    configFilePath = vPath
+    configObject = None
 
-# Returns the path to the configuration file
+# Returns the path to the configuration file (in whatever format it was found)
 def GetConfigFilePath():
-    return configFilePath
+    return ResolveConfigFilePath(configFilePath)
@@ -0,0 +1,233 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+from subprocess import check_output
+from subprocess import CalledProcessError
+
+from libs.Output import Output
+from libs.Timings import Timings
+
+# Resolves UUID=, PARTUUID=, LABEL= and PARTLABEL= identifiers to their block device.
+# The index is built once (per instance) from the udev symlinks in /dev/disk/by-* and
+# sysfs. udev only creates the by-label/by-partlabel directories when there is
+# something to put in them, so a missing directory doesn't mean much: a single
+# 'blkid -o export' call (for all the devices at once) is only made when there is
+# no /dev/disk at all, or when an identifier of a type without symlinks is looked
+# up and can't be found otherwise.
+class Devices(object):
+    # Identifier type -> udev symlink directory
+    _kinds = (
+        ("UUID", "by-uuid"),
+        ("PARTUUID", "by-partuuid"),
+        ("LABEL", "by-label"),
+        ("PARTLABEL", "by-partlabel"),
+    )
+
+    # udev escapes unsafe characters in the symlink names as \xNN
+    _udevEscape = re.compile(r"\\x([0-9a-fA-F]{2})")
+
+    def __init__(self, vDevDiskPath="/dev/disk", vSysBlockPath="/sys/class/block"):
+        self._devDiskPath = vDevDiskPath
+        self._sysBlockPath = vSysBlockPath
+
+        # Identifier type -> { value: device }
+        self._index = None
+
+        # Device -> { identifier type: value }
+        self._tags = None
+
+        # Identifier types that had no symlinks
+        self._missing = []
+
+        # Whether or not blkid had to be used
+        self._usedBlkid = 0
+
+    # Forgets the index so that it is built again on the next lookup
+    def ClearCache(self):
+        self._index = None
+        self._tags = None
+        self._missing = []
+        self._usedBlkid = 0
+
+    # Returns a positive number if blkid was needed to build the index
+    def UsedBlkid(self):
+        return self._usedBlkid
+
+    # Splits an identifier (UUID=abc, PARTUUID="abc", /dev/sda1) into its type and value.
+    # Plain device paths are returned with an empty type.
+    @classmethod
+    def ParseIdentifier(cls, vIdValue):
+        splits = vIdValue.split("=", 1)
+
+        if len(splits) == 2 and splits[0].upper() in [kind for kind, directory in cls._kinds]:
+            return splits[0].upper(), splits[1].strip().strip("\"'")
+
+        return "", vIdValue
+
+    # Converts a kernel device name (dm-0) to the name people use in configs (/dev/mapper/vg-root)
+    def GetDeviceName(self, vDevice):
+        name = os.path.basename(vDevice)
+
+        if name.startswith("dm-"):
+            try:
+                with open(os.path.join(self._sysBlockPath, name, "dm", "name"), "r") as dmName:
+                    return "/dev/mapper/" + dmName.read().strip()
+            except OSError:
+                pass
+
+        return vDevice
+
+    # Adds an identifier to the index
+    def AddToIndex(self, vKind, vValue, vDevice):
+        if not vValue or not vDevice:
+            return
+
+        self._index[vKind].setdefault(vValue, vDevice)
+        self._tags.setdefault(vDevice, {}).setdefault(vKind, vValue)
+
+    # Builds the index from /dev/disk/by-* (and sysfs). Returns the types that had no symlinks.
+    def ScanSymlinks(self):
+        missing = []
+
+        for kind, directory in self._kinds:
+            path = os.path.join(self._devDiskPath, directory)
+
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                missing.append(kind)
+                continue
+
+            for entry in entries:
+                value = self._udevEscape.sub(lambda match: chr(int(match.group(1), 16)), entry.name)
+                device = self.GetDeviceName(os.path.realpath(entry.path))
+                self.AddToIndex(kind, value, device)
+
+        # Partition names are also exposed by the kernel directly
+        if "PARTLABEL" in missing:
+            try:
+                blocks = list(os.scandir(self._sysBlockPath))
+            except OSError:
+                blocks = []
+
+            if blocks:
+                missing.remove("PARTLABEL")
+
+            for block in blocks:
+                try:
+                    with open(os.path.join(block.path, "uevent"), "r") as uevent:
+                        for line in uevent:
+                            if line.startswith("PARTNAME="):
+                                self.AddToIndex("PARTLABEL", line.strip().split("=", 1)[1], "/dev/" + block.name)
+                except OSError:
+                    pass
+
+        return missing
+
+    # Builds the index for all the devices with a single blkid call
+    def ScanBlkid(self):
+        self._usedBlkid = 1
+
+        try:
+            Timings.Count("forks")
+
+            with Timings.Span("blkid -o export"):
+                results = check_output(["blkid", "-o", "export"], universal_newlines=True)
+        except (OSError, CalledProcessError):
+            Output.Debug("Unable to run 'blkid -o export'")
+            return
+
+        for block in results.split("\n\n"):
+            fields = {}
+
+            for line in block.split("\n"):
+                if "=" in line:
+                    key, value = line.split("=", 1)
+                    fields[key] = value.replace("\\", "")
+
+            device = fields.get("DEVNAME")
+
+            for kind, directory in self._kinds:
+                self.AddToIndex(kind, fields.get(kind), device)
+
+    # Returns the index, building it first if needed
+    def GetIndex(self):
+        if self._index is None:
+            self._index = dict((kind, {}) for kind, directory in self._kinds)
+            self._tags = {}
+
+            self._missing = self.ScanSymlinks()
+
+            if not os.path.isdir(self._devDiskPath):
+                Output.Debug("There is no " + self._devDiskPath + ". Falling back to blkid.")
+                self.ScanBlkid()
+
+        return self._index
+
+    # Runs blkid (once) when an identifier of this type can't be found and udev
+    # had no symlinks for the type. Returns a positive number if it was run.
+    def FallBack(self, vKind):
+        self.GetIndex()
+
+        if self._usedBlkid or vKind not in self._missing:
+            return 0
+
+        Output.Debug("No udev symlinks for " + vKind + ". Falling back to blkid.")
+        self.ScanBlkid()
+
+        return 1
+
+    # Returns the identifiers known for this device ({"UUID": ..., "PARTUUID": ...})
+    def GetTags(self, vDevice):
+        self.GetIndex()
+        tags = self._tags.get(self.GetDeviceName(os.path.realpath(vDevice)), self._tags.get(vDevice, {}))
+
+        if "UUID" not in tags and self.FallBack("UUID"):
+            return self.GetTags(vDevice)
+
+        return tags
+
+    # Returns the device for this identifier type and value, or an empty string.
+    # The value must match exactly (UUIDs are compared without regard to case).
+    def Lookup(self, vKind, vValue):
+        values = self.GetIndex().get(vKind, {})
+        device = values.get(vValue)
+
+        if device:
+            return device
+
+        if vKind in ("UUID", "PARTUUID"):
+            lowered = vValue.lower()
+
+            for value, device in values.items():
+                if value.lower() == lowered:
+                    return device
+
+        if self.FallBack(vKind):
+            return self.Lookup(vKind, vValue)
+
+        return ""
+
+    # Resolves an identifier (UUID=, PARTUUID=, LABEL=, PARTLABEL= or a plain path) to a device.
+    # Returns an empty string if the identifier can't be resolved.
+    def Resolve(self, vIdValue):
+        kind, value = self.ParseIdentifier(vIdValue)
+
+        if not kind:
+            return value
+
+        return self.Lookup(kind, value)
@@ -0,0 +1,246 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import struct
+import uuid
+
+from libs.Output import Output
+from libs.Errors import BlissBootError
+
+# A partition found in a disk image
+class Partition(object):
+    __slots__ = ("number", "start", "size", "partUuid", "partLabel", "fsType", "fsUuid", "fsLabel")
+
+    def __init__(self, vNumber, vStart, vSize, vPartUuid="", vPartLabel=""):
+        self.number = vNumber
+
+        # Offset and size in bytes
+        self.start = vStart
+        self.size = vSize
+
+        self.partUuid = vPartUuid
+        self.partLabel = vPartLabel
+
+        # Filled in from the filesystem's superblock (if it is one we know)
+        self.fsType = ""
+        self.fsUuid = ""
+        self.fsLabel = ""
+
+    def __repr__(self):
+        return "Partition(" + str(self.number) + ", " + self.fsType + ", UUID=" + self.fsUuid + ", PARTUUID=" + self.partUuid + ")"
+
+# Reads the partition table (GPT or MBR) and the filesystem identifiers of a raw
+# disk image through mmap, so that the layout and the /boot partition can be
+# found without loop mounting the image, calling blkid or being root.
+class DiskImage(object):
+    _sectorSize = 512
+
+    # MBR partition types that point to an extended partition or a GPT
+    _extendedTypes = (0x05, 0x0F, 0x85)
+    _protectiveType = 0xEE
+
+    # Largest GPT partition entry array we read (128 entries of 128 bytes is the
+    # usual size, this leaves plenty of room)
+    _maxTableSize = 128 * 128 * 8
+
+    def __init__(self, vPath):
+        self.path = vPath
+
+        # "gpt", "msdos" or "none"
+        self.layout = "none"
+        self.partitions = []
+
+        try:
+            with open(vPath, "rb") as image:
+                self._map = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            raise BlissBootError("Unable to read the disk image " + vPath + ": " + str(error))
+
+        try:
+            self.ReadPartitionTable()
+
+            for partition in self.partitions:
+                self.ReadFilesystem(partition)
+
+            # No partition table, the filesystem might be on the whole image
+            if not self.partitions:
+                partition = Partition(0, 0, len(self._map))
+                self.ReadFilesystem(partition)
+
+                if partition.fsType:
+                    self.layout = "none"
+                    self.partitions.append(partition)
+        finally:
+            self._map.close()
+
+    # Returns vLength bytes at vOffset (shorter if the image ends before that)
+    def Read(self, vOffset, vLength):
+        return self._map[vOffset:vOffset + vLength]
+
+    # Returns the name used for a partition of this image (disk.img:2)
+    def GetPartitionName(self, vPartition):
+        if vPartition.number == 0:
+            return self.path
+
+        return self.path + ":" + str(vPartition.number)
+
+    # Detects the partition table and reads the partitions in it
+    def ReadPartitionTable(self):
+        mbr = self.Read(0, 512)
+
+        if len(mbr) < 512 or mbr[510:512] != b"\x55\xaa":
+            return
+
+        entries = [struct.unpack_from("<BBBBBBBBII", mbr, 446 + 16 * i) for i in range(4)]
+
+        # A filesystem on the whole image (a FAT boot sector also ends with 55AA)
+        if mbr[54:57] == b"FAT" or mbr[82:87] == b"FAT32":
+            return
+
+        # A protective MBR means that the real table is the GPT behind it
+        if any(entry[4] == self._protectiveType for entry in entries):
+            for sectorSize in (512, 4096):
+                if self.Read(sectorSize, 8) == b"EFI PART":
+                    self._sectorSize = sectorSize
+                    self.ReadGpt()
+                    return
+
+        self.layout = "msdos"
+        diskSignature = struct.unpack_from("<I", mbr, 440)[0]
+
+        for i in range(len(entries)):
+            partitionType = entries[i][4]
+            firstSector = entries[i][8]
+            sectors = entries[i][9]
+
+            # Logical partitions inside of extended partitions aren't read
+            if partitionType == 0 or partitionType in self._extendedTypes:
+                continue
+
+            number = i + 1
+            partUuid = "%08x-%02x" % (diskSignature, number)
+
+            self.partitions.append(Partition(number, firstSector * self._sectorSize, sectors * self._sectorSize, partUuid))
+
+    # Reads the partition entries of a GPT
+    def ReadGpt(self):
+        header = self.Read(self._sectorSize, 92)
+        entriesLba, entryCount, entrySize = struct.unpack_from("<QII", header, 72)
+
+        # The header comes from the image, so it isn't trusted: the entries have to
+        # be at least 128 bytes, a multiple of 8, not absurdly many and inside the image
+        tableSize = entryCount * entrySize
+
+        if entrySize < 128 or entrySize % 8 or tableSize > self._maxTableSize or \
+            entriesLba * self._sectorSize + tableSize > len(self._map):
+            Output.Warn("The GPT header of " + self.path + " is invalid (" + str(entryCount) + " entries of " +
+                str(entrySize) + " bytes at LBA " + str(entriesLba) + "), its partitions are ignored.")
+            self.layout = "none"
+            return
+
+        self.layout = "gpt"
+
+        table = self.Read(entriesLba * self._sectorSize, entryCount * entrySize)
+
+        for i in range(entryCount):
+            entry = table[i * entrySize:(i + 1) * entrySize]
+
+            if len(entry) < 128 or entry[0:16] == b"\0" * 16:
+                continue
+
+            firstLba, lastLba = struct.unpack_from("<QQ", entry, 32)
+            partUuid = str(uuid.UUID(bytes_le=bytes(entry[16:32])))
+            partLabel = entry[56:128].decode("utf-16-le", "replace").split("\0", 1)[0]
+
+            self.partitions.append(Partition(i + 1, firstLba * self._sectorSize,
+                (lastLba - firstLba + 1) * self._sectorSize, partUuid, partLabel))
+
+    # Reads the filesystem type, UUID and label of a partition from its superblock
+    def ReadFilesystem(self, vPartition):
+        start = vPartition.start
+
+        # ext2/3/4: superblock at 1024, magic 0xEF53 at 56
+        superblock = self.Read(start + 1024, 256)
+
+        if len(superblock) == 256 and superblock[56:58] == b"\x53\xef":
+            vPartition.fsType = "ext4"
+            vPartition.fsUuid = str(uuid.UUID(bytes=bytes(superblock[104:120])))
+            vPartition.fsLabel = self.DecodeLabel(superblock[120:136])
+            return
+
+        bootSector = self.Read(start, 512)
+
+        # FAT32
+        if len(bootSector) == 512 and bootSector[82:87] == b"FAT32":
+            vPartition.fsType = "vfat"
+            vPartition.fsUuid = self.FormatFatId(bootSector[67:71])
+            vPartition.fsLabel = self.DecodeLabel(bootSector[71:82])
+            return
+
+        # FAT12/16
+        if len(bootSector) == 512 and bootSector[54:57] == b"FAT":
+            vPartition.fsType = "vfat"
+            vPartition.fsUuid = self.FormatFatId(bootSector[39:43])
+            vPartition.fsLabel = self.DecodeLabel(bootSector[43:54])
+            return
+
+        # XFS
+        if bootSector[0:4] == b"XFSB":
+            vPartition.fsType = "xfs"
+            vPartition.fsUuid = str(uuid.UUID(bytes=bytes(bootSector[32:48])))
+            vPartition.fsLabel = self.DecodeLabel(bootSector[108:120])
+            return
+
+        # btrfs: superblock at 64 KiB
+        superblock = self.Read(start + 0x10000, 0x1000)
+
+        if superblock[0x40:0x48] == b"_BHRfS_M":
+            vPartition.fsType = "btrfs"
+            vPartition.fsUuid = str(uuid.UUID(bytes=bytes(superblock[0x20:0x30])))
+            vPartition.fsLabel = self.DecodeLabel(superblock[0x12B:0x22B])
+
+    # Converts a FAT volume id to the form used by blkid (ABCD-1234)
+    @classmethod
+    def FormatFatId(cls, vBytes):
+        volumeId = "%08X" % struct.unpack("<I", vBytes)[0]
+        return volumeId[:4] + "-" + volumeId[4:]
+
+    # Decodes a fixed size, NUL/space padded label
+    @classmethod
+    def DecodeLabel(cls, vBytes):
+        return bytes(vBytes).split(b"\0", 1)[0].decode("utf-8", "replace").strip()
+
+    # Returns the partition matching this identifier type (UUID, PARTUUID, LABEL, PARTLABEL)
+    # and value, or None
+    def Find(self, vKind, vValue):
+        for partition in self.partitions:
+            if vKind == "UUID" and partition.fsUuid.lower() == vValue.lower():
+                return partition
+            elif vKind == "PARTUUID" and partition.partUuid.lower() == vValue.lower():
+                return partition
+            elif vKind == "LABEL" and partition.fsLabel == vValue:
+                return partition
+            elif vKind == "PARTLABEL" and partition.partLabel == vValue:
+                return partition
+
+        return None
+
+    # Returns the partition with this number, or None
+    def GetPartition(self, vNumber):
+        for partition in self.partitions:
+            if partition.number == vNumber:
+                return partition
+
+        return None
@@ -0,0 +1,22 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Raised when a configuration can't be generated. The command line prints the
+# message and exits, library users can catch it and carry on.
+class BlissBootError(Exception):
+    pass
+
+# Raised when the configuration file can't be loaded
+class ConfigError(BlissBootError):
+    pass
@@ -0,0 +1,57 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from libs.Renderer import Renderer
+
+# Generates an extlinux configuration (extlinux.conf)
+class ExtlinuxRenderer(Renderer):
+    name = "extlinux"
+    title = "extlinux"
+    defaultOutput = "extlinux.conf"
+
+    def RenderHeader(self, vKernels, vPosition):
+        # Gets the name of the default kernel
+        defaultKernelLabel = vKernels[vPosition].label
+        dossier = []
+
+        dossier.append("TIMEOUT " + str(int(self.config.timeout * 10)) + "\n")
+
+        if not self.config.extlinuxAutoBoot:
+            dossier.append("UI " + self.config.extlinuxUi + "\n")
+
+        dossier.append("\n")
+        dossier.append("DEFAULT " + defaultKernelLabel + str(vPosition) + "\n\n")
+        dossier.append("MENU TITLE " + self.config.extlinuxMenuTitle + "\n")
+        dossier.append("MENU COLOR title " + self.config.extlinuxTitleColor + "\n")
+        dossier.append("MENU COLOR border " + self.config.extlinuxBorderColor + "\n")
+        dossier.append("MENU COLOR unsel " + self.config.extlinuxUnselectedColor + "\n")
+        dossier.append("\n")
+
+        return "".join(dossier)
+
+    def RenderEntry(self, vKernel):
+        kernelPath = self.GetKernelPath(vKernel)
+        dossier = []
+
+        dossier.append("LABEL " + vKernel.label + str(vKernel.position) + "\n")
+        dossier.append("\tMENU LABEL " + vKernel.label + " - " + vKernel.version + "\n")
+        dossier.append("\tLINUX " + kernelPath + "/" + vKernel.kernelName + "\n")
+
+        if self.config.useInitrd:
+            dossier.append("\tINITRD " + kernelPath + "/" + vKernel.initrdName + "\n")
+
+        dossier.append("\tAPPEND " + vKernel.options + "\n")
+        dossier.append("\n")
+
+        return "".join(dossier)
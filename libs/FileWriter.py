@@ -0,0 +1,144 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import tempfile
+import threading
+
+from libs.Timings import Timings
+
+# Writes files atomically: the data goes to a temporary file in the same directory
+# which is synced and then renamed over the target. A crash in the middle leaves
+# either the old or the new file, never a truncated one.
+class FileWriter(object):
+    # The process umask, read once (see GetUmask)
+    _umask = None
+    _umaskLock = threading.Lock()
+
+    # Returns the umask of the process. Linux shows it in /proc/self/status, which
+    # doesn't change anything. Otherwise it can only be read by setting it, which
+    # changes it for every thread (mirrors are written from several threads), so
+    # that is only done once and under a lock.
+    @classmethod
+    def GetUmask(cls):
+        with cls._umaskLock:
+            if cls._umask is not None:
+                return cls._umask
+
+            try:
+                with open("/proc/self/status", "r") as status:
+                    for line in status:
+                        if line.startswith("Umask:"):
+                            cls._umask = int(line.split()[1], 8)
+                            break
+            except (OSError, ValueError, IndexError):
+                pass
+
+            if cls._umask is None:
+                cls._umask = os.umask(0o22)
+                os.umask(cls._umask)
+
+            return cls._umask
+
+    # Checks to see if the file already has exactly this content
+    @classmethod
+    def IsUnchanged(cls, vPath, vData):
+        try:
+            if os.stat(vPath).st_size != len(vData):
+                return 0
+
+            with open(vPath, "rb") as current:
+                return current.read() == vData
+        except OSError:
+            return 0
+
+    # Syncs a directory so that a rename inside of it is persisted
+    @classmethod
+    def SyncDirectory(cls, vDirectory):
+        try:
+            fd = os.open(vDirectory, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        except OSError:
+            return
+
+        try:
+            os.fsync(fd)
+            Timings.Count("fsyncs")
+        except OSError:
+            # Some filesystems don't support syncing directories
+            pass
+        finally:
+            os.close(fd)
+
+    # Writes the data (str or bytes) to the path. Returns 1 if the file was written
+    # or 0 if it already had the same content and was left alone.
+    @classmethod
+    def Write(cls, vPath, vData):
+        if isinstance(vData, str):
+            vData = vData.encode("utf-8")
+
+        if cls.IsUnchanged(vPath, vData):
+            return 0
+
+        # A symlink (grub.cfg -> /boot/efi/...) is followed, so that the file it points
+        # to is replaced and not the link itself
+        fullPath = os.path.realpath(vPath)
+        directory = os.path.dirname(fullPath)
+
+        # Keep the permissions and the owner of the file we are replacing, otherwise
+        # use the same permissions that a normal open() would have given us.
+        try:
+            info = os.stat(fullPath)
+            mode = stat.S_IMODE(info.st_mode)
+            owner = (info.st_uid, info.st_gid)
+        except OSError:
+            mode = 0o666 & ~cls.GetUmask()
+            owner = None
+
+        fd, temporaryPath = tempfile.mkstemp(prefix="." + os.path.basename(fullPath) + ".", suffix=".tmp", dir=directory)
+
+        try:
+            with os.fdopen(fd, "wb") as dossier:
+                dossier.write(vData)
+                dossier.flush()
+                os.fsync(dossier.fileno())
+
+            Timings.Count("bytesWritten", len(vData))
+            Timings.Count("fsyncs")
+
+            try:
+                os.chmod(temporaryPath, mode)
+            except OSError:
+                # Filesystems like FAT don't support permissions
+                pass
+
+            if owner:
+                try:
+                    os.chown(temporaryPath, owner[0], owner[1])
+                except OSError:
+                    # Only root can give a file away (and FAT has no owners)
+                    pass
+
+            os.replace(temporaryPath, fullPath)
+        except BaseException:
+            try:
+                os.unlink(temporaryPath)
+            except OSError:
+                pass
+
+            raise
+
+        cls.SyncDirectory(directory)
+
+        return 1
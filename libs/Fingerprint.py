@@ -0,0 +1,205 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+
+import libs.Variables as var
+
+from libs.Output import Output
+from libs.FileWriter import FileWriter
+from libs.Timings import Timings
+
+# A fingerprint of everything a run reads: the configuration file, the names and
+# mtimes of the files in the 'kernelDirectory', the /boot lines of the fstab and
+# mountinfo, the version and the arguments. After a successful run it is saved
+# with the digests of the outputs. If the next run has the same fingerprint and
+# the outputs weren't touched, there is nothing to do and it can stop before the
+# devices or the fstab are looked at.
+class Fingerprint(object):
+    # Exit code of a run that stopped early because nothing changed
+    UNCHANGED = 3
+
+    # vArguments: The options that change what is written (outputs, image, etc)
+    # vCacheDirectory: Where the state files are kept
+    def __init__(self, vConfig, vRoot="/", vArguments=None, vCacheDirectory=""):
+        self.config = vConfig
+        self.root = vRoot
+        self.arguments = vArguments or {}
+        self.cacheDirectory = vCacheDirectory or var.cacheDirectory
+
+        self.configPath = getattr(vConfig, "__file__", None) or ""
+        self.kernelDirectory = os.path.join(vRoot, vConfig.kernelDirectory.lstrip("/"))
+
+        # The same system can be generated for in different ways (another root or
+        # output), each of them keeps its own state
+        key = json.dumps([os.path.abspath(vRoot), os.path.abspath(self.configPath), self.arguments], sort_keys=True)
+        self.statePath = os.path.join(self.cacheDirectory, "state-" + hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+        self.value = ""
+
+    # Returns the SHA-256 of a file ("" if it can't be read)
+    @classmethod
+    def HashFile(cls, vPath):
+        digest = hashlib.sha256()
+
+        try:
+            with open(vPath, "rb") as dossier:
+                for chunk in iter(lambda: dossier.read(1 << 20), b""):
+                    digest.update(chunk)
+        except OSError:
+            return ""
+
+        return digest.hexdigest()
+
+    # Returns the digest of an output: the file, or the files we generate in a
+    # BLS directory. "" if it isn't there.
+    @classmethod
+    def GetOutputDigest(cls, vPath):
+        if not os.path.isdir(vPath):
+            return cls.HashFile(vPath)
+
+        entriesDirectory = os.path.join(vPath, "loader", "entries")
+        paths = [os.path.join(vPath, "loader", "loader.conf")]
+
+        try:
+            paths.extend(sorted(entry.path for entry in os.scandir(entriesDirectory) if entry.name.endswith(".conf")))
+        except OSError:
+            pass
+
+        digest = hashlib.sha256()
+
+        for path in paths:
+            digest.update((os.path.relpath(path, vPath) + " " + cls.HashFile(path) + "\n").encode("utf-8"))
+
+        return digest.hexdigest()
+
+    # Returns the lines of a mount table that are about /boot. vField is the
+    # position of the mount point in the line.
+    @classmethod
+    def GetMountLines(cls, vPath, vField):
+        lines = []
+
+        try:
+            with open(vPath, "r") as table:
+                for line in table:
+                    fields = line.split()
+
+                    if len(fields) > vField and fields[vField] == "/boot" and not fields[0].startswith("#"):
+                        lines.append(line.strip())
+        except OSError:
+            pass
+
+        return lines
+
+    # Returns the digest of the names, sizes and mtimes of everything in the
+    # 'kernelDirectory' (one level of kernel directories, like the scanner)
+    def GetListingDigest(self):
+        digest = hashlib.sha256()
+
+        try:
+            versions = sorted(os.scandir(self.kernelDirectory), key=lambda entry: entry.name)
+        except OSError:
+            return ""
+
+        for version in versions:
+            if not version.is_dir():
+                continue
+
+            try:
+                artifacts = sorted(os.scandir(version.path), key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            for artifact in artifacts:
+                try:
+                    info = artifact.stat()
+                except OSError:
+                    continue
+
+                digest.update((version.name + "/" + artifact.name + " " + str(info.st_size) + " " + str(info.st_mtime_ns) + "\n").encode("utf-8"))
+
+        return digest.hexdigest()
+
+    # Computes the fingerprint of the inputs
+    @Timings.Timed("Fingerprint")
+    def Compute(self):
+        try:
+            info = os.stat(self.configPath)
+            configStat = [info.st_size, info.st_mtime_ns]
+        except OSError:
+            configStat = []
+
+        # The live mounts only mean something when we are looking at the running system
+        mountInfo = []
+
+        if os.path.abspath(self.root) == "/":
+            mountInfo = self.GetMountLines("/proc/self/mountinfo", 4)
+
+        inputs = {
+            "version": var.version,
+            "arguments": self.arguments,
+            "config": [self.configPath, configStat, self.HashFile(self.configPath)],
+            "kernels": self.GetListingDigest(),
+            "fstab": self.GetMountLines(os.path.join(self.root, "etc/fstab"), 1),
+            "mountinfo": mountInfo,
+        }
+
+        self.value = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+        return self.value
+
+    # Checks to see if the inputs are the same as in the last successful run and
+    # the outputs still have the content that was written then
+    def IsUnchanged(self):
+        # Taken before anything is generated, so that a change during the run isn't missed next time
+        self.Compute()
+
+        try:
+            with open(self.statePath, "r") as dossier:
+                state = json.load(dossier)
+        except (OSError, ValueError):
+            return 0
+
+        if not isinstance(state, dict) or not isinstance(state.get("outputs"), dict) or not state["outputs"]:
+            return 0
+
+        if state.get("fingerprint") != self.value:
+            return 0
+
+        for path, digest in state["outputs"].items():
+            if not digest or self.GetOutputDigest(path) != digest:
+                Output.Debug("'" + path + "' was changed since the last run")
+                return 0
+
+        return 1
+
+    # Saves the fingerprint and the digests of the outputs after a successful run.
+    # Not being able to (for example when we aren't root) only means that the next
+    # run does all the work again.
+    def Save(self, vOutputs):
+        if not self.value:
+            self.Compute()
+
+        outputs = dict((os.path.abspath(path), self.GetOutputDigest(path)) for path in vOutputs)
+        state = {"fingerprint": self.value, "outputs": outputs}
+
+        try:
+            if not os.path.isdir(self.cacheDirectory):
+                os.makedirs(self.cacheDirectory)
+
+            FileWriter.Write(self.statePath, json.dumps(state, indent=4, sort_keys=True) + "\n")
+        except OSError as error:
+            Output.Debug("Unable to save the state to " + self.statePath + ": " + str(error))
@@ -0,0 +1,164 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+# A single mount entry, either from /etc/fstab or from /proc/self/mountinfo
+class FstabEntry(object):
+    __slots__ = ("device", "mountPoint", "fsType", "options", "dump", "passNo", "source")
+
+    def __init__(self, vDevice, vMountPoint, vFsType, vOptions="defaults", vDump="0", vPassNo="0", vSource="fstab"):
+        self.device = vDevice
+        self.mountPoint = vMountPoint
+        self.fsType = vFsType
+        self.options = vOptions
+        self.dump = vDump
+        self.passNo = vPassNo
+
+        # Where this entry came from: "fstab" or "mountinfo"
+        self.source = vSource
+
+    # Returns the entry as the six fstab fields
+    def ToList(self):
+        return [self.device, self.mountPoint, self.fsType, self.options, self.dump, self.passNo]
+
+    def __repr__(self):
+        return "FstabEntry(" + " ".join(self.ToList()) + ", source=" + self.source + ")"
+
+# Parses /etc/fstab and /proc/self/mountinfo without calling any external programs.
+# Both tables are only read once (per instance) and then served from the cache.
+class Fstab(object):
+    # Octal escapes used by fstab and the kernel for spaces, tabs, etc (\040 = ' ')
+    _escape = re.compile(r"\\([0-7]{3})")
+
+    # An empty vMountInfoPath means that only the fstab is used
+    def __init__(self, vFstabPath="/etc/fstab", vMountInfoPath="/proc/self/mountinfo"):
+        self._fstabPath = vFstabPath
+        self._mountInfoPath = vMountInfoPath
+
+        self._fstabEntries = None
+        self._mountEntries = None
+
+    # Returns the path of the fstab
+    def GetFstabPath(self):
+        return self._fstabPath
+
+    # Forgets the parsed tables so that they are read again on the next lookup
+    def ClearCache(self):
+        self._fstabEntries = None
+        self._mountEntries = None
+
+    # Decodes the octal escapes in a field: /mnt/my\040disk -> /mnt/my disk
+    @classmethod
+    def Unescape(cls, vField):
+        if "\\" not in vField:
+            return vField
+
+        return cls._escape.sub(lambda match: chr(int(match.group(1), 8)), vField)
+
+    # Parses an fstab formatted file and returns a list of FstabEntry
+    @classmethod
+    def ParseFstab(cls, vPath):
+        entries = []
+
+        try:
+            with open(vPath, "r") as fstab:
+                for line in fstab:
+                    line = line.strip()
+
+                    # Skip empty lines and comments
+                    if not line or line.startswith("#"):
+                        continue
+
+                    # Fields are separated by any amount of spaces and/or tabs
+                    fields = line.split()
+
+                    if len(fields) < 2:
+                        continue
+
+                    fields = [cls.Unescape(field) for field in fields[:6]]
+
+                    # The fs type, options, dump and pass fields are optional
+                    defaults = ["", "", "auto", "defaults", "0", "0"]
+                    fields = fields + defaults[len(fields):]
+
+                    entries.append(FstabEntry(fields[0], fields[1], fields[2], fields[3], fields[4], fields[5]))
+        except FileNotFoundError:
+            pass
+
+        return entries
+
+    # Parses a mountinfo formatted file (see proc(5)) and returns a list of FstabEntry
+    @classmethod
+    def ParseMountInfo(cls, vPath):
+        entries = []
+
+        if not vPath:
+            return entries
+
+        try:
+            with open(vPath, "r") as mountInfo:
+                for line in mountInfo:
+                    fields = line.split()
+
+                    # 36 35 98:0 /mnt1 /mnt2 rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+                    # The optional fields end with a single "-" separator.
+                    try:
+                        separator = fields.index("-", 6)
+                    except ValueError:
+                        continue
+
+                    if len(fields) < separator + 3:
+                        continue
+
+                    mountPoint = cls.Unescape(fields[4])
+                    options = fields[5]
+                    fsType = fields[separator + 1]
+                    device = cls.Unescape(fields[separator + 2])
+
+                    entries.append(FstabEntry(device, mountPoint, fsType, options, "0", "0", "mountinfo"))
+        except (FileNotFoundError, PermissionError):
+            pass
+
+        return entries
+
+    # Returns the (cached) entries in /etc/fstab
+    def GetFstabEntries(self):
+        if self._fstabEntries is None:
+            self._fstabEntries = self.ParseFstab(self._fstabPath)
+
+        return self._fstabEntries
+
+    # Returns the (cached) currently mounted filesystems
+    def GetMountEntries(self):
+        if self._mountEntries is None:
+            self._mountEntries = self.ParseMountInfo(self._mountInfoPath)
+
+        return self._mountEntries
+
+    # Returns the entry for this mount point. The live mount is preferred and
+    # /etc/fstab is used as a fallback. Returns None if it can't be found.
+    def FindMountPoint(self, vMountPoint):
+        mountPoint = vMountPoint.rstrip("/") or "/"
+
+        # If something is mounted on top of another mount, the last one wins
+        for entry in reversed(self.GetMountEntries()):
+            if entry.mountPoint == mountPoint:
+                return entry
+
+        for entry in self.GetFstabEntries():
+            if (entry.mountPoint.rstrip("/") or "/") == mountPoint:
+                return entry
+
+        return None
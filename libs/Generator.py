@@ -0,0 +1,263 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from libs.Output import Output
+from libs.Scanner import Scanner
+from libs.Manager import Manager
+from libs.Errors import BlissBootError
+from libs.FileWriter import FileWriter
+from libs.Timings import Timings
+
+# What a generation produced
+class GeneratorResult(object):
+    def __init__(self):
+        # The rendered configuration (empty if it was written instead)
+        self.text = ""
+
+        self.bootloader = ""
+        self.bootDrive = ""
+        self.driveLayout = ""
+
+        # Where the configuration was written and whether anything changed
+        self.output = ""
+        self.written = 0
+
+        # Position of the default kernel in 'kernels'
+        self.defaultPosition = -1
+
+        # The KernelEntry objects that were added, in order
+        self.kernels = []
+
+        # Kernels that were configured and found but couldn't be added: (label, version, reason)
+        self.skipped = []
+
+        # Command line references to devices that don't exist: (label, version, "parameter=reference")
+        self.unresolved = []
+
+        # What happened to every target when writing to mirrors: [(output, written, error)]
+        self.targets = []
+
+        # SHA-256 of the kernels and initrds when they were verified: [(path as seen by the bootloader, digest)]
+        self.digests = []
+
+# Library entry point. Everything a run needs lives in the instance, nothing
+# exits the process and errors are raised as BlissBootError, so it can be used
+# any number of times in the same process:
+#
+#     result = Generator(config, root="/mnt/image").Render()
+#     print(result.text)
+class Generator(object):
+    # vConfig: The configuration (a Config, or any object with the same attributes)
+    # vRoot: Directory that the configuration's paths are relative to
+    # vDevices / vFstab / vTopology: Lets a caller share the (cached) device index, mount tables and block device map
+    # vImage: A DiskImage to find the /boot partition and the layout in
+    def __init__(self, vConfig, vRoot="/", vDevices=None, vFstab=None, vImage=None, vTopology=None):
+        self.scanner = Scanner(vConfig, vRoot, vDevices, vFstab, vImage, vTopology)
+        self._scanned = 0
+
+        # Set by SetVerify
+        self.hasher = None
+        self.digestsFile = ""
+
+    # Scans the configuration and the 'kernelDirectory'. vShared is a scanner that
+    # already walked the same 'kernelDirectory', so that its listing can be reused.
+    def Scan(self, vShared=None):
+        # Find all the kernels that the user configured in their configuration file
+        self.scanner.FindKernelsInConfig()
+
+        # Find all the kernels in the user's boot directory (config.kernelDirectory),
+        # checking that the configured kernel and initrd files are present
+        if vShared is not None and vShared.kernelDirectory == self.scanner.kernelDirectory:
+            self.scanner.ShareBootKernels(vShared)
+        else:
+            self.scanner.FindBootKernels()
+
+        self._scanned = 1
+
+    # Finds the kernels that will be added to the configuration
+    def Match(self):
+        if not self._scanned:
+            self.Scan()
+
+        # Find all the kernels that were found in their boot directory and where a definition was found in their configuration file
+        self.scanner.FindCommonKernels()
+
+        # Checks to see that at least one kernel entry will be written
+        if self.scanner.AnyKernelsExist() == -1:
+            raise BlissBootError("Please add your desired kernels and their options to the 'kernels' list (or a matching rule to 'rules') in " +
+                self.scanner.configPath + ".\n" + "These entries should match the kernels you have in " +
+                self.scanner.kernelDirectory + ".")
+
+    # Checks that the devices the entries' command lines point to (root=, resume=,
+    # cryptdevice=, ZFS pools) exist. Depending on 'validateDevices' the problems
+    # are only reported ("warn") or nothing is written ("refuse"). Returns
+    # [(label, version, "parameter=reference")].
+    @Timings.Timed("CheckDevices")
+    def CheckDevices(self):
+        mode = getattr(self.scanner.config, "validateDevices", "off")
+
+        if mode == "off":
+            return []
+
+        # The devices of this system have nothing to do with an image tree
+        if os.path.abspath(self.scanner.root) != "/" and not self.scanner.image:
+            Output.Debug("Not checking the devices on the command lines of an image tree without -i")
+            return []
+
+        from libs.ReferenceChecker import ReferenceChecker
+
+        checker = ReferenceChecker(self.scanner.devices, self.scanner.image)
+        unresolved = [(kernel.label, kernel.version, parameter + "=" + reference)
+            for kernel, parameter, reference in checker.Check(self.scanner.GetCommonKernels())]
+
+        messages = [label + " - " + version + ": " + reference + " was not found" for label, version, reference in unresolved]
+
+        if unresolved and mode == "refuse":
+            raise BlissBootError("Some entries point to devices that don't exist:\n" + "\n".join(messages) +
+                "\nFix their options in " + self.scanner.configPath + " (or set 'validateDevices' to \"warn\").")
+
+        for message in messages:
+            Output.Warn(message)
+
+        return unresolved
+
+    # Verifies the kernels and initrds of every entry before anything is rendered.
+    # vDigestsFile: Also writes their digests there (sha256sum format, as used by grub's hashsum)
+    def SetVerify(self, vVerify=1, vDigestsFile="", vCachePath=""):
+        self.hasher = None
+        self.digestsFile = vDigestsFile
+
+        if vVerify or vDigestsFile:
+            from libs.ArtifactHasher import ArtifactHasher
+
+            self.hasher = ArtifactHasher(vCachePath)
+
+    # Computes the SHA-256 of the kernels and initrds of every entry. Returns
+    # [(path as seen by the bootloader, digest)] in the order of the entries.
+    @Timings.Timed("Verify")
+    def Verify(self):
+        kernelRoot = Manager.StripHead(self.scanner.config.kernelDirectory).rstrip("/")
+
+        # (path, path as seen by the bootloader, stat result when it was scanned)
+        artifacts = []
+
+        for kernel in self.scanner.GetCommonKernels():
+            names = [(kernel.kernelName, kernel.kernelStat)]
+
+            if self.scanner.config.useInitrd:
+                names.append((kernel.initrdName, kernel.initrdStat))
+
+            for name, info in names:
+                artifacts.append((os.path.join(self.scanner.kernelDirectory, kernel.version, name),
+                    kernelRoot + "/" + kernel.version + "/" + name, info))
+
+        Output.Print("Verifying " + str(len(artifacts)) + " kernels and initrds ...")
+
+        digests = self.hasher.Hash([(path, info) for path, bootPath, info in artifacts])
+
+        Output.Success("All of them are intact! (" + str(self.hasher.hashed) + " hashed, " + str(self.hasher.cached) + " from the cache)")
+
+        results = []
+        seen = set()
+
+        for path, bootPath, info in artifacts:
+            Output.Debug(digests[path] + "  " + bootPath)
+
+            if bootPath not in seen:
+                seen.add(bootPath)
+                results.append((bootPath, digests[path]))
+
+        if self.digestsFile:
+            FileWriter.Write(self.digestsFile, "".join(digest + "  " + path + "\n" for path, digest in results))
+            Output.Success("'" + self.digestsFile + "' has been written!")
+
+        return results
+
+    # Builds the result from the scanner's current state
+    def GetResult(self):
+        result = GeneratorResult()
+
+        result.bootloader = self.scanner.config.bootloader
+
+        # Only bootloaders that need the /boot drive cause it to be probed
+        if self.scanner.IsProbed():
+            result.bootDrive = self.scanner.GetBootDrive()
+            result.driveLayout = self.scanner.GetDriveLayout()
+
+        result.kernels = list(self.scanner.GetCommonKernels())
+        result.skipped = list(self.scanner.GetSkippedKernels())
+
+        for kernel in result.kernels:
+            if kernel.default == 1:
+                result.defaultPosition = kernel.position
+                break
+
+        return result
+
+    # Renders the configuration without writing anything and returns a GeneratorResult
+    def Render(self):
+        self.Match()
+
+        unresolved = self.CheckDevices()
+        digests = self.Verify() if self.hasher else []
+
+        text = Manager.RenderEntries(self.scanner)
+
+        result = self.GetResult()
+        result.text = text
+        result.digests = digests
+        result.unresolved = unresolved
+
+        return result
+
+    # Renders the configuration, writes it to vOutput (or the bootloader's
+    # default output) and returns a GeneratorResult
+    def Write(self, vOutput="", vForce=0):
+        self.Match()
+
+        # Nothing is written if a kernel or initrd can't be read (or a device is missing and that isn't allowed)
+        unresolved = self.CheckDevices()
+        digests = self.Verify() if self.hasher else []
+
+        output, written = Manager.WriteEntries(self.scanner, vOutput, vForce)
+
+        result = self.GetResult()
+        result.output = output
+        result.written = written
+        result.digests = digests
+        result.unresolved = unresolved
+
+        return result
+
+    # Renders the configuration once and writes it to every target in parallel.
+    # vTargets: [(output, drive)], drive is the partition that copy boots from
+    # ("" = the /boot drive). Failed targets are in result.targets, nothing is raised
+    # for them so that the caller sees what happened to the others as well.
+    def WriteMirrors(self, vTargets, vForce=0):
+        self.Match()
+
+        unresolved = self.CheckDevices()
+        digests = self.Verify() if self.hasher else []
+
+        targets = Manager.WriteMirrors(self.scanner, vTargets, vForce)
+
+        result = self.GetResult()
+        result.targets = targets
+        result.written = 1 if any(written for output, written, error in targets) else 0
+        result.digests = digests
+        result.unresolved = unresolved
+
+        return result
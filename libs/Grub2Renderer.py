@@ -0,0 +1,259 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from libs.Output import Output
+from libs.Renderer import Renderer
+
+# Generates a GRUB 2 configuration (grub.cfg)
+class Grub2Renderer(Renderer):
+    name = "grub2"
+    title = "GRUB 2"
+    defaultOutput = "grub.cfg"
+
+    # Characters that would change the meaning of the options once they are in a variable
+    _unsafeOptions = re.compile(r"[\"'\\$]")
+
+    # Words that GRUB reads the same with or without quotes
+    _plainWord = re.compile(r"^[A-Za-z0-9._+,/:=@%-]+$")
+
+    def __init__(self, vScanner, vKernelRoot):
+        Renderer.__init__(self, vScanner, vKernelRoot)
+        self.bootdrive = vScanner.GetGrub2BootDrive()
+
+        # Compact mode: the kernel prefix, the options and the modules are defined
+        # once and every entry calls the same function
+        self.compact = getattr(self.config, "grub2Compact", 0)
+
+        # Compact mode: the entries after the first N go into a submenu (0 = no submenu)
+        self.mainEntries = getattr(self.config, "grub2MainEntries", 0)
+
+        # Options -> name of the variable that holds them (compact mode)
+        self._optionNames = {}
+
+        # Find /boot by its UUID instead of trusting the disk order ("" = not used)
+        self.search = ""
+
+        if getattr(self.config, "grub2Search", 0) and not self.config.wholeDiskZfs:
+            self.search = vScanner.GetGrub2Search()
+
+            if not self.search:
+                Output.Warn("The UUID of " + vScanner.GetBootDrive() + " isn't known. Using set root='" + self.bootdrive + "' only ...")
+
+    # Returns a positive number if some entries go into the submenu
+    def HasSubmenu(self, vKernels):
+        if self.compact and self.mainEntries and len(vKernels) > self.mainEntries:
+            return 1
+
+        return 0
+
+    # Returns the modules that are only needed once an entry is booted
+    def RenderModules(self):
+        dossier = []
+
+        if self.config.efi:
+            dossier.append("insmod efi_gop\n")
+            dossier.append("insmod efi_uga\n")
+            dossier.append("insmod fat\n")
+
+        if self.config.wholeDiskZfs:
+            dossier.append("insmod zfs\n")
+
+        if self.config.goodyBag:
+            for candy in self.config.goodyBag:
+                dossier.append("insmod " + candy + "\n")
+
+        return "".join(dossier)
+
+    def RenderHeader(self, vKernels, vPosition):
+        driveLayout = self.scanner.GetDriveLayout()
+        dossier = []
+
+        dossier.append("set timeout=" + str(self.config.timeout) + "\n")
+
+        # An entry in the submenu is written as <submenu>><entry>
+        if self.HasSubmenu(vKernels) and vPosition >= self.mainEntries:
+            dossier.append("set default=\"" + str(self.mainEntries) + ">" + str(vPosition - self.mainEntries) + "\"\n")
+        else:
+            dossier.append("set default=" + str(vPosition) + "\n")
+
+        dossier.append("\n")
+
+        # Write the modules that need to be inserted depending
+        # drive style. For whole disk zfs, none will be returned
+        # since a person can partition the drive manually and use msdos,
+        # or they can let zfs format their drive automatically with
+        # gpt. This ambiguity will be the reason both grub modules will
+        # be inserted.
+
+        if driveLayout == "gpt":
+            dossier.append("insmod part_gpt\n")
+        elif driveLayout == "msdos":
+            dossier.append("insmod part_msdos\n")
+        elif driveLayout == "none":
+            dossier.append("insmod part_gpt\n")
+            dossier.append("insmod part_msdos\n")
+
+        # In compact mode they are loaded by the entry that is booted
+        if not self.compact:
+            dossier.append(self.RenderModules())
+
+        if not self.config.wholeDiskZfs:
+            dossier.append("\nset root='" + self.bootdrive + "'\n")
+
+            # The root above stays if the search doesn't find anything
+            if self.search:
+                dossier.append(self.search + "\n")
+
+        dossier.append("\n")
+
+        return "".join(dossier)
+
+    def RenderEntry(self, vKernel):
+        kernelPath = self.GetKernelPath(vKernel)
+        dossier = []
+
+        dossier.append("menuentry \"" + vKernel.label + " - " + vKernel.version + "\" {\n")
+
+        if self.config.wholeDiskZfs:
+            dossier.append("\tlinux " + self.bootdrive + "/@" + kernelPath + "/" + vKernel.kernelName + " " + vKernel.options + "\n")
+
+            if self.config.useInitrd:
+                dossier.append("\tinitrd " + self.bootdrive + "/@" + kernelPath + "/" + vKernel.initrdName + "\n")
+        else:
+            dossier.append("\tlinux " + kernelPath + "/" + vKernel.kernelName + " " + vKernel.options + "\n")
+
+            if self.config.useInitrd:
+                dossier.append("\tinitrd " + kernelPath + "/" + vKernel.initrdName + "\n")
+
+        dossier.append("}\n\n")
+
+        return "".join(dossier)
+
+    # Returns the path prefix of the kernels
+    def GetKernelPrefix(self):
+        if self.config.wholeDiskZfs:
+            return self.bootdrive + "/@" + self.kernelRoot
+
+        return self.kernelRoot
+
+    # Returns the text as a single GRUB word (single quoted unless it doesn't need to be)
+    @classmethod
+    def Quote(cls, vText):
+        if cls._plainWord.match(vText):
+            return vText
+
+        return "'" + vText.replace("'", "'\\''") + "'"
+
+    # Returns the variables and the function that the compact entries use. Options
+    # used by more than one entry get a variable. The variables are exported so
+    # that the entries (and the submenu) can see them.
+    def RenderDefinitions(self, vKernels):
+        counts = {}
+
+        for kernel in vKernels:
+            if not self._unsafeOptions.search(kernel.options):
+                counts[kernel.options] = counts.get(kernel.options, 0) + 1
+
+        self._optionNames = {}
+        names = ["bb_kernels"]
+        dossier = ["set bb_kernels=" + self.Quote(self.GetKernelPrefix()) + "\n"]
+
+        for options in counts:
+            if counts[options] > 1:
+                name = "bb_o" + str(len(self._optionNames))
+                self._optionNames[options] = name
+                names.append(name)
+                dossier.append("set " + name + "=" + self.Quote(options) + "\n")
+
+        dossier.append("export " + " ".join(names) + "\n\n")
+
+        # bb_load <version> <kernel> <initrd> <options>
+        dossier.append("function bb_load {\n")
+
+        for module in self.RenderModules().splitlines():
+            dossier.append("\t" + module + "\n")
+
+        dossier.append("\tlinux ${bb_kernels}/$1/$2 $4\n")
+
+        if self.config.useInitrd:
+            dossier.append("\tinitrd ${bb_kernels}/$1/$3\n")
+
+        dossier.append("}\n\n")
+
+        return "".join(dossier)
+
+    # Returns the text for a single kernel entry in compact mode
+    def RenderCompactEntry(self, vKernel):
+        # Options that can't go through a variable unchanged are written out. The
+        # header has no modules in compact mode (bb_load loads them), so the entry
+        # loads them itself.
+        if self._unsafeOptions.search(vKernel.options):
+            title, body = self.RenderEntry(vKernel).split("\n", 1)
+            modules = "".join("\t" + module + "\n" for module in self.RenderModules().splitlines())
+
+            return title + "\n" + modules + body.rstrip("\n") + "\n"
+
+        if vKernel.options in self._optionNames:
+            options = "\"$" + self._optionNames[vKernel.options] + "\""
+        else:
+            options = self.Quote(vKernel.options)
+
+        return "menuentry \"" + vKernel.label + " - " + vKernel.version + "\" {\n\tbb_load " + \
+            " ".join((self.Quote(vKernel.version), self.Quote(vKernel.kernelName), self.Quote(vKernel.initrdName), options)) + "\n}\n"
+
+    # In compact mode the body starts with the definitions, and the entries after
+    # the first 'grub2MainEntries' go into a submenu (GRUB only parses it when it
+    # is opened). The size of the entries is compared with the normal ones.
+    def RenderBodyChunks(self, vKernels):
+        if not self.compact:
+            yield from Renderer.RenderBodyChunks(self, vKernels)
+            return
+
+        definitions = self.RenderDefinitions(vKernels)
+
+        # The modules are in the definitions now instead of in the header
+        normalSize = len(self.RenderModules().encode("utf-8"))
+        compactSize = len(definitions.encode("utf-8"))
+
+        yield definitions
+
+        for i in range(len(vKernels)):
+            kernel = vKernels[i]
+
+            if i == self.mainEntries and self.HasSubmenu(vKernels):
+                chunk = "submenu \"Older kernels\" {\n"
+                compactSize = compactSize + len(chunk)
+                yield chunk
+
+            Output.Warn("Adding: " + kernel.label + " - " + kernel.version)
+
+            chunk = self.RenderCompactEntry(kernel)
+            normalSize = normalSize + len(self.RenderEntry(kernel).encode("utf-8"))
+            compactSize = compactSize + len(chunk.encode("utf-8"))
+
+            yield chunk
+
+        if self.HasSubmenu(vKernels):
+            compactSize = compactSize + 3
+            yield "}\n\n"
+
+        yield self.RenderFooter()
+
+        if normalSize:
+            change = (normalSize - compactSize) * 100.0 / normalSize
+
+            Output.Print("Compact mode: the entries take " + str(compactSize) + " bytes instead of " + str(normalSize) +
+                " (" + "%.1f" % abs(change) + "% " + ("smaller" if change >= 0 else "larger") + ")")
@@ -0,0 +1,55 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A kernel defined by the user in the configuration file
+# Example: ('Gentoo', '3.14.27-KS.01', 1, 'vmlinuz', 'initrd', 'root=/dev/sda1 quiet')
+class KernelEntry(object):
+    __slots__ = (
+        "label",
+        "version",
+        "default",
+        "kernelName",
+        "initrdName",
+        "options",
+
+        # Index of this kernel in the common kernel list (-1 if it isn't in it)
+        "position",
+
+        # os.stat_result of the kernel and initrd (None if not checked)
+        "kernelStat",
+        "initrdStat",
+    )
+
+    def __init__(self, vLabel, vVersion, vDefault, vKernelName, vInitrdName, vOptions):
+        self.label = vLabel
+        self.version = vVersion
+        self.default = vDefault
+        self.kernelName = vKernelName
+        self.initrdName = vInitrdName
+        self.options = vOptions
+        self.position = -1
+        self.kernelStat = None
+        self.initrdStat = None
+
+    # Creates an entry from a 'kernels' tuple in the configuration file
+    @classmethod
+    def FromTuple(cls, vKernel):
+        return cls(vKernel[0], vKernel[1], vKernel[2], vKernel[3], vKernel[4], vKernel[5])
+
+    # Returns the entry as a 'kernels' tuple
+    def ToTuple(self):
+        return (self.label, self.version, self.default, self.kernelName, self.initrdName, self.options)
+
+    def __repr__(self):
+        return "KernelEntry" + repr(self.ToTuple())
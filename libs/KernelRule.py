@@ -0,0 +1,91 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import re
+
+from libs.KernelEntry import KernelEntry
+
+# A kernel discovery rule from the 'rules' list in the configuration. Every kernel
+# directory that matches the rule (and isn't in the 'kernels' list) becomes an
+# entry built from the rule's templates:
+#
+#     {"match": "*-gentoo", "label": "Gentoo", "options": "root=/dev/sda1 quiet", "keep": 3, "default": "newest"}
+class KernelRule(object):
+    # Only the digits and everything else between them matter for the version order
+    _chunks = re.compile(r"(\d+)")
+
+    # Text that starts a pre-release (6.1-rc7, 6.1~rc7, 6.1_pre1), which comes before the release itself
+    _preRelease = re.compile(r"^[-~_.]?(rc|pre|alpha|beta)", re.IGNORECASE)
+
+    # vRule: A validated rule (see Config.ValidateRules)
+    def __init__(self, vRule, vIndex):
+        self.index = vIndex
+
+        if vRule["regex"]:
+            self.pattern = vRule["regex"]
+            self._match = re.compile(vRule["regex"]).search
+        else:
+            self.pattern = vRule["match"]
+            self._match = re.compile(fnmatch.translate(vRule["match"])).match
+
+        self.label = vRule["label"]
+        self.kernel = vRule["kernel"]
+        self.initrd = vRule["initrd"]
+        self.options = vRule["options"]
+
+        # Only keep the newest N kernels of this rule (0 = all of them)
+        self.keep = vRule["keep"]
+
+        # "newest" makes the newest kernel the default (if no other kernel is)
+        self.default = vRule["default"]
+
+    # Returns a KernelEntry for this kernel directory, or None if the rule doesn't match it
+    def Match(self, vVersion):
+        match = self._match(vVersion)
+
+        if not match:
+            return None
+
+        fields = match.groupdict("")
+        fields["version"] = vVersion
+
+        return KernelEntry(self.label.format_map(fields), vVersion, 0, self.kernel.format_map(fields),
+            self.initrd.format_map(fields), self.options.format_map(fields))
+
+    # Returns the key that sorts versions naturally (5.4.9 < 5.4.10 < 5.10.1), with
+    # pre-releases before their release and local suffixes (-gentoo, -r1) after it,
+    # but before the next point release: 6.1-rc7 < 6.1 < 6.1-gentoo < 6.1-gentoo-r1 < 6.1.1
+    # It is computed once per version and kept by the caller.
+    #
+    # Every chunk is (rank, number, text): a pre-release marker (0) sorts below the
+    # end of the version (1), which sorts below a number (2) or any other text (3).
+    @classmethod
+    def GetVersionKey(cls, vVersion):
+        key = []
+
+        for chunk in cls._chunks.split(vVersion):
+            if not chunk:
+                continue
+
+            if chunk.isdigit():
+                key.append((2, int(chunk), ""))
+            elif cls._preRelease.match(chunk):
+                key.append((0, 0, chunk.lstrip("-~_.").lower()))
+            else:
+                key.append((3, 0, chunk))
+
+        key.append((1, 0, ""))
+
+        return tuple(key)
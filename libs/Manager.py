@@ -13,189 +13,161 @@
 # limitations under the License.
 
 import os
+import sys
 
-from libs.Tools import Tools
-from libs.Scanner import Scanner
+from concurrent.futures import ThreadPoolExecutor
 
-import libs.ConfigLoader as ConfigLoader
-import libs.Variables as var
-
-config = ConfigLoader.GetConfigModule()
+from libs.Output import Output
+from libs.Errors import BlissBootError
+from libs.Timings import Timings
+from libs.Grub2Renderer import Grub2Renderer
+from libs.ExtlinuxRenderer import ExtlinuxRenderer
+from libs.BlsRenderer import BlsRenderer
 
 class Manager(object):
-    # Generates the bootloader configuration
+    # Bootloader backends, keyed by the 'bootloader' value in the configuration file
+    _renderers = {
+        Grub2Renderer.name: Grub2Renderer,
+        ExtlinuxRenderer.name: ExtlinuxRenderer,
+        BlsRenderer.name: BlsRenderer,
+    }
+
+    # Adds (or replaces) a bootloader backend
     @classmethod
-    def WriteEntries(cls):
-        outputFile = ""
-        driveLayout = Scanner.GetDriveLayout()
-        isOutput = Tools.IsOutputSet()
-
-        if isOutput:
-            outputFile = Tools.GetOutputFile()
-
-            # Check to see if the directory for this file exists. If it doesn't
-            # create any directories leading up to the output file so that we don't
-            # get a "FileNotFoundError" later on
-            outputFileFullPath = os.path.abspath(outputFile)
-            outputFileParentDir = os.path.dirname(outputFileFullPath)
-
-            if not os.path.exists(outputFileParentDir):
-                cls.CreateOutputDirectory(outputFileParentDir)
-        elif not isOutput and config.bootloader == "grub2":
-            outputFile = "grub.cfg"
-        elif not isOutput and config.bootloader == "extlinux":
-            outputFile = "extlinux.conf"
-
-        # Check to see what's the bootloader before we start adding
-        # all the entries, depending the bootloader we can cleanly start
-        # adding generic information like default kernel, timeouts, etc
-        position = Scanner.FindDefaultKernel()
-
-        if position != -1:
-            if config.bootloader == "grub2":
-                Tools.Print("Generating GRUB 2 configuration ...")
-
-                bootdrive = Scanner.GetGrub2BootDrive()
-
-                if os.path.exists(outputFile):
-                    if Tools.IsForceSet():
-                        dossier = open(outputFile, "w")
-                    else:
-                        Tools.Fail("Target file: " + outputFile + " already exists. Pass -f to overwrite.")
-                else:
-                    dossier = open(outputFile, "w")
-
-                dossier.write("set timeout=" + str(config.timeout) + "\n")
-                dossier.write("set default=" + str(position) + "\n")
-                dossier.write("\n")
-
-                # Write the modules that need to be inserted depending
-                # drive style. For whole disk zfs, none will be returned
-                # since a person can partition the drive manually and use msdos,
-                # or they can let zfs format their drive automatically with
-                # gpt. This ambiguity will be the reason both grub modules will
-                # be inserted.
-
-                if driveLayout == "gpt":
-                    dossier.write("insmod part_gpt\n")
-                elif driveLayout == "msdos":
-                    dossier.write("insmod part_msdos\n")
-                elif driveLayout == "none":
-                    dossier.write("insmod part_gpt\n")
-                    dossier.write("insmod part_msdos\n")
-
-                if config.efi:
-                    dossier.write("insmod efi_gop\n")
-                    dossier.write("insmod efi_uga\n")
-                    dossier.write("insmod fat\n")
-
-                if config.wholeDiskZfs:
-                    dossier.write("insmod zfs\n")
-
-                if config.goodyBag:
-                    for candy in config.goodyBag:
-                        dossier.write("insmod " + candy + "\n")
-
-                if not config.wholeDiskZfs:
-                    dossier.write("\nset root='" + bootdrive + "'\n")
-
-                dossier.write("\n")
-                dossier.close()
-            elif config.bootloader == "extlinux":
-                Tools.Print("Generating extlinux configuration ...")
-
-                # Gets the name of the default kernel
-                defaultKernelLabel = Scanner.GetKernel(position)[0]
-
-                if os.path.exists(outputFile):
-                    if Tools.IsForceSet():
-                        dossier = open(outputFile, "w")
-                    else:
-                        Tools.Fail("Target file: " + outputFile + " already exists. Pass -f to overwrite.")
-                else:
-                    dossier = open(outputFile, "w")
-
-                dossier.write("TIMEOUT " + str(int(config.timeout * 10)) + "\n")
-
-                if not config.extlinuxAutoBoot:
-                    dossier.write("UI " + config.extlinuxUi + "\n")
-
-                dossier.write("\n")
-                dossier.write("DEFAULT " + defaultKernelLabel + str(position) + "\n\n")
-                dossier.write("MENU TITLE " + config.extlinuxMenuTitle + "\n")
-                dossier.write("MENU COLOR title " + config.extlinuxTitleColor + "\n")
-                dossier.write("MENU COLOR border " + config.extlinuxBorderColor + "\n")
-                dossier.write("MENU COLOR unsel " + config.extlinuxUnselectedColor + "\n")
-                dossier.write("\n")
-                dossier.close()
-            else:
-                Tools.Fail("The bootloader defined in " + ConfigLoader.GetConfigFilePath() + " is not supported.")
-        else:
-            Tools.Fail("The default kernel entry in " + ConfigLoader.GetConfigFilePath() + " was not found in " + config.kernelDirectory)
-
-        # Add all our desired kernels
-        for kernel in Scanner.GetCommonKernels():
-            # Get the position so that we can create the labels correctly
-            position = Scanner.GetKernelIndexInCommonList(kernel)
-
-            Tools.Warn("Adding: " + kernel[0] + " - " + kernel[1])
-
-            cs = cls.StripHead(config.kernelDirectory)
-            kernelPath = cs + "/" + kernel[1]
-
-            # Depending the bootloader we have specified, generate
-            # its appropriate configuration.
-            if config.bootloader == "grub2":
-                # Open it in append mode since the header was previously
-                # created before.
-                dossier = open(outputFile, "a")
-                dossier.write("menuentry \"" + kernel[0] + " - " + kernel[1] + "\" {\n")
-
-                if config.wholeDiskZfs:
-                    dossier.write("\tlinux " + bootdrive + "/@" + kernelPath + "/" + kernel[3] + " " + kernel[5] + "\n")
-
-                    if config.useInitrd:
-                        dossier.write("\tinitrd " + bootdrive + "/@" + kernelPath + "/" + kernel[4] + "\n")
-                else:
-                    dossier.write("\tlinux " + kernelPath + "/" + kernel[3] + " " + kernel[5] + "\n")
-
-                    if config.useInitrd:
-                        dossier.write("\tinitrd " + kernelPath + "/" + kernel[4] + "\n")
-
-                dossier.write("}\n\n")
-                dossier.close()
-            elif config.bootloader == "extlinux":
-                dossier = open(outputFile, "a")
-                dossier.write("LABEL " + kernel[0] + str(position) + "\n")
-                dossier.write("\tMENU LABEL " + kernel[0] + " - " + kernel[1] + "\n")
-                dossier.write("\tLINUX " + kernelPath + "/" + kernel[3] + "\n")
-
-                if config.useInitrd:
-                    dossier.write("\tINITRD " + kernelPath + "/" + kernel[4] + "\n")
-
-                dossier.write("\tAPPEND " + kernel[5] + "\n")
-                dossier.write("\n")
-                dossier.close()
-
-        # Append anything else the user wants automatically added
-        if config.append and config.appendStuff:
-            Tools.Print("Appending additional information ...")
-
-            if config.bootloader == "grub2":
-                dossier = open(outputFile, "a")
-                dossier.write(config.appendStuff)
-                dossier.close()
-            elif config.bootloader == "extlinux":
-                dossier = open(outputFile, "a")
-                dossier.write(config.appendStuff)
-                dossier.close()
-
-        # Check to make sure that the file was created successfully.
-        # If so let the user know..
-        if os.path.isfile(outputFile):
-            Tools.Success("'" + outputFile + "' has been created!")
-        else:
-            Tools.Fail("Either the file couldn't be created or the specified bootloader isn't supported.")
+    def RegisterRenderer(cls, vRenderer):
+        cls._renderers[vRenderer.name] = vRenderer
+
+    # Returns the backend for the bootloader in this scanner's configuration
+    @classmethod
+    def GetRenderer(cls, vScanner):
+        renderer = cls._renderers.get(vScanner.config.bootloader)
+
+        if not renderer:
+            raise BlissBootError("The bootloader defined in " + vScanner.configPath + " is not supported.")
+
+        return renderer(vScanner, cls.StripHead(vScanner.config.kernelDirectory))
+
+    # Returns the position of the default kernel
+    @classmethod
+    def GetDefaultPosition(cls, vScanner):
+        position = vScanner.FindDefaultKernel()
+
+        if position == -1:
+            raise BlissBootError("The default kernel entry in " + vScanner.configPath + " was not found in " + vScanner.kernelDirectory)
+
+        return position
+
+    # Returns the whole configuration as a string
+    @classmethod
+    @Timings.Timed("RenderEntries")
+    def RenderEntries(cls, vScanner):
+        renderer = cls.GetRenderer(vScanner)
+        position = cls.GetDefaultPosition(vScanner)
+
+        Output.Print("Generating " + renderer.title + " configuration ...")
+
+        return renderer.Render(vScanner.GetCommonKernels(), position)
+
+    # Streams the configuration to vStream as it is rendered. Returns the number of bytes written.
+    @classmethod
+    def StreamEntries(cls, vScanner, vStream):
+        renderer = cls.GetRenderer(vScanner)
+        position = cls.GetDefaultPosition(vScanner)
+
+        Output.Print("Generating " + renderer.title + " configuration ...")
+
+        return renderer.Stream(vStream, vScanner.GetCommonKernels(), position)
+
+    # Generates the bootloader configuration and writes it to vOutputFile (or the
+    # bootloader's default output). "-" streams it to stdout instead. Returns the
+    # path that was written and whether anything changed.
+    @classmethod
+    @Timings.Timed("WriteEntries")
+    def WriteEntries(cls, vScanner, vOutputFile="", vForce=0):
+        if vOutputFile == "-":
+            cls.StreamEntries(vScanner, sys.stdout)
+            return vOutputFile, 1
+
+        renderer = cls.GetRenderer(vScanner)
+        outputFile = renderer.defaultOutput
+
+        if vOutputFile:
+            outputFile = vOutputFile
+            cls.PrepareOutput(outputFile)
+
+        # Find the default kernel before we start adding all the entries so
+        # that the generic information (default kernel, timeouts, etc) can be added
+        position = cls.GetDefaultPosition(vScanner)
+
+        Output.Print("Generating " + renderer.title + " configuration ...")
+
+        written = renderer.Write(outputFile, vScanner.GetCommonKernels(), position, vForce)
+
+        return outputFile, written
+
+    # Renders the configuration once and writes it to every target in parallel.
+    # vTargets: [(output, drive)]. Every target gets the header for its own boot
+    # drive ("" = the /boot drive). Returns [(output, written, error)] in the
+    # order of the targets; a failed target doesn't stop the others.
+    @classmethod
+    @Timings.Timed("WriteMirrors")
+    def WriteMirrors(cls, vScanner, vTargets, vForce=0):
+        if any(output == "-" for output, drive in vTargets):
+            raise BlissBootError("The configuration can only be streamed to stdout ('-') on its own.")
+
+        renderer = cls.GetRenderer(vScanner)
+        position = cls.GetDefaultPosition(vScanner)
+        kernels = vScanner.GetCommonKernels()
+
+        Output.Print("Generating " + renderer.title + " configuration for " + str(len(vTargets)) + " targets ...")
+
+        body = renderer.RenderBody(kernels)
+
+        # The drives are probed here, one after another, the threads only write
+        jobs = []
+
+        for output, drive in vTargets:
+            try:
+                scanner = vScanner.GetMirror(drive) if drive else vScanner
+                jobs.append((output, cls.GetRenderer(scanner), ""))
+            except BlissBootError as error:
+                jobs.append((output, None, str(error)))
+
+        def WriteTarget(vJob):
+            output, targetRenderer, error = vJob
+
+            if targetRenderer is None:
+                return output, 0, error
+
+            try:
+                cls.PrepareOutput(output)
+                return output, targetRenderer.Write(output, kernels, position, vForce, body), ""
+            except (BlissBootError, OSError) as error:
+                return output, 0, str(error)
+
+        with ThreadPoolExecutor(max_workers=min(len(jobs), 8) or 1) as pool:
+            results = list(pool.map(WriteTarget, jobs))
+
+        for output, written, error in results:
+            if error:
+                Output.Warn("'" + output + "' failed: " + error)
+
+        failed = len([output for output, written, error in results if error])
+        written = len([output for output, written, error in results if written])
+
+        Output.Print(str(len(results)) + " targets: " + str(written) + " written, " + str(len(results) - written - failed) +
+            " unchanged, " + str(failed) + " failed")
+
+        return results
+
+    # Creates the directories leading up to the output file if they don't exist,
+    # so that we don't get a "FileNotFoundError" later on
+    @classmethod
+    def PrepareOutput(cls, vOutputFile):
+        outputFileParentDir = os.path.dirname(os.path.abspath(vOutputFile))
+
+        if not os.path.exists(outputFileParentDir):
+            cls.CreateOutputDirectory(outputFileParentDir)
 
     # Strips the first directory of the path passed. Used to get a good path and not need
     # a boot symlink in /boot
@@ -217,7 +189,7 @@ class Manager(object):
                 # so just return /
                 return "/"
         else:
-            Tools.Fail("The value to strip is empty ...")
+            raise BlissBootError("The value to strip is empty ...")
 
     # Creates all the directories needed so that the output file can be written
     @classmethod
@@ -226,4 +198,4 @@ class Manager(object):
             os.makedirs(vParentDirectory)
 
             if not os.path.exists(vParentDirectory):
-                Tools.Fail("Unable to create the " + vParentDirectory + " directory ...")
+                raise BlissBootError("Unable to create the " + vParentDirectory + " directory ...")
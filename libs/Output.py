@@ -0,0 +1,143 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+# Provides the in-process output layer (log levels, colors, buffered writes).
+# Nothing in here spawns a process, the messages are written straight to the
+# python streams which are flushed when needed (or when the program exits).
+class Output(object):
+    # Log levels
+    QUIET = 0
+    NORMAL = 1
+    VERBOSE = 2
+
+    _level = NORMAL
+
+    # None = Automatically decide depending if the stream is a terminal
+    _useColor = None
+
+    # Where messages go. None = stdout, unless stdout carries the configuration itself.
+    _stream = None
+
+    _colors = {
+        "red": "\033[1;31m",
+        "yellow": "\033[1;33m",
+        "green": "\033[1;32m",
+        "cyan": "\033[1;36m",
+        "purple": "\033[1;34m",
+    }
+
+    _reset = "\033[0;m"
+
+    # The message that the program failed with ("" if it didn't)
+    _failure = ""
+
+    # Sets the log level (QUIET, NORMAL, VERBOSE)
+    @classmethod
+    def SetLevel(cls, vLevel):
+        cls._level = vLevel
+
+    # Gets the current log level
+    @classmethod
+    def GetLevel(cls):
+        return cls._level
+
+    # Sends the messages to another stream (stderr when the configuration is streamed to stdout)
+    @classmethod
+    def SetStream(cls, vStream):
+        cls._stream = vStream
+
+    # Forces colors on (1) or off (0). Passing None goes back to auto detection.
+    @classmethod
+    def SetColor(cls, vUseColor):
+        cls._useColor = vUseColor
+
+    # Checks to see if we should send color codes to this stream. Colors are
+    # disabled when the stream isn't a terminal or when NO_COLOR is set.
+    @classmethod
+    def IsColorEnabled(cls, vStream):
+        if cls._useColor is not None:
+            return cls._useColor
+
+        if "NO_COLOR" in os.environ:
+            return 0
+
+        try:
+            return vStream.isatty()
+        except (AttributeError, ValueError):
+            return 0
+
+    # Returns the message that the program failed with ("" if it didn't)
+    @classmethod
+    def GetFailure(cls):
+        return cls._failure
+
+    # Returns the string with a color to be used in a terminal
+    @classmethod
+    def Colorize(cls, vColor, vMessage, vStream=None):
+        if vStream is None:
+            vStream = sys.stdout
+
+        if vColor == "none" or not cls.IsColorEnabled(vStream):
+            return vMessage
+
+        return cls._colors[vColor] + vMessage + cls._reset
+
+    # Writes a message to the stream if the current log level allows it
+    @classmethod
+    def Write(cls, vLevel, vColor, vMessage, vStream=None):
+        if cls._level < vLevel:
+            return
+
+        if vStream is None:
+            vStream = cls._stream or sys.stdout
+
+        vStream.write(cls.Colorize(vColor, vMessage, vStream) + "\n")
+
+    # Flushes any pending output
+    @classmethod
+    def Flush(cls):
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    # Prints a message
+    @classmethod
+    def Print(cls, vMessage):
+        cls.Write(cls.NORMAL, "cyan", vMessage)
+
+    # Used for successful entries
+    @classmethod
+    def Success(cls, vMessage):
+        cls.Write(cls.NORMAL, "green", vMessage)
+
+    # Used for warnings
+    @classmethod
+    def Warn(cls, vMessage):
+        cls.Write(cls.NORMAL, "yellow", vMessage)
+
+    # Used for extra information only shown with --verbose
+    @classmethod
+    def Debug(cls, vMessage):
+        cls.Write(cls.VERBOSE, "purple", vMessage)
+
+    # Prints the error (even when quiet) and cleanly exits the application
+    @classmethod
+    def Fail(cls, vMessage):
+        cls._failure = vMessage
+        sys.stdout.flush()
+        cls.Write(cls.QUIET, "red", vMessage, sys.stderr)
+        cls.Flush()
+        quit(1)
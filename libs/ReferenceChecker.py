@@ -0,0 +1,163 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from libs.Devices import Devices
+
+# Finds the devices that the kernel command lines point to (root=, resume=,
+# cryptdevice=, ZFS datasets) and checks that they exist. Everything is resolved
+# against the same device index (or disk image), and every reference is only
+# resolved once no matter how many entries use it.
+class ReferenceChecker(object):
+    # Parameters whose value is a device (or a ZFS dataset for root)
+    _deviceKeys = ("root", "real_root", "resume", "real_resume", "crypt_root", "crypt_swap")
+
+    # vDevices: The device index
+    # vImage: A DiskImage to resolve the identifiers in instead (plain /dev paths aren't checked then)
+    def __init__(self, vDevices, vImage=None):
+        self.devices = vDevices
+        self.image = vImage
+
+        # Reference -> 1 if it exists, 0 if it doesn't
+        self._results = {}
+
+    # Splits a command line into its parameters. Double quotes keep spaces in a
+    # value, like the kernel does: foo="a b" -> foo=a b
+    @classmethod
+    def Split(cls, vOptions):
+        parameters = []
+        current = []
+        isQuoted = 0
+
+        for character in vOptions:
+            if character == "\"":
+                isQuoted = not isQuoted
+            elif character.isspace() and not isQuoted:
+                if current:
+                    parameters.append("".join(current))
+                    current = []
+            else:
+                current.append(character)
+
+        if current:
+            parameters.append("".join(current))
+
+        return parameters
+
+    # Returns the device references in a command line: [(parameter, reference)].
+    # A reference is an identifier (UUID=...), a /dev path or ZFS=<dataset>.
+    # Also returns the /dev/mapper names that the command line itself opens.
+    @classmethod
+    def GetReferences(cls, vOptions):
+        references = []
+        mappedNames = set()
+
+        for parameter in cls.Split(vOptions):
+            key, separator, value = parameter.partition("=")
+
+            if not separator or not value:
+                continue
+
+            if key in cls._deviceKeys:
+                # root=ZFS=tank/gentoo/root (genkernel) or root=zfs:tank/gentoo/root (dracut)
+                if value.startswith("ZFS=") or value.startswith("zfs:"):
+                    dataset = value[4:]
+
+                    if dataset and dataset != "AUTO":
+                        references.append((key, "ZFS=" + dataset))
+
+                    continue
+
+                references.append((key, value))
+
+            # cryptdevice=<device>:<name>[:options] (the encrypt hook)
+            elif key == "cryptdevice":
+                splinters = value.split(":")
+                references.append((key, splinters[0]))
+
+                if len(splinters) > 1 and splinters[1]:
+                    mappedNames.add("/dev/mapper/" + splinters[1])
+
+            # rd.luks.uuid=[luks-]<uuid> (dracut)
+            elif key == "rd.luks.uuid":
+                uuid = value[len("luks-"):] if value.startswith("luks-") else value
+                references.append((key, "UUID=" + uuid))
+                mappedNames.add("/dev/mapper/luks-" + uuid)
+
+        # PARTUUID=<uuid>/PARTNROFF=<n> points relative to that partition
+        references = [(key, reference.split("/", 1)[0] if reference.upper().startswith("PARTUUID=") else reference)
+            for key, reference in references]
+
+        # Only things we know how to look up: identifiers, devices and datasets
+        references = [(key, reference) for key, reference in references
+            if reference.startswith("/dev/") or reference.startswith("ZFS=") or cls.IsIdentifier(reference)]
+
+        return references, mappedNames
+
+    # Checks to see if a reference is an identifier (UUID=, PARTUUID=, LABEL=, PARTLABEL=)
+    @classmethod
+    def IsIdentifier(cls, vReference):
+        kind, value = cls.ParseReference(vReference)
+        return 1 if kind else 0
+
+    # Splits a reference into its identifier type and value ("" for anything else)
+    @classmethod
+    def ParseReference(cls, vReference):
+        return Devices.ParseIdentifier(vReference)
+
+    # Looks up an identifier type and value in the device index (or the image)
+    def Lookup(self, vKind, vValue):
+        if self.image:
+            return 1 if self.image.Find(vKind, vValue) else 0
+
+        return 1 if self.devices.Lookup(vKind, vValue) else 0
+
+    # Returns 1 if the reference exists, 0 if it doesn't
+    def Resolve(self, vReference):
+        if vReference in self._results:
+            return self._results[vReference]
+
+        if vReference.startswith("ZFS="):
+            # Only the pool can be checked without the zfs tools: its members are
+            # labeled with the pool's name
+            result = self.Lookup("LABEL", vReference[4:].split("/", 1)[0])
+        elif vReference.startswith("/dev/"):
+            # The devices of the running system don't say anything about the image
+            result = 1 if self.image or os.path.exists(vReference) else 0
+        else:
+            kind, value = self.ParseReference(vReference)
+            result = self.Lookup(kind, value)
+
+        self._results[vReference] = result
+
+        return result
+
+    # Checks the command lines of these kernels. Returns the references that
+    # don't exist: [(kernel, parameter, reference)]
+    def Check(self, vKernels):
+        problems = []
+
+        for kernel in vKernels:
+            references, mappedNames = self.GetReferences(kernel.options)
+
+            for parameter, reference in references:
+                # Opened by the initramfs from this same command line
+                if reference in mappedNames:
+                    continue
+
+                if not self.Resolve(reference):
+                    problems.append((kernel, parameter, reference))
+
+        return problems
@@ -0,0 +1,142 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import os
+
+from libs.Output import Output
+from libs.Errors import BlissBootError
+from libs.FileWriter import FileWriter
+from libs.Timings import Timings
+
+# Base class for the bootloader backends. A renderer turns the common kernel list
+# into the bootloader's configuration and knows how to write it to the output.
+# Backends that generate a single file only need to implement RenderHeader and
+# RenderEntry, the rest is shared.
+class Renderer(object, metaclass=abc.ABCMeta):
+    # Value of 'bootloader' in the configuration file
+    name = ""
+
+    # Human readable name of the bootloader
+    title = ""
+
+    # Where the configuration is written when -o isn't passed
+    defaultOutput = ""
+
+    def __init__(self, vScanner, vKernelRoot):
+        self.scanner = vScanner
+        self.config = vScanner.config
+
+        # Kernel directory as seen by the bootloader (/boot/kernels -> /kernels)
+        self.kernelRoot = vKernelRoot
+
+    # Returns the directory of this kernel as seen by the bootloader
+    def GetKernelPath(self, vKernel):
+        return self.kernelRoot + "/" + vKernel.version
+
+    # Returns the text that goes before the kernel entries (timeouts, default kernel, etc)
+    def RenderHeader(self, vKernels, vPosition):
+        return ""
+
+    # Returns the text for a single kernel entry
+    @abc.abstractmethod
+    def RenderEntry(self, vKernel):
+        pass
+
+    # Returns anything else the user wants automatically added
+    def RenderFooter(self):
+        if self.config.append and self.config.appendStuff:
+            Output.Print("Appending additional information ...")
+            return self.config.appendStuff
+
+        return ""
+
+    # Yields the configuration in chunks: the header, one chunk per entry and then
+    # the footer. Nothing else holds on to the chunks, so a stream only ever needs
+    # one entry in memory.
+    def RenderChunks(self, vKernels, vPosition):
+        yield self.RenderHeader(vKernels, vPosition)
+        yield from self.RenderBodyChunks(vKernels)
+
+    # Yields everything after the header: the entries and then the footer
+    def RenderBodyChunks(self, vKernels):
+        for kernel in vKernels:
+            Output.Warn("Adding: " + kernel.label + " - " + kernel.version)
+            yield self.RenderEntry(kernel)
+
+        yield self.RenderFooter()
+
+    # Returns everything after the header. It doesn't depend on the boot drive,
+    # so all the mirrors can share it.
+    def RenderBody(self, vKernels):
+        return "".join(self.RenderBodyChunks(vKernels))
+
+    # Returns the whole configuration
+    def Render(self, vKernels, vPosition):
+        return "".join(self.RenderChunks(vKernels, vPosition))
+
+    # Renders the configuration straight to a stream (stdout) one chunk at a time.
+    # Returns the number of bytes written.
+    def Stream(self, vStream, vKernels, vPosition):
+        # Send the same bytes that the file would get, whatever the locale is
+        dossier = getattr(vStream, "buffer", None)
+        size = 0
+
+        try:
+            vStream.flush()
+
+            for chunk in self.RenderChunks(vKernels, vPosition):
+                if dossier is not None:
+                    chunk = chunk.encode("utf-8")
+                    dossier.write(chunk)
+                else:
+                    vStream.write(chunk)
+
+                size = size + len(chunk)
+
+            vStream.flush()
+        except BrokenPipeError:
+            # Whoever was reading (| head) went away. Point the stream at /dev/null so
+            # that flushing it again on the way out doesn't fail as well.
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, vStream.fileno())
+                os.close(devnull)
+            except (OSError, ValueError):
+                pass
+
+            raise BlissBootError("The output was closed before the whole configuration was written.")
+
+        Timings.Count("bytesWritten", size)
+
+        return size
+
+    # Renders the configuration and atomically writes it to the output file.
+    # vBody: What RenderBody returned, if it was already rendered (for mirrors)
+    # Returns 1 if the file was written or 0 if it was already up to date.
+    def Write(self, vOutput, vKernels, vPosition, vForce, vBody=None):
+        if os.path.exists(vOutput) and not vForce:
+            raise BlissBootError("Target file: " + vOutput + " already exists. Pass -f to overwrite.")
+
+        if vBody is None:
+            data = self.Render(vKernels, vPosition)
+        else:
+            data = self.RenderHeader(vKernels, vPosition) + vBody
+
+        if FileWriter.Write(vOutput, data):
+            Output.Success("'" + vOutput + "' has been created!")
+            return 1
+
+        Output.Success("'" + vOutput + "' is already up to date.")
+        return 0
@@ -0,0 +1,193 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+
+import libs.Variables as var
+
+from libs.Output import Output
+from libs.FileWriter import FileWriter
+from libs.Timings import Timings
+
+# Describes what a run did in a form that tools can read: as JSON (--report json)
+# and as node_exporter textfile metrics (--metrics-file). Everything comes from
+# the GeneratorResult of the run and from the Timings, nothing is measured twice.
+class Report(object):
+    # Name of the metric that keeps the time of the last successful run, which
+    # is carried over from the previous metrics file when a run fails
+    _lastSuccess = "bliss_boot_last_success_timestamp"
+
+    def __init__(self):
+        # The GeneratorResult of the last write (None if nothing was generated)
+        self.result = None
+
+        # "written", "unchanged" (nothing to do, exit code 3) or "failed"
+        self.status = "written"
+        self.exitCode = 0
+        self.error = ""
+
+        # Where the configuration was written
+        self.outputs = []
+
+    # Records the result of a write
+    def SetResult(self, vResult, vOutputs):
+        self.result = vResult
+        self.outputs = list(vOutputs)
+
+    # Records that the run stopped early because nothing changed
+    def SetUnchanged(self, vExitCode):
+        self.status = "unchanged"
+        self.exitCode = vExitCode
+
+    # Records that the run failed
+    def SetFailed(self, vError):
+        self.status = "failed"
+        self.exitCode = 1
+        self.error = vError
+
+    # Returns the report as a dictionary
+    def GetData(self):
+        spans = Timings.GetSpans()
+        counters = Timings.GetCounters()
+
+        data = {
+            "version": var.version,
+            "status": self.status,
+            "exitCode": self.exitCode,
+            "error": self.error,
+            "bootloader": "",
+            "bootDrive": "",
+            "driveLayout": "",
+            "outputs": self.outputs,
+            "written": 0,
+            "default": None,
+            "kernels": [],
+            "skipped": [],
+            "unresolved": [],
+            "targets": [],
+            "bytesWritten": counters.get("bytesWritten", 0),
+            "subprocesses": counters.get("forks", 0),
+            "fsyncs": counters.get("fsyncs", 0),
+            "seconds": round(Timings.GetElapsed(), 6),
+            # Phases include the phases they call (like --timings)
+            "phases": dict((name, {"seconds": round(seconds, 6), "calls": calls}) for name, (seconds, calls) in spans.items()),
+        }
+
+        result = self.result
+
+        if not result:
+            return data
+
+        data["bootloader"] = result.bootloader
+        data["bootDrive"] = result.bootDrive
+        data["driveLayout"] = result.driveLayout
+        data["written"] = result.written
+
+        for kernel in result.kernels:
+            data["kernels"].append({
+                "label": kernel.label,
+                "version": kernel.version,
+                "kernel": kernel.kernelName,
+                "initrd": kernel.initrdName,
+                "options": kernel.options,
+                "position": kernel.position,
+            })
+
+        if result.defaultPosition >= 0:
+            data["default"] = data["kernels"][result.defaultPosition] if result.defaultPosition < len(result.kernels) else None
+
+        data["skipped"] = [{"label": label, "version": version, "reason": reason} for label, version, reason in result.skipped]
+        data["unresolved"] = [{"label": label, "version": version, "reference": reference} for label, version, reference in result.unresolved]
+        data["targets"] = [{"output": output, "written": written, "error": error} for output, written, error in result.targets]
+
+        return data
+
+    # Returns the report as JSON
+    def GetJson(self):
+        return json.dumps(self.GetData(), indent=4, sort_keys=True) + "\n"
+
+    # Reads the values of a metrics file written by an earlier run: { name: value }
+    @classmethod
+    def ReadMetrics(cls, vPath):
+        values = {}
+
+        try:
+            with open(vPath, "r") as dossier:
+                for line in dossier:
+                    fields = line.split()
+
+                    if len(fields) != 2 or fields[0].startswith("#"):
+                        continue
+
+                    try:
+                        values[fields[0]] = float(fields[1])
+                    except ValueError:
+                        pass
+        except OSError:
+            pass
+
+        return values
+
+    # Returns the metrics in the node_exporter textfile format. vPrevious are the
+    # values of the last run: a failed run keeps the time of the last successful
+    # one (so that its age can be alerted on), and a run that stopped because
+    # nothing changed keeps the numbers of the configuration that is still there.
+    def GetMetrics(self, vPrevious=None):
+        previous = vPrevious or {}
+        data = self.GetData()
+
+        entries = len(data["kernels"])
+        skipped = len(data["skipped"])
+        unresolved = len(data["unresolved"])
+
+        if self.status == "unchanged":
+            entries = int(previous.get("bliss_boot_entries", 0))
+            skipped = int(previous.get("bliss_boot_skipped_kernels", 0))
+            unresolved = int(previous.get("bliss_boot_unresolved_devices", 0))
+
+        if self.status == "failed":
+            lastSuccess = previous.get(self._lastSuccess, 0)
+        else:
+            lastSuccess = time.time()
+
+        metrics = (
+            ("bliss_boot_entries", "Number of entries in the generated configuration.", entries),
+            ("bliss_boot_skipped_kernels", "Number of configured kernels that couldn't be added.", skipped),
+            ("bliss_boot_unresolved_devices", "Number of kernel command line devices that weren't found.", unresolved),
+            ("bliss_boot_duration_seconds", "Wall time of the last run.", data["seconds"]),
+            ("bliss_boot_bytes_written", "Bytes written by the last run.", data["bytesWritten"]),
+            ("bliss_boot_subprocesses", "Processes started by the last run.", data["subprocesses"]),
+            ("bliss_boot_exit_code", "Exit code of the last run (3 = nothing changed).", data["exitCode"]),
+            ("bliss_boot_success", "1 if the last run succeeded.", 0 if self.status == "failed" else 1),
+            (self._lastSuccess, "Unix time of the last successful run.", lastSuccess),
+        )
+
+        lines = []
+
+        # Every value describes the last run only, so they are all gauges
+        for name, description, value in metrics:
+            lines.append("# HELP " + name + " " + description)
+            lines.append("# TYPE " + name + " gauge")
+            lines.append(name + " " + (repr(round(value, 6)) if isinstance(value, float) else str(value)))
+
+        return "\n".join(lines) + "\n"
+
+    # Writes the metrics file (atomically, node_exporter may read it at any time).
+    # Not being able to write it doesn't fail the run.
+    def WriteMetrics(self, vPath):
+        try:
+            FileWriter.Write(vPath, self.GetMetrics(self.ReadMetrics(vPath)))
+        except OSError as error:
+            Output.Warn("Unable to write the metrics to " + vPath + ": " + str(error))
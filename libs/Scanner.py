@@ -12,96 +12,367 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import bisect
+import copy
 import os
 import re
-import string
+import stat
+
+from libs.Output import Output
+from libs.Fstab import Fstab
+from libs.Devices import Devices
+from libs.Topology import Topology
+from libs.Errors import BlissBootError
+from libs.KernelEntry import KernelEntry
+from libs.KernelRule import KernelRule
+from libs.Timings import Timings
+
+# Collects everything that is needed to generate a configuration: the /boot drive
+# and its layout, the kernels in the 'kernelDirectory' and the kernels in the
+# configuration. All the state belongs to the instance so that many scanners
+# (for different configurations or roots) can be used in the same process.
+class Scanner(object):
+    # vConfig: The configuration (a Config, or any object with the same attributes)
+    # vRoot: Directory that the configuration's paths are relative to
+    # vDevices / vFstab / vTopology: Lets a caller share the (cached) device index, mount tables and block device map
+    # vImage: A DiskImage to find the /boot partition and the layout in (instead of the devices)
+    def __init__(self, vConfig, vRoot="/", vDevices=None, vFstab=None, vImage=None, vTopology=None):
+        self.root = vRoot
+        self.image = vImage
 
-from subprocess import call
-from subprocess import check_output
+        # Sets the configuration and where the kernels really are on this system
+        self.SetConfig(vConfig)
 
-import libs.ConfigLoader as ConfigLoader
+        self.devices = vDevices or Devices()
 
-from libs.Tools import Tools
+        if vFstab is None:
+            # The live mounts only mean something when we are looking at the running system
+            # (and not at a disk image)
+            mountInfoPath = "/proc/self/mountinfo" if os.path.abspath(vRoot) == "/" and not vImage else ""
+            vFstab = Fstab(self.GetRootedPath("/etc/fstab"), mountInfoPath)
 
-config = ConfigLoader.GetConfigModule()
+        self.fstab = vFstab
 
-class Scanner(object):
-    _bootKernels = []
-    _fstabValues = []
-    _driveLayout = ""
-
-    # Kernels defined by user in configuration file (Example: Gentoo, 3.14.27-KS.01, vmlinuz, initrd, root=/dev/sda1)
-    _configKernelLabel = []
-    _configKernelVersion = []
-    _configKernelDefault = []
-    _configKernelName = []
-    _configKernelInitrdName = []
-    _configKernelOptions = []
-
-    # Factorized Kernels List (The kernels that were found in the 'kernelDirectory' and defined by user in the config)
-    _commonKernels = []
-
-    @classmethod
-    def __init__(cls):
-        # Get the fstab values for /boot immediately
-        cls.ScanFstab()
-
-        # boot drive
-        cls._bootDriveField = cls._fstabValues[0]
-        cls._bootDrive = Tools.MapIdentifierToDrive(cls._bootDriveField)
+        if vTopology is None:
+            # Like the live mounts, the devices of this system only matter for the running system
+            vTopology = Topology("/sys/class/block" if os.path.abspath(vRoot) == "/" and not vImage else "")
+
+        self.topology = vTopology
+
+        self._bootKernels = []
+        self._fstabValues = []
+        self._driveLayout = ""
+
+        # Stat results of the configured kernel/initrd files, per kernel directory
+        self._bootKernelArtifacts = {}
+
+        # Kernels defined by user in configuration file as KernelEntry objects
+        # (Example: Gentoo, 3.14.27-KS.01, vmlinuz, initrd, root=/dev/sda1)
+        self._configKernels = []
+
+        # Version -> list of KernelEntry (a version can be used by more than one entry)
+        self._configKernelIndex = {}
+
+        # Version -> (KernelRule, KernelEntry) for the kernel directories that were
+        # found by a discovery rule instead of being in the 'kernels' list
+        self._ruleKernels = {}
+
+        # Version -> natural sort key (see KernelRule.GetVersionKey). Computed once per version.
+        self._versionKeys = {}
+
+        # Factorized Kernels List (The kernels that were found in the 'kernelDirectory' and defined by user in the config)
+        self._commonKernels = []
+
+        # Kernels that were configured and found but can't be added: (label, version, reason)
+        self._skippedKernels = []
+
+        # The /boot drive is only probed once something needs it (see ProbeBootDrive)
+        self._bootDriveField = ""
+        self._bootDrive = ""
+        self._isProbed = 0
+
+        # The /boot partition when a disk image is used
+        self._bootPartition = None
+
+        # Whether the user was told that the grub name of the drive is a guess
+        self._warnedAmbiguous = 0
+
+    # Finds the /boot drive and its layout. This reads the fstab and may need the
+    # device index, so it is only done the first time the drive is needed.
+    def ProbeBootDrive(self):
+        if self._isProbed:
+            return
+
+        # With 'whole disk zfs' there is no /boot entry in the fstab
+        if not self.config.wholeDiskZfs:
+            # Get the fstab values for /boot
+            self.ScanFstab()
+
+            # boot drive
+            self._bootDriveField = self._fstabValues[0]
+            self._bootDrive = self.MapIdentifierToDrive(self._bootDriveField)
 
         # Detect the layout of the /boot drive
-        cls.DetectDriveLayout()
+        self.DetectDriveLayout()
+
+        self._isProbed = 1
+
+    # Returns a positive number if the /boot drive was already probed
+    def IsProbed(self):
+        return self._isProbed
+
+    # Returns a copy of this scanner that boots from another drive (a mirror).
+    # The kernels are shared, only the drive and its layout are probed.
+    def GetMirror(self, vDrive):
+        mirror = copy.copy(self)
+
+        if not self.config.wholeDiskZfs:
+            mirror._bootDriveField = vDrive
+            mirror._bootDrive = mirror.MapIdentifierToDrive(vDrive)
+
+        mirror.DetectDriveLayout()
+        mirror._isProbed = 1
+
+        return mirror
+
+    # Switches to another configuration (for example after it was reloaded)
+    def SetConfig(self, vConfig):
+        self.config = vConfig
+        self.configPath = getattr(vConfig, "__file__", None) or "the configuration"
+        self.kernelDirectory = self.GetRootedPath(vConfig.kernelDirectory)
+
+        # The discovery rules, in the order they are tried
+        rules = getattr(vConfig, "rules", ())
+        self._rules = [KernelRule(rules[i], i) for i in range(len(rules))]
+
+    # Returns this absolute path inside of the root
+    def GetRootedPath(self, vPath):
+        return os.path.join(self.root, vPath.lstrip("/"))
+
+    # Processes a UUID/PARTUUID/LABEL/PARTLABEL= field in order to find out where the real drive is,
+    # instead of the traditional /dev/sda, /dev/md0 references
+    @Timings.Timed("MapIdentifierToDrive")
+    def MapIdentifierToDrive(self, vIdValue):
+        kind, value = self.devices.ParseIdentifier(vIdValue)
+
+        if self.image:
+            return self.MapIdentifierToPartition(kind, value)
+
+        # If we aren't using anything fancy like UUID=, then the
+        # boot drive field is already the drive
+        if not kind:
+            return vIdValue
+
+        result = self.devices.Lookup(kind, value)
+
+        if not result:
+            raise BlissBootError("No drives were found with the " + kind + "=" + value + " value.")
+
+        return result
+
+    # Finds the partition in the disk image for this identifier. A plain device
+    # (/dev/sda2) is matched by its partition number.
+    def MapIdentifierToPartition(self, vKind, vValue):
+        if vKind:
+            partition = self.image.Find(vKind, vValue)
+        else:
+            match = re.search(r"(\d+)$", vValue)
+            partition = self.image.GetPartition(int(match.group(1))) if match else None
+
+        if not partition:
+            if vKind:
+                vValue = vKind + "=" + vValue
+
+            message = "No partitions were found in " + self.image.path + " with the " + vValue + " value (from " + self.fstab.GetFstabPath() + ")."
+
+            # Without a root tree the /boot line is the one of this system, not of the image
+            if os.path.abspath(self.root) == "/":
+                message = message + " Pass the image's root tree with -r so that its own fstab is used."
+
+            raise BlissBootError(message)
+
+        self._bootPartition = partition
+
+        return self.image.GetPartitionName(partition)
 
     # Finds the kernels that the user has in their 'kernelDirectory'
-    @classmethod
-    def FindBootKernels(cls):
-        Tools.Print("Scanning " + config.kernelDirectory + " ...")
+    @Timings.Timed("FindBootKernels")
+    def FindBootKernels(self):
+        Output.Print("Scanning " + self.kernelDirectory + " ...")
 
         # Check to see if our boot directory exists before starting
-        if not os.path.exists(config.kernelDirectory):
-            Tools.Print("The " + config.kernelDirectory + " directory doesn't exist. Creating ...")
+        if not os.path.exists(self.kernelDirectory):
+            Output.Print("The " + self.kernelDirectory + " directory doesn't exist. Creating ...")
 
-            os.mkdir(config.kernelDirectory)
+            os.mkdir(self.kernelDirectory)
 
-            if os.path.exists(config.kernelDirectory):
-                Tools.Warn("Please place your kernels inside " + config.kernelDirectory + "/<version>, configure " +
-                    ConfigLoader.GetConfigFilePath() + ", and then re-run the program. \n\nExample:\n\n" +
-                    config.kernelDirectory + "/3.12.12-KS.01/{vmlinuz, initrd}")
-                quit(1)
+            if os.path.exists(self.kernelDirectory):
+                raise BlissBootError("Please place your kernels inside " + self.kernelDirectory + "/<version>, configure " +
+                    self.configPath + ", and then re-run the program. \n\nExample:\n\n" +
+                    self.kernelDirectory + "/3.12.12-KS.01/{vmlinuz, initrd}")
             else:
-                Tools.Fail(config.kernelDirectory + " directory doesn't exist")
+                raise BlissBootError(self.kernelDirectory + " directory doesn't exist")
+
+        # The kernel and initrd names that the user configured for each version, so that
+        # we can check that they exist while we are already walking the directory.
+        wantedArtifacts = self.GetWantedArtifacts()
+
+        self._bootKernels = []
+        self._bootKernelArtifacts = {}
+        self._ruleKernels = {}
 
-        cmd = 'ls ' + config.kernelDirectory
-        results = check_output(["ls", config.kernelDirectory], universal_newlines=True).strip()
+        # Add kernels to our kernel set. Only directories are kernels.
+        with os.scandir(self.kernelDirectory) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
 
-        # Add kernels to out kernel set
-        if results:
-            for i in results.split("\n"):
-                cls._bootKernels.append(i)
+                self._bootKernels.append(entry.name)
+
+                names = wantedArtifacts.get(entry.name) or self.MatchRules(entry.name)
+
+                if names:
+                    self._bootKernelArtifacts[entry.name] = self.StatArtifacts(entry.path, names)
+
+        if self._bootKernels:
+            # Keep a stable (alphabetical) order like 'ls' did
+            self._bootKernels.sort()
         else:
-            Tools.Fail("No kernels found in " + config.kernelDirectory + ". A directory for each kernel you want must exist " +
-            "in that location.\n\nExample:\n\n" + config.kernelDirectory + "/3.13.5-KS.01/\n" + config.kernelDirectory + "/3.14.27-KS.01/\n")
+            raise BlissBootError("No kernels found in " + self.kernelDirectory + ". A directory for each kernel you want must exist " +
+            "in that location.\n\nExample:\n\n" + self.kernelDirectory + "/3.13.5-KS.01/\n" + self.kernelDirectory + "/3.14.27-KS.01/\n")
 
-    # Get fstab information. We will use this to get /boot
-    @classmethod
-    def ScanFstab(cls):
-        cmd = 'cat /etc/fstab | grep /boot[[:blank:]] | awk \'{print $1, $2, $3, $4, $5, $6}\''
-        results = check_output(cmd, shell=True, universal_newlines=True).strip()
+    # Uses the kernel directories that another scanner found in the same 'kernelDirectory'
+    # instead of walking it again. Only the configured files are checked.
+    def ShareBootKernels(self, vScanner):
+        self._bootKernels = list(vScanner.GetBootKernels())
+        self.RescanArtifacts()
+
+    # Finds the first discovery rule that matches this kernel directory (if it isn't in
+    # the 'kernels' list, those always win). Returns the kernel and initrd names that
+    # the rule wants, or None.
+    def MatchRules(self, vVersion):
+        if not self._rules or vVersion in self._configKernelIndex:
+            return None
+
+        for rule in self._rules:
+            kernel = rule.Match(vVersion)
+
+            if kernel:
+                self._ruleKernels[vVersion] = (rule, kernel)
+
+                if self.config.useInitrd:
+                    return set((kernel.kernelName, kernel.initrdName))
+
+                return set((kernel.kernelName,))
+
+        return None
+
+    # Returns the natural sort key of this version
+    def GetVersionKey(self, vVersion):
+        key = self._versionKeys.get(vVersion)
+
+        if key is None:
+            key = KernelRule.GetVersionKey(vVersion)
+            self._versionKeys[vVersion] = key
+
+        return key
+
+    # Returns the kernel directories in the order the entries will be in: like 'ls'
+    # (kernelOrder = "name") or the newest version first (kernelOrder = "newest")
+    def GetOrderedBootKernels(self):
+        if getattr(self.config, "kernelOrder", "name") == "newest":
+            return sorted(self._bootKernels, key=self.GetVersionKey, reverse=True)
+
+        return self._bootKernels
+
+    # Returns the kernel and initrd names configured for each version: { version: set(names) }
+    def GetWantedArtifacts(self):
+        wantedArtifacts = {}
+
+        for version, kernels in self._configKernelIndex.items():
+            names = wantedArtifacts.setdefault(version, set())
+
+            for kernel in kernels:
+                names.add(kernel.kernelName)
+
+                if self.config.useInitrd:
+                    names.add(kernel.initrdName)
+
+        return wantedArtifacts
+
+    # Rescans a single kernel directory after it was added, changed or removed,
+    # without walking the rest of the 'kernelDirectory'
+    def RescanBootKernel(self, vVersion):
+        path = os.path.join(self.kernelDirectory, vVersion)
+        isKernel = os.path.isdir(path)
+
+        index = bisect.bisect_left(self._bootKernels, vVersion)
+        isKnown = index < len(self._bootKernels) and self._bootKernels[index] == vVersion
+
+        if isKernel and not isKnown:
+            self._bootKernels.insert(index, vVersion)
+        elif not isKernel and isKnown:
+            del self._bootKernels[index]
+
+        self._bootKernelArtifacts.pop(vVersion, None)
+        self._ruleKernels.pop(vVersion, None)
+
+        if isKernel:
+            names = self.GetWantedArtifacts().get(vVersion) or self.MatchRules(vVersion)
+
+            if names:
+                self._bootKernelArtifacts[vVersion] = self.StatArtifacts(path, names)
+
+    # Checks the configured kernel and initrd files again (for example after the
+    # configuration changed). Only the configured versions are looked at.
+    def RescanArtifacts(self):
+        self._bootKernelArtifacts = {}
+        self._ruleKernels = {}
+        bootKernels = set(self._bootKernels)
+        wantedArtifacts = self.GetWantedArtifacts()
+
+        for version, names in wantedArtifacts.items():
+            if version in bootKernels:
+                self._bootKernelArtifacts[version] = self.StatArtifacts(os.path.join(self.kernelDirectory, version), names)
+
+        # The kernel directories that a discovery rule might pick up
+        if self._rules:
+            for version in self._bootKernels:
+                names = version not in wantedArtifacts and self.MatchRules(version)
+
+                if names:
+                    self._bootKernelArtifacts[version] = self.StatArtifacts(os.path.join(self.kernelDirectory, version), names)
+
+    # Returns the stat results for the files in this kernel directory: { name: os.stat_result }.
+    # Files that don't exist (or that aren't regular files) are left out.
+    def StatArtifacts(self, vDirectory, vNames):
+        stats = {}
+
+        for name in vNames:
+            try:
+                result = os.stat(os.path.join(vDirectory, name))
+            except OSError:
+                continue
 
-        if results:
-            # Split the /boot line so we can store it
-            splits = results.split(" ")
+            if stat.S_ISREG(result.st_mode):
+                stats[name] = result
 
+        return stats
+
+    # Get fstab information. We will use this to get /boot
+    @Timings.Timed("ScanFstab")
+    def ScanFstab(self):
+        entry = self.fstab.FindMountPoint("/boot")
+
+        if entry:
             # Save fstab /boot drive info
-            for x in splits:
-                cls._fstabValues.append(x.strip())
+            self._fstabValues = entry.ToList()
         else:
-            Tools.Fail("/boot line could not be found in /etc/fstab")
+            raise BlissBootError("/boot line could not be found in " + self.fstab.GetFstabPath())
 
     # Detect the partition style for the /boot drive (gpt or mbr) and returns either "gpt" or "msdos" as a string
-    @classmethod
-    def DetectDriveLayout(cls):
+    @Timings.Timed("DetectDriveLayout")
+    def DetectDriveLayout(self):
         # If we are using 'whole disk zfs', we know for a fact that
         # it's gpt (assuming the drive was formatted with zpool create).
 
@@ -109,96 +380,63 @@ class Scanner(object):
         # still using the whole drive for zfs (technically speaking),
         # then they could be using mbr as well.. returning 'none' so that
         # both part_<> can be included
-        if config.wholeDiskZfs:
-            cls._driveLayout = "none"
+        if self.config.wholeDiskZfs:
+            self._driveLayout = "none"
+        elif self.image:
+            # Read from the partition table of the image
+            self._driveLayout = self.image.layout
         else:
-            # Remove the partition number so that we can find the
-            # style of the drive itself
-            match = re.sub("\d$", "", cls._bootDrive)
-
-            if match:
-                # use blkid /dev/<drive> and get PTTYPE
-                # example: blkid /dev/vda: -> /dev/vda: PTTYPE="gpt"
-                # cmd: blkid /dev/sda | grep -oE 'PTTYPE=".*"' | cut -d '"' -f 2
-                cmd = 'blkid ' + match.strip() + ' | grep -oE \'PTTYPE=".*"\' | cut -d \'"\' -f 2'
-                results = check_output(cmd, shell=True, universal_newlines=True).strip()
-
-                if results:
-                    if results == "gpt":
-                        cls._driveLayout = "gpt"
-                    elif results == "dos":
-                        cls._driveLayout = "msdos"
-                    else:
-                        cls._driveLayout = "none"
-                else:
-                    # This will run if we get some weird result like "md" from "/dev/md0"
-                    cls._driveLayout = "none"
-            else:
-                # If the layout couldn't be detected then return none so that both msdos/gpt can be inserted.
-                # This will happen if the user has a raid or lvm device as their /boot.
-                cls._driveLayout = "none"
+            # The layout of the disk the /boot partition is on. This is "none" for
+            # raid and lvm devices so that both msdos/gpt can be inserted.
+            self._driveLayout = self.topology.GetLayout(self._bootDrive)
 
     # Converts the fstab /boot drive entry to a grub 2 compatible format
     # and returns it as a string: (gpt) /dev/sda1 -> (hd0,gpt1)
-    @classmethod
-    def GetGrub2BootDrive(cls):
+    def GetGrub2BootDrive(self):
         # If we are using 'whole disk zfs', then we won't have a /boot entry
         # in /etc/fstab. So instead we will format the zfs_boot variable and
         # return it ready to be used in grub2
-        if config.wholeDiskZfs:
-            match = re.search('(/[a-zA-Z0-9_/]+)', config.wholeDiskZfsBootPool)
+        if self.config.wholeDiskZfs:
+            match = re.search('(/[a-zA-Z0-9_/]+)', self.config.wholeDiskZfsBootPool)
 
             if match:
                 return match.group()
 
-            Tools.Fail("Could not parse the 'wholeDiskZfsBootPool' variable correctly.")
+            raise BlissBootError("Could not parse the 'wholeDiskZfsBootPool' variable correctly.")
+
+        # The image is the only drive that grub will see: (hd0,gpt2)
+        if self.image:
+            self.ProbeBootDrive()
+
+            if self._bootPartition.number == 0:
+                return "(hd0)"
+
+            return "(hd0," + self._driveLayout + str(self._bootPartition.number) + ")"
+
+        # sd, vd, xvd, nvme and mmcblk drives and their partitions: (hd0,gpt1)
+        grubName = self.topology.GetGrubName(self.GetBootDrive())
+
+        if grubName:
+            # With more than one kind of disk the firmware decides which one is hd0
+            if self.topology.IsAmbiguous() and not self.config.grub2Search and not self._warnedAmbiguous:
+                self._warnedAmbiguous = 1
+                Output.Warn("There are different kinds of disks, so " + grubName + " for " + self.GetBootDrive() +
+                    " is a guess. Set 'grub2Search' to find /boot by its UUID instead.")
+
+            return grubName
 
         # Properly processes the boot drive field in order for us to get
         # a value that we can properly parse for the grub.cfg.
         # This is so that if the user is using UUIDs as a /boot entry in
         # /etc/fstab, we can handle that situation correctly.
-        match = re.search('/dev/(.*)', cls._bootDrive)
+        match = re.search('/dev/(.*)', self.GetBootDrive())
 
         if match:
             # Possibilities:
-            # sd[a-z][0+]
-            # vd[a-z][0+]
             # md[0+]
             # mapper/vg-root
             # vg/root
 
-            # --- Handle sdX or vdX drives ---
-            m1 = re.search('[s|v]d(\w+)', match.group(1))
-
-            if m1:
-                # Complete value, will be completed as function progresses
-                completedValue = "(hd"
-
-                # Process the letter part and convert it to a grub compatible format; a = (hd0)
-                alph = re.search('\w', m1.group(1))
-
-                if alph:
-                    # Find the number in the alphabet of this letter
-                    alphindex = cls.GetAlphabeticalIndex(alph.group(0))
-
-                    # Add this number to the final string
-                    completedValue = completedValue + str(alphindex)
-
-                # Process the number part of the drive
-                numberPartOfDrive = re.search('\d', m1.group(1))
-
-                if numberPartOfDrive:
-                    # add layout
-                    completedValue = completedValue + "," + cls._driveLayout
-
-                    # add number part
-                    completedValue = completedValue + numberPartOfDrive.group(0)
-
-                # close the value and return it
-                completedValue = completedValue + ")"
-
-                return completedValue
-
             # --- Handle md# ---
             m1 = re.search('md(\d+)', match.group(1))
 
@@ -217,72 +455,191 @@ class Scanner(object):
             if m1:
                 return "(lvm/" + m1.group(1) + "-" + m1.group(2) + ")"
 
-            # We've failed :(
-            Tools.Fail("Unable to generate the boot drive entry.")
+        # We've failed :(
+        raise BlissBootError("Unable to generate the boot drive entry for " + self.GetBootDrive() + ".")
+
+    # Returns the UUID of the /boot filesystem ("" if it isn't known)
+    def GetBootUuid(self):
+        self.ProbeBootDrive()
+
+        if self.image:
+            return self._bootPartition.fsUuid
+
+        kind, value = self.devices.ParseIdentifier(self._bootDriveField)
+
+        if kind == "UUID":
+            return value
+
+        return self.devices.GetTags(self._bootDrive).get("UUID", "")
+
+    # Returns a grub 2 'search' command that finds the /boot filesystem by its UUID,
+    # with hints so that the first device that is probed is the right one. Returns
+    # "" if the UUID of the /boot filesystem isn't known.
+    def GetGrub2Search(self):
+        uuid = self.GetBootUuid()
+
+        if not uuid:
+            return ""
+
+        command = ["search", "--no-floppy", "--fs-uuid", "--set=root"]
+        bootDrive = self.GetGrub2BootDrive()
+
+        # Only (hdN) names can be hints, not (md/0) or (lvm/vg-root). A guessed
+        # name isn't given as a hint either, the UUID alone is safer.
+        if bootDrive.startswith("(hd") and (self.image or not self.topology.IsAmbiguous()):
+            command.append("--hint-bios=" + bootDrive[1:-1])
+            command.append("--hint-efi=" + bootDrive[1:-1])
+
+            baremetal = "" if self.image else self.topology.GetBaremetalName(self._bootDrive)
+
+            if baremetal:
+                command.append("--hint-baremetal=" + baremetal)
+
+        command.append(uuid)
+
+        return " ".join(command)
 
     # Returns the kernel set that was gathered
-    @classmethod
-    def GetBootKernels(cls):
-        return cls._bootKernels
+    def GetBootKernels(self):
+        return self._bootKernels
 
     # Prints a list of detected kernels in the boot directory
-    @classmethod
-    def PrintBootKernels(cls):
-        Tools.Print("Kernels detected in the " + config.kernelDirectory + " directory:")
+    def PrintBootKernels(self):
+        Output.Print("Kernels detected in the " + self.kernelDirectory + " directory:")
 
-        for kernel in cls._bootKernels:
-            Tools.Print(kernel)
+        for kernel in self._bootKernels:
+            Output.Print(kernel)
 
     # Finds the kernels that the user defined in their configuration file
-    @classmethod
-    def FindKernelsInConfig(cls):
-        Tools.Print("Scanning " + ConfigLoader.GetConfigFilePath() + " ...")
-
-        for kernel in config.kernels:
-            cls._configKernelLabel.append(kernel[0])
-            cls._configKernelVersion.append(kernel[1])
-            cls._configKernelDefault.append(kernel[2])
-            cls._configKernelName.append(kernel[3])
-            cls._configKernelInitrdName.append(kernel[4])
-            cls._configKernelOptions.append(kernel[5])
+    @Timings.Timed("FindKernelsInConfig")
+    def FindKernelsInConfig(self):
+        Output.Print("Scanning " + self.configPath + " ...")
+
+        self._configKernels = []
+        self._configKernelIndex = {}
+
+        for kernel in self.config.kernels:
+            entry = KernelEntry.FromTuple(kernel)
+
+            self._configKernels.append(entry)
+            self._configKernelIndex.setdefault(entry.version, []).append(entry)
 
     # Prints the kernels detected in the configuration file
-    @classmethod
-    def PrintKernelsInConfig(cls):
-        Tools.Print("Kernels detected in " + ConfigLoader.GetConfigFilePath() + ":")
-
-        for i in range(len(cls._configKernelLabel)):
-            print(str(i+1) + ". " + cls._configKernelLabel[i] + " - " + cls._configKernelVersion[i])
-
-    # Factors out the kernels that were defined by the user and found in their kernelDirectory
-    @classmethod
-    def FindCommonKernels(cls):
-         for i in range(len(cls._bootKernels)):
-            for j in range(len(cls._configKernelVersion)):
-                if cls._bootKernels[i] == cls._configKernelVersion[j]:
-                    value = [
-                        cls._configKernelLabel[j],
-                        cls._configKernelVersion[j],
-                        cls._configKernelDefault[j],
-                        cls._configKernelName[j],
-                        cls._configKernelInitrdName[j],
-                        cls._configKernelOptions[j],
-                    ]
-                    cls._commonKernels.append(value)
+    def PrintKernelsInConfig(self):
+        Output.Print("Kernels detected in " + self.configPath + ":")
+
+        for i in range(len(self._configKernels)):
+            print(str(i+1) + ". " + self._configKernels[i].label + " - " + self._configKernels[i].version)
+
+    # Factors out the kernels that were defined by the user and found in their kernelDirectory.
+    # Each kernel directory is looked up in the config index, so this is linear in the
+    # number of kernels. The position of each kernel in the common list is assigned here.
+    @Timings.Timed("FindCommonKernels")
+    def FindCommonKernels(self):
+        self._commonKernels = []
+        self._skippedKernels = []
+
+        for kernel in self._configKernels:
+            kernel.position = -1
+
+        # The kernels found by the discovery rules, after their 'keep' policy
+        ruleKernels = self.GetKeptRuleKernels()
+
+        for version in self.GetOrderedBootKernels():
+            # The 'kernels' list always wins over the rules
+            for kernel in self._configKernelIndex.get(version) or ruleKernels.get(version, ()):
+                stats = self._bootKernelArtifacts.get(version, {})
+                missing = self.GetMissingArtifacts(kernel)
+
+                if missing:
+                    reason = "missing " + ", ".join(missing)
+                    self._skippedKernels.append((kernel.label, kernel.version, reason))
+
+                    Output.Warn("Skipping: " + kernel.label + " - " + kernel.version +
+                        " (" + reason + " in " + os.path.join(self.kernelDirectory, version) + ")")
+                    continue
+
+                kernel.kernelStat = stats.get(kernel.kernelName)
+                kernel.initrdStat = stats.get(kernel.initrdName)
+                kernel.position = len(self._commonKernels)
+
+                self._commonKernels.append(kernel)
+
+        self.SetNewestDefault()
+
+    # Returns the kernel and initrd names of this kernel that weren't found
+    def GetMissingArtifacts(self, vKernel):
+        stats = self._bootKernelArtifacts.get(vKernel.version, {})
+        artifacts = [vKernel.kernelName]
+
+        if self.config.useInitrd:
+            artifacts.append(vKernel.initrdName)
+
+        return [name for name in artifacts if name not in stats]
+
+    # Applies the 'keep' policy of the discovery rules: only the newest N kernels of
+    # a rule (that have all their files) are added. Returns { version: (KernelEntry,) }.
+    def GetKeptRuleKernels(self):
+        kept = {}
+        ruleVersions = {}
+
+        for version, (rule, kernel) in self._ruleKernels.items():
+            kernel.default = 0
+            kernel.position = -1
+
+            # Incomplete kernels are still passed on so that they are reported
+            if rule.keep and not self.GetMissingArtifacts(kernel):
+                ruleVersions.setdefault(rule.index, (rule, []))[1].append(version)
+            else:
+                kept[version] = (kernel,)
+
+        for rule, versions in ruleVersions.values():
+            versions.sort(key=self.GetVersionKey, reverse=True)
+
+            for version in versions[:rule.keep]:
+                kept[version] = (self._ruleKernels[version][1],)
+
+            for version in versions[rule.keep:]:
+                kernel = self._ruleKernels[version][1]
+                reason = "older than the newest " + str(rule.keep) + " of rule '" + rule.pattern + "'"
+                self._skippedKernels.append((kernel.label, kernel.version, reason))
+
+                Output.Debug("Skipping: " + kernel.label + " - " + kernel.version + " (" + reason + ")")
+
+        return kept
+
+    # Applies the 'default = "newest"' policy of the discovery rules: if no kernel is
+    # the default, the newest kernel of the first rule with that policy becomes it.
+    def SetNewestDefault(self):
+        if not self._ruleKernels or any(kernel.default == 1 for kernel in self._commonKernels):
+            return
+
+        for rule in self._rules:
+            if rule.default != "newest":
+                continue
+
+            kernels = [kernel for kernel in self._commonKernels if self._ruleKernels.get(kernel.version) == (rule, kernel)]
+
+            if kernels:
+                max(kernels, key=lambda kernel: self.GetVersionKey(kernel.version)).default = 1
+                return
+
+    # Returns the kernels that were skipped: (label, version, reason)
+    def GetSkippedKernels(self):
+        return self._skippedKernels
 
     # Finds the default kernel
-    @classmethod
-    def FindDefaultKernel(cls):
+    def FindDefaultKernel(self):
         alreadyFound = 0
         defaultKernelIndex = 0
 
-        for i in range(len(cls._commonKernels)):
-            if cls._commonKernels[i][2] == 1:
+        for i in range(len(self._commonKernels)):
+            if self._commonKernels[i].default == 1:
                 if alreadyFound == 0:
                     alreadyFound = 1
                     defaultKernelIndex = i
                 else:
-                    Tools.Warn("Multiple default kernels detected. The default kernel will most likely not be correct!")
+                    Output.Warn("Multiple default kernels detected. The default kernel will most likely not be correct!")
                     return defaultKernelIndex
 
         if alreadyFound != 0:
@@ -291,54 +648,37 @@ class Scanner(object):
             return -1
 
     # Gets the common kernel list
-    @classmethod
-    def GetCommonKernels(cls):
-        return cls._commonKernels
+    def GetCommonKernels(self):
+        return self._commonKernels
 
     # Prints the kernels found in common
-    @classmethod
-    def PrintCommonKernels(cls):
-        Tools.Print("Common kernels detected:")
+    def PrintCommonKernels(self):
+        Output.Print("Common kernels detected:")
 
-        for kernel in range(len(cls._commonKernels)):
-            print(str(kernel+1) + ". " + cls._commonKernels[kernel][0] + " - " + cls._commonKernels[kernel][1])
+        for kernel in range(len(self._commonKernels)):
+            print(str(kernel+1) + ". " + self._commonKernels[kernel].label + " - " + self._commonKernels[kernel].version)
 
     # Returns the index for target kernel in the common kernel list
-    @classmethod
-    def GetKernelIndexInCommonList(cls, vTarget):
-        for i in range(len(cls._commonKernels)):
-            if cls._commonKernels[i] == vTarget:
-                return i
-
-        return -1
+    def GetKernelIndexInCommonList(self, vTarget):
+        return vTarget.position
 
     # Retrieves the kernel from the common list
-    @classmethod
-    def GetKernel(cls, vTarget):
-        return cls._commonKernels[vTarget]
+    def GetKernel(self, vTarget):
+        return self._commonKernels[vTarget]
 
     # Checks to see if any kernels will be added to the configuration file
-    @classmethod
-    def AnyKernelsExist(cls):
-        if not cls._commonKernels:
+    def AnyKernelsExist(self):
+        if not self._commonKernels:
             return -1
         else:
             return 0
 
-    # Gets the layout that was detected
-    @classmethod
-    def GetDriveLayout(cls):
-        return cls._driveLayout
+    # Gets the /boot drive that was detected (/dev/sda1)
+    def GetBootDrive(self):
+        self.ProbeBootDrive()
+        return self._bootDrive
 
-    # Get the index for a letter in the alphabet
-    @classmethod
-    def GetAlphabeticalIndex(cls, vLetter):
-        alphabet = string.ascii_lowercase
-
-        count = 0
-
-        for letter in alphabet:
-            if letter == vLetter:
-                return count
-
-            count = count + 1
+    # Gets the layout that was detected
+    def GetDriveLayout(self):
+        self.ProbeBootDrive()
+        return self._driveLayout
@@ -0,0 +1,135 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import threading
+import time
+
+# A timed phase. Spans can be nested, each one measures its own wall time
+# (including the spans inside of it).
+class Span(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, vName):
+        self.name = vName
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, vType, vValue, vTraceback):
+        Timings.Add(self.name, time.perf_counter() - self.start)
+        return False
+
+# Keeps track of how long each phase of a run took and of the things that are
+# expensive on slow storage: processes started, bytes written and fsyncs. The
+# bookkeeping is a couple of perf_counter calls per phase, so it is always on;
+# --timings only decides whether the breakdown is printed.
+class Timings(object):
+    # Name -> [seconds, calls]
+    _spans = {}
+
+    _counters = {
+        "forks": 0,
+        "bytesWritten": 0,
+        "fsyncs": 0,
+    }
+
+    _start = time.perf_counter()
+
+    # Mirrors are written from several threads, which all count and time into the same dictionaries
+    _lock = threading.Lock()
+
+    # Forgets everything that was measured so far
+    @classmethod
+    def Reset(cls):
+        with cls._lock:
+            cls._spans = {}
+            cls._start = time.perf_counter()
+
+            for name in cls._counters:
+                cls._counters[name] = 0
+
+    # Returns a context manager that times the code inside of it
+    @classmethod
+    def Span(cls, vName):
+        return Span(vName)
+
+    # Decorator that times every call of a function
+    @classmethod
+    def Timed(cls, vName):
+        def Decorator(vFunction):
+            @functools.wraps(vFunction)
+            def Run(*args, **kwargs):
+                start = time.perf_counter()
+
+                try:
+                    return vFunction(*args, **kwargs)
+                finally:
+                    cls.Add(vName, time.perf_counter() - start)
+
+            return Run
+
+        return Decorator
+
+    # Adds a measurement to a span
+    @classmethod
+    def Add(cls, vName, vSeconds):
+        with cls._lock:
+            span = cls._spans.get(vName)
+
+            if span:
+                span[0] = span[0] + vSeconds
+                span[1] = span[1] + 1
+            else:
+                cls._spans[vName] = [vSeconds, 1]
+
+    # Increases a counter (forks, bytesWritten, fsyncs)
+    @classmethod
+    def Count(cls, vName, vAmount=1):
+        with cls._lock:
+            cls._counters[vName] = cls._counters.get(vName, 0) + vAmount
+
+    # Returns the spans: { name: (seconds, calls) }
+    @classmethod
+    def GetSpans(cls):
+        with cls._lock:
+            return dict((name, (span[0], span[1])) for name, span in cls._spans.items())
+
+    # Returns the counters: { name: value }
+    @classmethod
+    def GetCounters(cls):
+        with cls._lock:
+            return dict(cls._counters)
+
+    # Returns the time since the start (or the last reset)
+    @classmethod
+    def GetElapsed(cls):
+        return time.perf_counter() - cls._start
+
+    # Returns the breakdown as lines of text, the slowest phase first
+    @classmethod
+    def Format(cls):
+        lines = ["Timings (phases include the phases they call):"]
+        width = max([len(name) for name in cls._spans] + [5])
+
+        for name, (seconds, calls) in sorted(cls._spans.items(), key=lambda item: item[1][0], reverse=True):
+            lines.append("  " + name.ljust(width) + "  %9.3f ms  %d call%s" % (seconds * 1000, calls, "" if calls == 1 else "s"))
+
+        lines.append("  " + "Total".ljust(width) + "  %9.3f ms" % (cls.GetElapsed() * 1000))
+        lines.append("  forks: " + str(cls._counters["forks"]) + ", bytes written: " + str(cls._counters["bytesWritten"]) +
+            ", fsyncs: " + str(cls._counters["fsyncs"]))
+
+        return lines
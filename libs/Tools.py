@@ -14,21 +14,44 @@
 
 import os
 import sys
-import re
-
-from subprocess import call
-from subprocess import check_output
 
 import libs.Variables as var
 
-# Provides basic utilities that can be used by any class (Colorized printing, parameter retrieval, etc)
+from libs.Output import Output
+
+# Provides basic utilities that can be used by any class (Parameter retrieval, header, usage, etc)
 class Tools(object):
     _force = 0
-    _outputFile = ""
+    _watch = 0
+    _outputFiles = []
+    _dryRun = 0
+    _root = ""
+    _image = ""
+    _batch = ""
+    _verify = 0
+    _digestsFile = ""
+    _timings = 0
+    _profileFile = ""
+    _full = 0
+    _reportFormat = ""
+    _metricsFile = ""
 
     _options = (
         ("-o", "--output"),
         ("-f", "--force"),
+        ("-n", "--dry-run"),
+        ("-w", "--watch"),
+        ("-r", "--root"),
+        ("-i", "--image"),
+        ("--verify",),
+        ("--digests",),
+        ("--timings",),
+        ("--profile",),
+        ("--full",),
+        ("--report",),
+        ("--metrics-file",),
+        ("-q", "--quiet"),
+        ("-v", "--verbose"),
         ("-h", "--help"),
     )
 
@@ -42,139 +65,288 @@ class Tools(object):
 
         return -1
 
-    # Checks parameters and running user
+    # Checks to see that we are running as root. This is only done once we know
+    # that we are going to do some work (not for --help or bad arguments). Working
+    # on an image tree or a disk image doesn't touch the running system, so anyone can.
     @classmethod
-    def ProcessArguments(cls):
-        user = check_output(["whoami"], universal_newlines=True).strip()
+    def CheckRoot(cls):
+        if cls._root or cls._image:
+            return
 
-        if user != "root":
-            cls.Fail("This program must be ran as root")
+        if os.geteuid() != 0:
+            Output.Fail("This program must be ran as root")
 
+    # Checks parameters
+    @classmethod
+    def ProcessArguments(cls):
         arguments = sys.argv[1:]
 
+        # bliss-boot batch <manifest> [OPTION]
+        if arguments and arguments[0] == "batch":
+            if len(arguments) < 2 or cls.IsFlag(arguments[1]) == 0:
+                Output.Fail("You need to pass the path to the batch manifest!")
+
+            cls._batch = arguments[1]
+            arguments = arguments[2:]
+
+        # Known before any other argument is checked, so that a bad one still ends up in the metrics
+        if "--metrics-file" in arguments[:-1]:
+            metricsFile = arguments[arguments.index("--metrics-file") + 1]
+
+            if cls.IsFlag(metricsFile) != 0:
+                cls._metricsFile = metricsFile
+
         if len(arguments) >= 1:
             for i in range(len(arguments)):
-                # Sets the output file to write the config to
+                # Sets the output file to write the config to (more than once for mirrors)
                 if arguments[i] == "-o" or arguments[i] == "--output":
                     try:
                         if cls.IsFlag(arguments[i+1]) != 0:
-                            cls._outputFile = arguments[i+1]
+                            cls._outputFiles.append(arguments[i+1])
                     except IndexError:
-                        cls.Fail("You need to pass a path to output the file!")
+                        Output.Fail("You need to pass a path to output the file!")
+
+                # Print the configuration to stdout instead of writing anything
+                elif arguments[i] == "-n" or arguments[i] == "--dry-run":
+                    cls._dryRun = 1
 
                 # Set 'force' in order to overwrite output file target
                 elif arguments[i] == "-f" or arguments[i] == "--force":
                     cls._force = 1
 
-                # Displays the help/usage message
-                elif arguments[i] == "-h" or arguments[i] == "--help":
-                    cls.PrintUsage()
+                # Use the configuration, fstab and kernels of the system in this directory
+                elif arguments[i] == "-r" or arguments[i] == "--root":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._root = arguments[i+1]
+                    except IndexError:
+                        Output.Fail("You need to pass the path to the root directory!")
 
-    # Processes a UUID/PARTUUID= field in order to find out where the real drive is,
-    # instead of the traditional /dev/sda, /dev/md0 references
-    @classmethod
-    def MapIdentifierToDrive(cls, vIdValue):
-        splitResults = vIdValue.split("=")
+                # Read the /boot partition and the drive layout from this raw disk image
+                elif arguments[i] == "-i" or arguments[i] == "--image":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._image = arguments[i+1]
+                    except IndexError:
+                        Output.Fail("You need to pass the path to the disk image!")
+
+                # Hash every kernel and initrd that will be added before writing anything
+                elif arguments[i] == "--verify":
+                    cls._verify = 1
 
-        targetDrive = ""
+                # Write the digests of the kernels and initrds to this file (implies --verify)
+                elif arguments[i] == "--digests":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._digestsFile = arguments[i+1]
+                            cls._verify = 1
+                    except IndexError:
+                        Output.Fail("You need to pass a path to write the digests to!")
 
-        for i in range(len(splitResults)):
-            if splitResults[i] == "UUID":
-                targetDrive = cls.GetDriveFromIdentifier("UUID", splitResults[i+1])
-                break
-            elif splitResults[i] == "PARTUUID":
-                targetDrive = cls.GetDriveFromIdentifier("PARTUUID", splitResults[i+1])
-                break
+                # Print how long each phase took
+                elif arguments[i] == "--timings":
+                    cls._timings = 1
 
-        # If we aren't using anything fancy like UUID=, then the
-        # boot drive field and the split results will be the same
-        if vIdValue == ''.join(splitResults):
-            targetDrive = vIdValue
+                # Write cProfile output for the whole run to this file
+                elif arguments[i] == "--profile":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._profileFile = arguments[i+1]
+                    except IndexError:
+                        Output.Fail("You need to pass a path to write the profile to!")
 
-        return targetDrive
+                # Don't stop early when nothing changed since the last run
+                elif arguments[i] == "--full":
+                    cls._full = 1
 
-    # Returns the drive matching this identifier
-    @classmethod
-    def GetDriveFromIdentifier(cls, vId, vValue):
-        cmd = 'blkid -o full -s ' + vId + ' | grep ' + vValue + ' | cut -d ":" -f 1'
-        results = check_output(cmd, shell=True, universal_newlines=True).strip()
+                # Print a machine readable report of the run to stdout
+                elif arguments[i] == "--report":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._reportFormat = arguments[i+1]
+                    except IndexError:
+                        Output.Fail("You need to pass the format of the report (json)!")
+
+                    if not cls._reportFormat:
+                        Output.Fail("You need to pass the format of the report (json)!")
+                    elif cls._reportFormat != "json":
+                        Output.Fail("Unsupported report format: " + cls._reportFormat + " (only json is supported)")
+
+                # Write node_exporter textfile metrics to this file
+                elif arguments[i] == "--metrics-file":
+                    try:
+                        if cls.IsFlag(arguments[i+1]) != 0:
+                            cls._metricsFile = arguments[i+1]
+                    except IndexError:
+                        Output.Fail("You need to pass a path to write the metrics to!")
+
+                # Keep running and regenerate the configuration when something changes
+                elif arguments[i] == "-w" or arguments[i] == "--watch":
+                    cls._watch = 1
+
+                # Only print errors
+                elif arguments[i] == "-q" or arguments[i] == "--quiet":
+                    Output.SetLevel(Output.QUIET)
+
+                # Print additional debugging information
+                elif arguments[i] == "-v" or arguments[i] == "--verbose":
+                    Output.SetLevel(Output.VERBOSE)
+
+                # Displays the help/usage message
+                elif arguments[i] == "-h" or arguments[i] == "--help":
+                    cls.PrintUsage()
+
+        # stdout only carries the configuration (or the report), everything else goes to stderr
+        if cls.IsStreamSet() and cls._reportFormat:
+            Output.Fail("The report and the configuration can't both be printed to stdout!")
+
+        # A batch has its own report (the manifest's 'report')
+        if cls._batch and (cls._reportFormat or cls._metricsFile):
+            Output.Fail("--report and --metrics-file can't be used with a batch, set 'report' in the manifest instead!")
 
-        if results:
-            return results
-        else:
-            Tools.Fail("No drives were found with the " + vValue + " value.")
+        if cls.IsStreamSet() or cls._reportFormat:
+            Output.SetStream(sys.stderr)
 
     # Prints the header of the application
     @classmethod
     def PrintHeader(cls):
-        cls.Print(cls.Colorize("yellow", "----------------------------------"))
-        cls.Print(cls.Colorize("yellow", var.name + " - v" + var.version))
-        cls.Print(cls.Colorize("yellow", var.contact))
-        cls.Print(cls.Colorize("yellow", "Licensed under the " + var.license))
-        cls.Print(cls.Colorize("yellow", "----------------------------------") + "\n")
+        Output.Write(Output.NORMAL, "yellow", "----------------------------------")
+        Output.Write(Output.NORMAL, "yellow", var.name + " - v" + var.version)
+        Output.Write(Output.NORMAL, "yellow", var.contact)
+        Output.Write(Output.NORMAL, "yellow", "Licensed under the " + var.license)
+        Output.Write(Output.NORMAL, "yellow", "----------------------------------\n")
 
     # Prints the usage information
     @classmethod
     def PrintUsage(cls):
-        print("Usage: bliss-boot [OPTION]\n")
-        print("-o, --output\t\t\tGenerates the configuration file at this location.\n")
+        print("Usage: bliss-boot [OPTION]")
+        print("       bliss-boot batch <manifest.json> [OPTION]\n")
+        print("-o, --output\t\t\tGenerates the configuration file at this location. '-' prints it to stdout.\n\t\t\t\tPass it more than once to write the same configuration to mirrors.\n")
+        print("-n, --dry-run\t\t\tPrints the configuration to stdout instead of writing anything (same as -o -).\n")
         print("-f, --force\t\t\tOverwrites the file at the target output path.\n")
+        print("-w, --watch\t\t\tKeeps running and regenerates the configuration when the kernels or the configuration change.\n")
+        print("-r, --root\t\t\tUses the configuration, fstab and kernels of the system in this directory (an image tree).\n")
+        print("-i, --image\t\t\tReads the /boot partition and the drive layout from this raw disk image instead of the devices.\n")
+        print("--verify\t\t\tChecks that every kernel and initrd that is added can be read and computes its SHA-256.\n")
+        print("--digests\t\t\tWrites the SHA-256 of the kernels and initrds to this file (for grub's hashsum). Implies --verify.\n")
+        print("--timings\t\t\tPrints how long each phase took, and the forks, bytes written and fsyncs.\n")
+        print("--profile\t\t\tWrites cProfile output for the whole run to this file.\n")
+        print("--full\t\t\t\tDoes all the work even if nothing changed since the last run (which normally exits with 3).\n")
+        print("--report json\t\t\tPrints a report of the run to stdout: the boot drive, the kernels that were added or\n\t\t\t\tskipped (and why), the default entry, the outputs, the bytes written and the phases.\n")
+        print("--metrics-file\t\t\tWrites node_exporter textfile metrics about the run to this file (also when it fails).\n")
+        print("-q, --quiet\t\t\tOnly prints errors.\n")
+        print("-v, --verbose\t\t\tPrints additional information about what is being done.\n")
+        print("batch <manifest.json>\t\tGenerates the configurations for all the jobs in this manifest in parallel.\n")
         print("-h, --help\t\t\tPrints this help message and then exits.\n")
         quit()
 
-    # Cleanly exit the application
+    # Returns a positive number if an output option was set
     @classmethod
-    def Fail(cls, vMessage):
-        call(["echo", "-e", cls.Colorize("red", vMessage)])
-        quit(1)
+    def IsOutputSet(cls):
+        if cls._outputFiles:
+            return 1
 
-     # Returns the string with a color to be used in bash
+        return 0
+
+    # Gets the desired output path ("-" = stdout). The first one if -o was passed more than once.
     @classmethod
-    def Colorize(cls, vColor, vMessage):
-        if vColor == "red":
-            colored_message = "\e[1;31m" + vMessage + "\e[0;m"
-        elif vColor == "yellow":
-            colored_message = "\e[1;33m" + vMessage + "\e[0;m"
-        elif vColor == "green":
-            colored_message = "\e[1;32m" + vMessage + "\e[0;m"
-        elif vColor == "cyan":
-            colored_message = "\e[1;36m" + vMessage + "\e[0;m"
-        elif vColor == "purple":
-            colored_message = "\e[1;34m" + vMessage + "\e[0;m"
-        elif vColor == "none":
-            colored_message = vMessage
+    def GetOutputFile(cls):
+        outputFiles = cls.GetOutputFiles()
 
-        return colored_message
+        if outputFiles:
+            return outputFiles[0]
 
-    # Prints a message
-    @classmethod
-    def Print(cls, vMessage):
-        call(["echo", "-e", cls.Colorize("cyan", vMessage)])
+        return ""
 
-    # Used for successful entries
+    # Gets all the output paths that were passed
     @classmethod
-    def Success(cls, vMessage):
-        call(["echo", "-e", cls.Colorize("green", vMessage)])
+    def GetOutputFiles(cls):
+        if cls._dryRun:
+            return ["-"]
 
-    # Used for warnings
-    @classmethod
-    def Warn(cls, vMessage):
-        call(["echo", "-e", cls.Colorize("yellow", vMessage)])
+        return list(cls._outputFiles)
 
-    # Returns a positive number if an output option was set
+    # Returns a positive number if the configuration goes to stdout
     @classmethod
-    def IsOutputSet(cls):
-        if cls._outputFile:
+    def IsStreamSet(cls):
+        if cls._dryRun or "-" in cls._outputFiles:
             return 1
 
         return 0
 
-    # Gets the desired output path
+    # Returns the value of whether or not this is a dry run (nothing is written)
     @classmethod
-    def GetOutputFile(cls):
-        return cls._outputFile
+    def IsDryRunSet(cls):
+        return cls._dryRun
 
     # Returns the value of whether or not we will overwrite the output file if it exists.
     @classmethod
     def IsForceSet(cls):
         return cls._force
+
+    # Gets the root directory of the system we generate the configuration for
+    @classmethod
+    def GetRoot(cls):
+        return cls._root or "/"
+
+    # Returns a positive number if a root directory was set
+    @classmethod
+    def IsRootSet(cls):
+        if cls._root:
+            return 1
+
+        return 0
+
+    # Gets the path to the disk image ("" if none was set)
+    @classmethod
+    def GetImage(cls):
+        return cls._image
+
+    # Gets the path to the batch manifest ("" if we aren't running a batch)
+    @classmethod
+    def GetBatchManifest(cls):
+        return cls._batch
+
+    # Returns the value of whether or not the kernels and initrds should be verified
+    @classmethod
+    def IsVerifySet(cls):
+        return cls._verify
+
+    # Gets the path to write the digests to ("" if they aren't written). A dry
+    # run still verifies the files but doesn't write the digests.
+    @classmethod
+    def GetDigestsFile(cls):
+        if cls._dryRun:
+            return ""
+
+        return cls._digestsFile
+
+    # Returns the value of whether or not the timings should be printed
+    @classmethod
+    def IsTimingsSet(cls):
+        return cls._timings
+
+    # Gets the path to write the profile to ("" if the run isn't profiled)
+    @classmethod
+    def GetProfileFile(cls):
+        return cls._profileFile
+
+    # Returns the value of whether or not we should keep watching for changes.
+    @classmethod
+    def IsWatchSet(cls):
+        return cls._watch
+
+    # Returns the value of whether or not every run should do all the work
+    @classmethod
+    def IsFullSet(cls):
+        return cls._full
+
+    # Gets the format of the report to print ("" if none was asked for)
+    @classmethod
+    def GetReportFormat(cls):
+        return cls._reportFormat
+
+    # Gets the path to write the metrics to ("" if they aren't written)
+    @classmethod
+    def GetMetricsFile(cls):
+        return cls._metricsFile
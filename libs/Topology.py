@@ -0,0 +1,310 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+from libs.Output import Output
+from libs.Timings import Timings
+
+# A disk or partition found in sysfs
+class BlockDevice(object):
+    __slots__ = ("name", "disk", "partition", "index", "devNumber", "layout")
+
+    def __init__(self, vName, vDisk, vPartition=0, vDevNumber=""):
+        self.name = vName
+
+        # The disk this partition is on (the device itself for a disk)
+        self.disk = vDisk
+
+        # Partition number (0 for a whole disk)
+        self.partition = vPartition
+
+        # Position of the disk among all the disks (hdN), -1 for virtual
+        # devices (md, dm, loop) that grub doesn't see as a drive
+        self.index = -1
+
+        # major:minor of the disk, used to find its udev data
+        self.devNumber = vDevNumber
+
+        # "gpt", "msdos" or "none". Only read when it is needed.
+        self.layout = None
+
+    def __repr__(self):
+        return "BlockDevice(" + self.name + ", " + self.disk + ", " + str(self.partition) + ", hd" + str(self.index) + ")"
+
+# Maps the block devices of the running system to their disk, partition number,
+# disk order and partition table type. /sys/class/block is walked once, after
+# that every lookup is a dictionary access. The partition table type comes from
+# the disk's udev data, or from its first sectors if udev doesn't know it.
+class Topology(object):
+    # Device names and how their disk and partition are written:
+    # kind -> regex with the disk in group 1 and the partition in the last group
+    _names = (
+        ("sd", re.compile(r"^(sd([a-z]+))(\d*)$")),
+        ("vd", re.compile(r"^(vd([a-z]+))(\d*)$")),
+        ("xvd", re.compile(r"^(xvd([a-z]+))(\d*)$")),
+        ("hd", re.compile(r"^(hd([a-z]+))(\d*)$")),
+        ("nvme", re.compile(r"^(nvme(\d+)n(\d+))(?:p(\d+))?$")),
+        ("mmcblk", re.compile(r"^(mmcblk(\d+))(?:p(\d+))?$")),
+    )
+
+    # ID_PART_TABLE_TYPE -> layout
+    _layouts = {
+        "gpt": "gpt",
+        "dos": "msdos",
+    }
+
+    # vSysBlockPath: "" when the devices of this system don't matter (an image tree),
+    # so that only the device names are used
+    def __init__(self, vSysBlockPath="/sys/class/block", vUdevDataPath="/run/udev/data", vDevPath="/dev"):
+        self._sysBlockPath = vSysBlockPath
+        self._udevDataPath = vUdevDataPath
+        self._devPath = vDevPath
+
+        # Name -> BlockDevice
+        self._devices = None
+
+        # The kinds of fixed disks that were found (sd, nvme, etc)
+        self._diskKinds = set()
+
+    # Parses a device name (sdab12, nvme0n1p2, mmcblk0p1). Returns (kind, disk name,
+    # disk order key, partition number), or None for names we don't know.
+    @classmethod
+    def ParseName(cls, vName):
+        for kind, pattern in cls._names:
+            match = pattern.match(vName)
+
+            if not match:
+                continue
+
+            groups = match.groups()
+            partition = int(groups[-1]) if groups[-1] else 0
+
+            if kind == "nvme":
+                key = (int(groups[1]), int(groups[2]))
+            elif kind == "mmcblk":
+                key = (int(groups[1]),)
+            else:
+                key = (cls.GetLetterIndex(groups[1]),)
+
+            return kind, groups[0], key, partition
+
+        return None
+
+    # Converts the letters of a drive to its position: a = 0, z = 25, aa = 26, ab = 27
+    @classmethod
+    def GetLetterIndex(cls, vLetters):
+        index = 0
+
+        for letter in vLetters:
+            index = index * 26 + ord(letter) - ord("a") + 1
+
+        return index - 1
+
+    # Reads a small sysfs attribute ("" if it isn't there)
+    @classmethod
+    def ReadAttribute(cls, vPath):
+        try:
+            with open(vPath, "r") as attribute:
+                return attribute.read().strip()
+        except OSError:
+            return ""
+
+    # Walks /sys/class/block and builds the map
+    @Timings.Timed("ScanTopology")
+    def Scan(self):
+        self._devices = {}
+        self._diskKinds = set()
+
+        if not self._sysBlockPath:
+            return
+
+        try:
+            entries = list(os.scandir(self._sysBlockPath))
+        except OSError:
+            Output.Debug("Unable to read " + self._sysBlockPath)
+            return
+
+        # [(order key, name)] of the real disks
+        disks = []
+        kinds = [kind for kind, pattern in self._names]
+
+        for entry in entries:
+            path = os.path.realpath(entry.path)
+            partition = self.ReadAttribute(os.path.join(path, "partition"))
+
+            if partition.isdigit():
+                # A partition's directory is inside of its disk's directory
+                device = BlockDevice(entry.name, os.path.basename(os.path.dirname(path)), int(partition))
+            else:
+                device = BlockDevice(entry.name, entry.name, 0, self.ReadAttribute(os.path.join(path, "dev")))
+
+                parsed = self.ParseName(entry.name)
+
+                # Only the kinds of disks in _names can be boot disks, optical drives
+                # (sr0), floppies (fd0) and virtual devices don't get an hdN
+                if parsed and "/devices/virtual/" not in path:
+                    isRemovable = self.ReadAttribute(os.path.join(path, "removable")) == "1"
+
+                    # Ordered by fixed before removable (USB sticks), kind (in the
+                    # order of _names) and then by the disk's number. Removable disks
+                    # come and go, so they don't make the order of the others a guess.
+                    disks.append(((isRemovable, kinds.index(parsed[0]), parsed[2]), entry.name))
+
+                    if not isRemovable:
+                        self._diskKinds.add(parsed[0])
+
+            self._devices[entry.name] = device
+
+        # All the disks are numbered in one sequence, so that two disks never get
+        # the same hdN
+        ordered = sorted(disks)
+
+        for i in range(len(ordered)):
+            self._devices[ordered[i][1]].index = i
+
+        for device in self._devices.values():
+            if device.partition:
+                disk = self._devices.get(device.disk)
+
+                if disk:
+                    device.index = disk.index
+                    device.devNumber = disk.devNumber
+
+    # Returns the BlockDevice for this device (/dev/sda1, sda1 or a symlink to it),
+    # or None. Devices that aren't in sysfs are still known by their name.
+    def Get(self, vDevice):
+        if self._devices is None:
+            self.Scan()
+
+        name = vDevice
+
+        if name.startswith("/dev/"):
+            if os.path.islink(name):
+                name = os.path.realpath(name)
+
+            name = name[len("/dev/"):]
+
+        device = self._devices.get(name)
+
+        if device:
+            return device
+
+        parsed = self.ParseName(name)
+
+        if not parsed:
+            return None
+
+        kind, disk, key, partition = parsed
+
+        device = BlockDevice(name, disk, partition)
+        device.index = key[0]
+        device.layout = "none"
+
+        self._devices[name] = device
+
+        return device
+
+    # Returns a positive number if there are different kinds of fixed disks (sda and
+    # nvme0n1). The firmware decides the order of those, so hdN is only a guess.
+    def IsAmbiguous(self):
+        if self._devices is None:
+            self.Scan()
+
+        return 1 if len(self._diskKinds) > 1 else 0
+
+    # Returns the partition table type of the disk this device is on ("none" if unknown)
+    def GetLayout(self, vDevice):
+        device = self.Get(vDevice)
+
+        if not device:
+            return "none"
+
+        if device.layout is None:
+            disk = self._devices.get(device.disk, device)
+
+            if disk.layout is None:
+                disk.layout = self.ReadUdevLayout(disk) or self.ReadHeaderLayout(disk)
+
+            device.layout = disk.layout
+
+        return device.layout
+
+    # Reads the partition table type that udev found for this disk ("" if unknown)
+    def ReadUdevLayout(self, vDisk):
+        if not vDisk.devNumber:
+            return ""
+
+        try:
+            with open(os.path.join(self._udevDataPath, "b" + vDisk.devNumber), "r") as data:
+                for line in data:
+                    if line.startswith("E:ID_PART_TABLE_TYPE="):
+                        return self._layouts.get(line.strip().split("=", 1)[1], "none")
+        except OSError:
+            return ""
+
+        return ""
+
+    # Reads the partition table type from the first sectors of the disk
+    def ReadHeaderLayout(self, vDisk):
+        try:
+            with open(os.path.join(self._devPath, vDisk.name), "rb") as disk:
+                header = disk.read(4096 + 8)
+        except OSError:
+            Output.Debug("Unable to read the partition table of " + vDisk.name)
+            return "none"
+
+        if len(header) < 512 or header[510:512] != b"\x55\xaa":
+            return "none"
+
+        # A protective MBR with a GPT behind it (512 or 4096 byte sectors)
+        if header[512:520] == b"EFI PART" or header[4096:4104] == b"EFI PART":
+            return "gpt"
+
+        # A FAT filesystem on the whole disk also ends its first sector with 55AA
+        if header[54:57] == b"FAT" or header[82:87] == b"FAT32":
+            return "none"
+
+        return "msdos"
+
+    # Returns the grub name of this device ((hd0,gpt2), (hd1)), or "" for the
+    # devices that aren't a drive for grub (md, dm, loop)
+    def GetGrubName(self, vDevice):
+        device = self.Get(vDevice)
+
+        if not device or device.index < 0:
+            return ""
+
+        if not device.partition:
+            return "(hd" + str(device.index) + ")"
+
+        layout = self.GetLayout(vDevice)
+
+        if layout == "none":
+            layout = ""
+
+        return "(hd" + str(device.index) + "," + layout + str(device.partition) + ")"
+
+    # Returns the name that GRUB's own disk drivers use for this device (ahci0,gpt2),
+    # or "". Only SATA disks (sd) can be named, the rest is left to the BIOS/EFI names.
+    def GetBaremetalName(self, vDevice):
+        grubName = self.GetGrubName(vDevice)
+        device = self.Get(vDevice)
+        parsed = self.ParseName(device.disk) if device else None
+
+        if not grubName or not parsed or parsed[0] != "sd":
+            return ""
+
+        return "ahci" + grubName[len("(hd"):-1]
@@ -12,9 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import libs.ConfigLoader as ConfigLoader
-
-config = ConfigLoader.GetConfigModule()
+import os
 
 # Program Information
 name = "Bliss Boot"
@@ -23,3 +21,7 @@ email = "jon@xyinn.org"
 contact = author + " <" + email + ">"
 version = "2.1.5"
 license = "Apache License 2.0"
+
+# Where things that only make the next run faster are kept (validated
+# configurations, artifact hashes). It can be deleted at any time.
+cacheDirectory = os.environ.get("BLISS_BOOT_CACHE", "/var/cache/bliss-boot")
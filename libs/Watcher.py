@@ -0,0 +1,214 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+from libs.Output import Output
+from libs.Errors import BlissBootError
+
+import libs.ConfigLoader as ConfigLoader
+
+# Watches the 'kernelDirectory' and the configuration file with inotify and calls
+# the generate function once a burst of changes settles down. Only the kernel
+# directories that changed are rescanned, everything else (fstab, devices, layout)
+# is kept from the first run.
+class Watcher(object):
+    # inotify(7) constants
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    _mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    # struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+    _eventHeader = struct.Struct("iIII")
+
+    # How long (in seconds) things need to be quiet before we regenerate. A kernel
+    # install usually drops the vmlinuz, initrd and System.map one after another.
+    _debounce = 0.5
+
+    def __init__(self, vGenerator):
+        self.generator = vGenerator
+        self.scanner = vGenerator.scanner
+
+        self._libc = None
+        self._fd = -1
+
+        # Watch descriptor -> kernel version ("" for the 'kernelDirectory' itself)
+        self._kernelWatches = {}
+
+        # Watch descriptor of the directory holding the configuration file
+        self._configWatch = -1
+
+    # Loads libc and creates the inotify instance
+    def Initialize(self):
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            raise BlissBootError("inotify isn't available on this system. The --watch option can't be used.")
+
+        if self._fd < 0:
+            raise BlissBootError("Unable to initialize inotify: " + os.strerror(ctypes.get_errno()))
+
+    # Adds a watch for this path and returns its watch descriptor (-1 on failure)
+    def AddWatch(self, vPath):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(vPath), self._mask)
+
+        if wd < 0:
+            Output.Debug("Unable to watch " + vPath + ": " + os.strerror(ctypes.get_errno()))
+
+        return wd
+
+    # Watches the 'kernelDirectory' and every kernel directory inside of it
+    def WatchKernelDirectory(self):
+        for wd in list(self._kernelWatches):
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+        self._kernelWatches = {}
+
+        wd = self.AddWatch(self.scanner.kernelDirectory)
+
+        if wd >= 0:
+            self._kernelWatches[wd] = ""
+
+        for version in self.scanner.GetBootKernels():
+            self.WatchKernel(version)
+
+    # Watches a single kernel directory
+    def WatchKernel(self, vVersion):
+        wd = self.AddWatch(os.path.join(self.scanner.kernelDirectory, vVersion))
+
+        if wd >= 0:
+            self._kernelWatches[wd] = vVersion
+
+    # Reads the pending events. Returns the kernel versions that changed, whether the
+    # configuration changed and whether everything needs to be rescanned.
+    def ReadEvents(self, vChanges):
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError as error:
+            if error.errno in (errno.EINTR, errno.EAGAIN):
+                return
+
+            raise
+
+        configName = os.path.basename(ConfigLoader.GetConfigFilePath())
+        offset = 0
+
+        while offset + self._eventHeader.size <= len(data):
+            wd, mask, cookie, length = self._eventHeader.unpack_from(data, offset)
+            offset = offset + self._eventHeader.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset = offset + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                vChanges["everything"] = 1
+            elif wd == self._configWatch:
+                if name == configName:
+                    vChanges["config"] = 1
+            elif wd in self._kernelWatches:
+                version = self._kernelWatches[wd]
+
+                if mask & self.IN_IGNORED:
+                    del self._kernelWatches[wd]
+                elif version == "":
+                    if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                        vChanges["everything"] = 1
+                    elif name:
+                        vChanges["kernels"].add(name)
+
+                        # A new kernel directory, start watching it right away so
+                        # that we also see the files being copied into it
+                        if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                            self.WatchKernel(name)
+                else:
+                    vChanges["kernels"].add(version)
+
+    # Waits for a change and then for things to be quiet for the debounce period
+    def WaitForChanges(self):
+        changes = {"kernels": set(), "config": 0, "everything": 0}
+
+        select.select([self._fd], [], [])
+        self.ReadEvents(changes)
+
+        while True:
+            ready = select.select([self._fd], [], [], self._debounce)[0]
+
+            if not ready:
+                return changes
+
+            self.ReadEvents(changes)
+
+    # Applies the changes to the scanner state
+    def Rescan(self, vChanges):
+        kernelDirectory = self.scanner.kernelDirectory
+
+        if vChanges["config"]:
+            Output.Print("Reloading " + ConfigLoader.GetConfigFilePath() + " ...")
+            self.scanner.SetConfig(ConfigLoader.ReloadConfig())
+            self.scanner.FindKernelsInConfig()
+
+            if self.scanner.kernelDirectory != kernelDirectory:
+                vChanges["everything"] = 1
+            else:
+                self.scanner.RescanArtifacts()
+
+        if vChanges["everything"]:
+            self.scanner.FindBootKernels()
+            self.WatchKernelDirectory()
+        else:
+            for version in sorted(vChanges["kernels"]):
+                Output.Debug("Rescanning " + os.path.join(self.scanner.kernelDirectory, version) + " ...")
+                self.scanner.RescanBootKernel(version)
+
+    # Watches for changes forever and calls vGenerate after each burst of changes
+    def Watch(self, vGenerate):
+        self.Initialize()
+        self.WatchKernelDirectory()
+
+        configDirectory = os.path.dirname(os.path.abspath(ConfigLoader.GetConfigFilePath()))
+
+        # Editors usually replace the file instead of writing to it, so we watch its directory
+        self._configWatch = self.AddWatch(configDirectory)
+
+        Output.Print("Watching " + self.scanner.kernelDirectory + " and " + ConfigLoader.GetConfigFilePath() + " for changes ...")
+        Output.Flush()
+
+        while True:
+            changes = self.WaitForChanges()
+
+            # A failure shouldn't stop the watcher, the next change might fix it
+            try:
+                self.Rescan(changes)
+                vGenerate()
+            except Exception as error:
+                Output.Warn("Unable to regenerate the configuration: " + str(error))
+
+            Output.Flush()
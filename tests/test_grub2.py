@@ -0,0 +1,80 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.Config import Config
+from libs.Grub2Renderer import Grub2Renderer
+from libs.KernelEntry import KernelEntry
+from libs.Output import Output
+
+# Only what the renderer asks the scanner for
+class FakeScanner(object):
+    def __init__(self, vConfig):
+        self.config = vConfig
+
+    def GetGrub2BootDrive(self):
+        return "(hd0,gpt2)"
+
+    def GetDriveLayout(self):
+        return "gpt"
+
+class CompactTest(unittest.TestCase):
+    def setUp(self):
+        Output.SetLevel(Output.QUIET)
+
+    def Render(self, vValues, vKernels):
+        values = {"kernelDirectory": "/boot/kernels", "bootloader": "grub2", "grub2Compact": 1}
+        values.update(vValues)
+
+        config = Config.Validate(values, "config.py", "py", lambda *arguments: 0)
+
+        for i in range(len(vKernels)):
+            vKernels[i].position = i
+
+        return Grub2Renderer(FakeScanner(config), "/kernels").Render(vKernels, 0)
+
+    # An entry that can't use bb_load still loads the modules that the header doesn't
+    def test_unsafe_options_load_modules(self):
+        kernels = [
+            KernelEntry("Gentoo", "6.1.1", 1, "vmlinuz", "initrd", "root=/dev/sda1 quiet"),
+            KernelEntry("Gentoo", "6.1.0", 0, "vmlinuz", "initrd", "root=/dev/sda1 init=$init"),
+        ]
+
+        text = self.Render({"efi": 1, "goodyBag": ["lvm"]}, kernels)
+        header, entries = text.split("function bb_load", 1)
+        unsafe = entries[entries.index("menuentry \"Gentoo - 6.1.0\""):]
+
+        self.assertNotIn("insmod efi_gop", header)
+        self.assertIn("bb_load", entries)
+
+        for module in ("efi_gop", "efi_uga", "fat", "lvm"):
+            self.assertIn("\tinsmod " + module + "\n", unsafe)
+
+        self.assertIn("\tlinux /kernels/6.1.0/vmlinuz root=/dev/sda1 init=$init\n", unsafe)
+
+    def test_unsafe_options_load_zfs(self):
+        kernels = [KernelEntry("Gentoo", "6.1.0", 1, "vmlinuz", "initrd", "root=ZFS=tank/root init=\"/sbin/init\"")]
+
+        text = self.Render({"wholeDiskZfs": 1, "wholeDiskZfsBootPool": "tank/boot"}, kernels)
+        unsafe = text[text.index("menuentry \"Gentoo - 6.1.0\""):]
+
+        self.assertIn("\tinsmod zfs\n", unsafe)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sourceDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, sourceDirectory)
+
+from libs.Report import Report
+
+# The node_exporter metrics have to be there for every run, also the ones that fail
+class ReportTest(unittest.TestCase):
+    def test_argument_error_writes_metrics(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bliss-boot.prom")
+
+            status = subprocess.call([sys.executable, os.path.join(sourceDirectory, "bliss-boot"), "--metrics-file", path, "--output"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            metrics = Report.ReadMetrics(path)
+
+        self.assertEqual(status, 1)
+        self.assertEqual(metrics["bliss_boot_success"], 0)
+        self.assertEqual(metrics["bliss_boot_exit_code"], 1)
+
+    def test_failure_keeps_last_success(self):
+        report = Report()
+        report.SetFailed("broken")
+
+        metrics = report.GetMetrics({"bliss_boot_last_success_timestamp": 1234.5})
+
+        self.assertIn("\nbliss_boot_last_success_timestamp 1234.5\n", metrics)
+        self.assertIn("\nbliss_boot_success 0\n", metrics)
+
+    def test_gauges_have_no_counter_suffix(self):
+        for line in Report().GetMetrics().splitlines():
+            if line.startswith("# TYPE "):
+                self.assertFalse(line.split()[2].endswith("_total"), line)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+sourceDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs bliss-boot in a fresh interpreter with the functions that start processes
+# counted. Prints how many processes were started, which of the modules that
+# start processes (or probe the system) were imported and how long it took.
+_child = r"""
+import json
+import os
+import runpy
+import sys
+import time
+
+forks = [0]
+
+def Counting(vFunction):
+    def Run(*args, **kwargs):
+        forks[0] = forks[0] + 1
+        return vFunction(*args, **kwargs)
+
+    return Run
+
+for name in ("fork", "forkpty", "posix_spawn", "posix_spawnp", "system", "popen"):
+    if hasattr(os, name):
+        setattr(os, name, Counting(getattr(os, name)))
+
+sys.argv = sys.argv[1:]
+stdout = sys.stdout
+stderr = sys.stderr
+sys.stdout = sys.stderr = open(os.devnull, "w")
+start = time.perf_counter()
+
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+except SystemExit:
+    pass
+finally:
+    seconds = time.perf_counter() - start
+    sys.stdout.close()
+    sys.stdout = stdout
+    sys.stderr = stderr
+
+print(json.dumps({
+    "forks": forks[0],
+    "seconds": seconds,
+    "imported": sorted(name for name in ("subprocess", "ctypes", "libs.Scanner", "libs.Generator", "libs.ConfigLoader") if name in sys.modules),
+}))
+"""
+
+# --help and argument errors have to return right away: no processes, none of
+# the modules that probe the system, and within the startup budget.
+class StartupTest(unittest.TestCase):
+    # How long bliss-boot itself may take (the interpreter's own startup isn't included)
+    budgetSeconds = 0.05
+
+    # Runs bliss-boot with these arguments and returns what the child measured.
+    # The fastest of a few runs is used so that a busy machine doesn't fail the test.
+    def Run(self, vArguments):
+        results = []
+
+        for i in range(3):
+            output = subprocess.check_output([sys.executable, "-c", _child, os.path.join(sourceDirectory, "bliss-boot")] + vArguments,
+                universal_newlines=True, cwd=sourceDirectory)
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        return min(results, key=lambda result: result["seconds"])
+
+    def CheckBudget(self, vArguments):
+        result = self.Run(vArguments)
+
+        self.assertEqual(result["forks"], 0)
+        self.assertEqual(result["imported"], [])
+        self.assertLess(result["seconds"], self.budgetSeconds)
+
+    def test_help(self):
+        self.CheckBudget(["--help"])
+
+    def test_argument_error(self):
+        self.CheckBudget(["--output"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.Config import Config
+from libs.Devices import Devices
+from libs.Fstab import Fstab
+from libs.Scanner import Scanner
+from libs.Topology import Topology
+
+# Builds a fake /sys/class/block and udev database. vDisks: { name: (dev, removable, partitions, virtual) }
+def MakeSysfs(vDirectory, vDisks):
+    blockPath = os.path.join(vDirectory, "class", "block")
+    udevPath = os.path.join(vDirectory, "udev")
+
+    os.makedirs(blockPath)
+    os.makedirs(udevPath)
+
+    for name, (dev, removable, partitions, virtual) in vDisks.items():
+        diskPath = os.path.join(vDirectory, "devices", "virtual" if virtual else "pci0000:00", name)
+        os.makedirs(diskPath)
+
+        with open(os.path.join(diskPath, "dev"), "w") as attribute:
+            attribute.write(dev + "\n")
+
+        with open(os.path.join(diskPath, "removable"), "w") as attribute:
+            attribute.write(str(removable) + "\n")
+
+        with open(os.path.join(udevPath, "b" + dev), "w") as data:
+            data.write("E:ID_PART_TABLE_TYPE=gpt\n")
+
+        os.symlink(diskPath, os.path.join(blockPath, name))
+
+        for number in partitions:
+            partitionName = name + ("p" if name[-1].isdigit() else "") + str(number)
+            partitionPath = os.path.join(diskPath, partitionName)
+            os.makedirs(partitionPath)
+
+            with open(os.path.join(partitionPath, "partition"), "w") as attribute:
+                attribute.write(str(number) + "\n")
+
+            os.symlink(partitionPath, os.path.join(blockPath, partitionName))
+
+    return Topology(blockPath, udevPath, os.path.join(vDirectory, "dev"))
+
+class TopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bliss-boot-topology-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # An optical drive isn't a second kind of disk
+    def test_optical_drive_is_not_a_disk(self):
+        topology = MakeSysfs(self.directory, {
+            "sda": ("8:0", 0, [1, 2], 0),
+            "sr0": ("11:0", 1, [], 0),
+        })
+
+        self.assertEqual(topology.IsAmbiguous(), 0)
+        self.assertEqual(topology.GetGrubName("/dev/sda2"), "(hd0,gpt2)")
+        self.assertEqual(topology.GetGrubName("/dev/sr0"), "")
+
+    # Two kinds of fixed disks never share an hdN, but their order is a guess
+    def test_mixed_disks(self):
+        topology = MakeSysfs(self.directory, {
+            "sda": ("8:0", 0, [1], 0),
+            "nvme0n1": ("259:0", 0, [2], 0),
+            "md0": ("9:0", 0, [], 1),
+        })
+
+        self.assertEqual(topology.IsAmbiguous(), 1)
+        self.assertEqual(topology.GetGrubName("sda1"), "(hd0,gpt1)")
+        self.assertEqual(topology.GetGrubName("nvme0n1p2"), "(hd1,gpt2)")
+        self.assertEqual(topology.GetGrubName("md0"), "")
+
+    # A USB stick comes after the fixed disks and doesn't make their order a guess
+    def test_removable_disk_comes_last(self):
+        topology = MakeSysfs(self.directory, {
+            "sda": ("8:0", 1, [1], 0),
+            "nvme0n1": ("259:0", 0, [1], 0),
+        })
+
+        self.assertEqual(topology.IsAmbiguous(), 0)
+        self.assertEqual(topology.GetGrubName("nvme0n1p1"), "(hd0,gpt1)")
+        self.assertEqual(topology.GetGrubName("sda1"), "(hd1,gpt1)")
+
+# The search line of grub2Search and the hints that come from the topology
+class GrubSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="bliss-boot-search-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Returns a scanner whose /boot is UUID=<uuid> on /dev/sda2
+    def MakeScanner(self, vDisks):
+        topology = MakeSysfs(self.directory, vDisks)
+        uuid = "0fdd2723-a62e-47b1-bb5e-a91b92186e3f"
+
+        byUuid = os.path.join(self.directory, "disk", "by-uuid")
+        os.makedirs(byUuid)
+        os.symlink("/dev/sda2", os.path.join(byUuid, uuid))
+
+        fstabPath = os.path.join(self.directory, "fstab")
+
+        with open(fstabPath, "w") as fstab:
+            fstab.write("UUID=" + uuid + " /boot ext4 defaults 0 2\n")
+
+        config = Config.Validate({"kernelDirectory": "/boot/kernels", "bootloader": "grub2", "grub2Search": 1},
+            "config.py", "py", lambda *arguments: 0)
+
+        return Scanner(config, self.directory, Devices(os.path.join(self.directory, "disk")), Fstab(fstabPath, ""),
+            vTopology=topology)
+
+    # A CD-ROM next to the only disk doesn't cost the hints
+    def test_optical_drive_keeps_hints(self):
+        scanner = self.MakeScanner({
+            "sda": ("8:0", 0, [1, 2], 0),
+            "sr0": ("11:0", 1, [], 0),
+        })
+
+        self.assertEqual(scanner.GetGrub2Search(), "search --no-floppy --fs-uuid --set=root --hint-bios=hd0,gpt2 " +
+            "--hint-efi=hd0,gpt2 --hint-baremetal=ahci0,gpt2 0fdd2723-a62e-47b1-bb5e-a91b92186e3f")
+
+    # With more than one kind of disk the guessed hints are left out
+    def test_mixed_disks_drop_hints(self):
+        scanner = self.MakeScanner({
+            "sda": ("8:0", 0, [1, 2], 0),
+            "nvme0n1": ("259:0", 0, [1], 0),
+        })
+
+        self.assertEqual(scanner.GetGrub2Search(), "search --no-floppy --fs-uuid --set=root 0fdd2723-a62e-47b1-bb5e-a91b92186e3f")
+
+if __name__ == "__main__":
+    unittest.main()
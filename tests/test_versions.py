@@ -0,0 +1,45 @@
+# Copyright (C) 2014-2019 Jonathan Vasquez <jon@xyinn.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.KernelRule import KernelRule
+
+# The natural version order that 'keep' and default = "newest" rely on
+class VersionKeyTest(unittest.TestCase):
+    def Sort(self, vVersions):
+        return sorted(vVersions, key=KernelRule.GetVersionKey)
+
+    def test_numbers(self):
+        self.assertEqual(self.Sort(["5.10.1", "5.4.10", "5.4.9"]), ["5.4.9", "5.4.10", "5.10.1"])
+
+    def test_release_candidates(self):
+        self.assertEqual(self.Sort(["6.1.1", "6.1", "6.1-rc7"]), ["6.1-rc7", "6.1", "6.1.1"])
+        self.assertEqual(self.Sort(["6.1", "6.1-rc10", "6.1~rc2", "6.1-rc7"]), ["6.1~rc2", "6.1-rc7", "6.1-rc10", "6.1"])
+
+    def test_local_suffixes_before_next_point_release(self):
+        self.assertEqual(self.Sort(["6.1.1", "6.1-gentoo-r1", "6.1", "6.1-gentoo", "6.1-rc7"]),
+            ["6.1-rc7", "6.1", "6.1-gentoo", "6.1-gentoo-r1", "6.1.1"])
+        self.assertEqual(self.Sort(["6.1.2", "6.1.1-gentoo-r2", "6.1.1-gentoo-r10", "6.1.1-gentoo"]),
+            ["6.1.1-gentoo", "6.1.1-gentoo-r2", "6.1.1-gentoo-r10", "6.1.2"])
+
+    def test_suffixes(self):
+        self.assertEqual(self.Sort(["6.1.0-gentoo-r1", "6.1.0-gentoo", "6.1-rc7-gentoo"]), ["6.1-rc7-gentoo", "6.1.0-gentoo", "6.1.0-gentoo-r1"])
+
+if __name__ == "__main__":
+    unittest.main()